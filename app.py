@@ -1,15 +1,36 @@
 import streamlit as st
 import os
 import json
+import logging
+import threading
+import time
 import uuid
+from concurrent.futures import Future
 import openai
-import requests
-import firebase_admin
 import streamlit.components.v1 as components
-from firebase_admin import credentials, db
 from datetime import datetime, timedelta
-from difflib import SequenceMatcher
 from markdown import markdown
+from indice_correcoes import MAX_EXPANSOES_PREFIXO, IndiceCorrecoes
+from sincronizacao_correcoes import SincronizadorCorrecoes
+from minhash_lsh import assinatura_minhash, codificar_assinatura
+from contadores_uso import ContadoresUso
+from normalizacao import ConsultaNormalizada, campos_normalizados, normalizar_consulta
+from cliente_llm import ErroOpenRouter, configurar_http
+from servico_geracao import ServicoGeracao, chave_requisicao, versao_memoria
+from cache_respostas import CacheRespostas, hash_template
+from contexto_prompt import montar_contexto
+from resumo_conversa import mensagens_resumo, novo_resumo, trecho_para_resumir
+from roteador_modelos import CATALOGO_PADRAO, RoteadorModelos
+from resiliencia import CircuitoAberto
+from mensagens_chat import TAMANHO_BLOCO, atualizacao_chat, carregar_bloco, inicio_bloco, ler_mensagens
+from codec_mensagens import configurar_codec
+from armazenamento import criar_armazenamento
+from feed_interacoes import FEED, POR_USUARIO, atualizacao_interacao, entradas_novas, gerar_push_id, pagina_por_chave
+from indice_feedbacks import ROTULOS, atualizacao_feedback, caminho_contador, codificar_cursor, decodificar_cursor, no_feedbacks, normalizar_tipo
+from indice_emails import caminho_email, liberar_email, normalizar_email, reservar_email
+from fila_persistencia import FilaPersistencia
+from indice_chats import CAMPOS, caminho_indice, entrada_indice, pagina_chats
+from gravacao_correcoes import CATEGORIAS, RAIZ, atualizacao_edicao, atualizacao_exclusao, atualizacao_nova, incluir_categoria
 
 # --- Configurações de Cores ---
 COR_PRIMARIA = "#ec0000"  # Vermelho Santander
@@ -20,6 +41,60 @@ COR_FUNDO = "#292A2D"  # Fundo escuro
 COR_BOTAO = "#ec0000"
 COR_BOTAO_HOVER = "#c50000"
 
+# --- Prompt de sistema (o hash do template entra na chave do cache de respostas) ---
+PROMPT_SISTEMA = """
+    Hoje é {agora}. Você é o SantChat, IA oficial do Santander.
+
+    Responda com clareza e de forma direta.
+    Mantenha o contexto da conversa atual.
+    Não invente informações sobre datas ou produtos.
+    Se o usuário perguntar qual é o nome dele, diga: "Seu nome é {nome_usuario}".
+
+    ⚠️ Importante: Quando quiser mostrar algo em **negrito**, use diretamente `**texto**`, sem colocar entre crases ou aspas.
+    Evite usar o símbolo de crase (`) ao redor de exemplos de Markdown.
+    Exemplo correto: Para negrito, use **assim**.
+    Exemplo errado: Para negrito, use `**assim**`.
+
+    Nunca explique Markdown como código, apenas mostre já formatado.
+    """
+
+# Modelos disponíveis e o nível de qualidade de cada um (1 básico, 2 intermediário,
+# 3 raciocínio); o roteador escolhe entre eles a cada pedido
+MODELOS_CATALOGO = dict(st.secrets.get("MODELOS_CATALOGO", CATALOGO_PADRAO))
+
+# Orçamento de tokens do prompt (estimativa local) e quanto dele vai para a memória
+ORCAMENTO_PROMPT = int(st.secrets.get("PROMPT_ORCAMENTO_TOKENS", 4000))
+FRACAO_MEMORIA_PROMPT = float(st.secrets.get("PROMPT_FRACAO_MEMORIA", 0.5))
+
+# Chats listados por página na barra lateral
+CHATS_POR_PAGINA = int(st.secrets.get("CHATS_POR_PAGINA", 20))
+
+# Interações por página no "Treinar IA"
+INTERACOES_POR_PAGINA = int(st.secrets.get("INTERACOES_POR_PAGINA", 50))
+
+# Tempo máximo (s) esperando uma resposta inteira da IA antes da contingência
+TIMEOUT_GERACAO = float(st.secrets.get("GERACAO_TIMEOUT", 120))
+
+# Sem token da IA por este tempo (s), o chat confere se clicaram em "Parar"
+INTERVALO_PARAR = float(st.secrets.get("INTERVALO_PARAR", 0.1))
+
+# Feedbacks por página na página de feedbacks
+FEEDBACKS_POR_PAGINA = int(st.secrets.get("FEEDBACKS_POR_PAGINA", 10))
+
+# Correções mostradas por página em "Gerenciar Correções"
+CORRECOES_POR_PAGINA = int(st.secrets.get("CORRECOES_POR_PAGINA", 20))
+
+# Filtros de uso da tela "Gerenciar Correções": (uso mínimo, uso máximo)
+FILTROS_USO = {"Todas": (None, None), "Nunca usadas": (None, 0), "Já usadas": (1, None)}
+
+# --- Logs de desempenho (latência da IA, tempo até o primeiro token) ---
+logger = logging.getLogger("santchat")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
 # --- Configurações iniciais ---
 st.set_page_config(
     page_title="SantChat", 
@@ -380,22 +455,81 @@ def load_css():
     </style>
     """, unsafe_allow_html=True)
 
-# --- Firebase Initialization ---
+# --- Armazenamento (Firebase ou SQLite local) ---
 
-def initialize_firebase():
-    if not firebase_admin._apps:
-        raw_key = dict(st.secrets["FIREBASE_KEY"])
+@st.cache_resource
+def obter_armazenamento():
+    """Banco do app: "firebase" (padrão), "sqlite" ou "memoria", pelo secret ARMAZENAMENTO"""
+    tipo = st.secrets.get("ARMAZENAMENTO", "firebase")
+    if tipo != "firebase":
+        return criar_armazenamento(tipo, caminho=st.secrets.get("ARMAZENAMENTO_CAMINHO", "dados/santchat.sqlite3"))
 
-        # Corrigir a quebra de linha da chave privada
-        raw_key["private_key"] = raw_key["private_key"].replace("\\n", "\n")
+    raw_key = dict(st.secrets["FIREBASE_KEY"])
 
-        cred = credentials.Certificate(raw_key)
-        firebase_admin.initialize_app(cred, {
-            "databaseURL": st.secrets["FIREBASE_KEY_DB_URL"]
-        })
+    # Corrigir a quebra de linha da chave privada
+    raw_key["private_key"] = raw_key["private_key"].replace("\\n", "\n")
+
+    return criar_armazenamento("firebase", credenciais=raw_key, url=st.secrets["FIREBASE_KEY_DB_URL"])
+
+def referencia(caminho="/"):
+    """Mesma interface do db.reference, no armazenamento configurado"""
+    return obter_armazenamento().reference(caminho)
 
 
 # --- Novas funções para o sistema RAG-like ---
+@st.cache_resource
+def obter_indice_correcoes():
+    """Índice das correções compartilhado por todas as sessões do processo.
+
+    Fica em dia sozinho via listen(): qualquer put/patch em todas_correcoes
+    (desta ou de outra instância) é aplicado no índice incrementalmente.
+    """
+    indice = IndiceCorrecoes()
+    sincronizador = SincronizadorCorrecoes(
+        referencia("respostas_revisadas/todas_correcoes"), indice
+    )
+    if not sincronizador.iniciar(timeout=15):
+        st.warning("Índice de correções ainda carregando; algumas respostas revisadas podem não aparecer")
+    return indice
+
+@st.cache_resource
+def obter_contadores_uso():
+    """Contadores de uso das correções, gravados em lote em segundo plano"""
+    return ContadoresUso(referencia("respostas_revisadas"), obter_indice_correcoes())
+
+@st.cache_resource
+def obter_servico_geracao():
+    """Chamadas à OpenRouter de todas as sessões, com fila e coalescência"""
+    return ServicoGeracao(max_concorrentes=int(st.secrets.get("GERACAO_MAX_CONCORRENTES", 4)))
+
+@st.cache_resource
+def obter_cache_respostas():
+    """Respostas já geradas, em memória (LRU) e em disco (SQLite)"""
+    return CacheRespostas(
+        st.secrets.get("CACHE_RESPOSTAS_CAMINHO", "cache/respostas.sqlite3"),
+        max_memoria=int(st.secrets.get("CACHE_RESPOSTAS_MEMORIA", 512)),
+        max_disco=int(st.secrets.get("CACHE_RESPOSTAS_DISCO", 20000)),
+        ttl=int(st.secrets.get("CACHE_RESPOSTAS_TTL", 6 * 3600))
+    )
+
+@st.cache_resource
+def obter_fila_persistencia():
+    """Gravações de chat, feedback e memória, feitas em lote em segundo plano"""
+    return FilaPersistencia(
+        referencia("/"),
+        intervalo=float(st.secrets.get("PERSISTENCIA_INTERVALO", 0.2)),
+        tentativas=int(st.secrets.get("PERSISTENCIA_TENTATIVAS", 8))
+    )
+
+@st.cache_resource
+def obter_roteador():
+    """Roteador de modelos, alimentado pelas métricas do serviço de geração"""
+    return RoteadorModelos(
+        obter_servico_geracao().metricas_modelos,
+        MODELOS_CATALOGO,
+        tamanho_cadeia=int(st.secrets.get("ROTEAMENTO_TAMANHO_CADEIA", 2))
+    )
+
 def salvar_resposta_revisada(revisor_id, pergunta, resposta_original, resposta_revisada, categoria, editado=False):
     try:
         # Gera um ID único para a correção
@@ -412,61 +546,71 @@ def salvar_resposta_revisada(revisor_id, pergunta, resposta_original, resposta_r
             "revisor": st.session_state.user_data.get("nome_usuario", "admin"),
             "timestamp": timestamp,
             "status": "ativo",  # Agora temos status ativo/inativo
+            "editado": editado,  # Corrigida (True) ou aprovada como veio (False)
             "uso_count": 0,  # Contador de vezes usada
-            "last_used": None  # Quando foi usada pela última vez
+            "last_used": None,  # Quando foi usada pela última vez
+            # Pré-calculadas aqui para o índice não precisar recalcular:
+            # assinatura do LSH, pergunta normalizada e impressão digital
+            "assinatura_minhash": codificar_assinatura(assinatura_minhash(pergunta)),
+            **campos_normalizados(pergunta)
         }
         
-        # Salva em três lugares diferentes para fácil acesso
-        ref = db.reference("respostas_revisadas")
-        
-        # 1. Na categoria específica
-        ref_base.child(f"por_categoria/{categoria}/{correcao_id}").set(dados_correcao)
-        
-        # 2. Em todas as correções (para busca)
-        ref_base.child(f"todas_correcoes/{correcao_id}").set(dados_correcao)
-        
-        # 3. Atualiza lista de categorias
-        categorias = ref_base.child("categorias").get() or []
-        if categoria not in categorias:
-            categorias.append(categoria)
-            ref_base.child("categorias").set(categorias)
-
-        # 4. Força atualização imediata 
-        db.reference().update({})
+        # Categoria nova entra na lista (transação) antes da correção que a usa
+        garantir_categoria(categoria)
+
+        # Em todas_correcoes e na categoria, num único update
+        gravar_correcao(correcao_id, atualizacao_nova(correcao_id, dados_correcao), dados_correcao)
         
         return True
     except Exception as e:
         st.error(f"Erro ao salvar correção: {str(e)}")
         return False
 
-def buscar_correcoes(categoria=None, termo_busca=None):
+def garantir_categoria(categoria):
+    """Inclui a categoria na lista, se nenhuma correção conhecida a usa ainda"""
+    if categoria not in obter_indice_correcoes().categorias():
+        incluir_categoria(referencia(f"{RAIZ}/{CATEGORIAS}"), categoria)
+
+def gravar_correcao(correcao_id, atualizacao, dados):
+    """Grava as cópias da correção num único update() e já reflete no índice
+    local (dados=None quando ela foi excluída); o listen() confirma depois."""
+    referencia(RAIZ).update(atualizacao)
+    if dados is None:
+        obter_indice_correcoes().remover(correcao_id)
+    else:
+        obter_indice_correcoes().inserir(correcao_id, dados)
+
+def editar_correcao(correcao_id, dados, campos):
+    gravar_correcao(correcao_id, atualizacao_edicao(correcao_id, dados, campos), {**dados, **campos})
+
+def buscar_correcoes(categoria=None, termo_busca=None, status=None, uso="Todas", pagina=1, por_pagina=20):
+    """Uma página de correções, do índice em memória (sem baixar o nó do Firebase).
+
+    Devolve ([(correcao_id, dados, pontuacao), ...], total de resultados,
+    palavras da busca com prefixo curto demais; ver IndiceCorrecoes.pesquisar).
+    """
     try:
-        if categoria and categoria != "Todas":
-            ref = db.reference(f"respostas_revisadas/por_categoria/{categoria}")
-        else:
-            ref = db.reference("respostas_revisadas/todas_correcoes")
-        
-        correcoes = ref.get() or {}
-        
-        if termo_busca:
-            correcoes = {
-                k: v for k, v in correcoes.items()
-                if (termo_busca.lower() in v.get("pergunta", "").lower() or
-                    termo_busca.lower() in v.get("resposta_revisada", "").lower())
-            }
-        
-        return correcoes
+        uso_minimo, uso_maximo = FILTROS_USO.get(uso, (None, None))
+        return obter_indice_correcoes().pesquisar(
+            termo_busca or "",
+            status=status,
+            categoria=categoria if categoria and categoria != "Todas" else None,
+            uso_minimo=uso_minimo,
+            uso_maximo=uso_maximo,
+            pagina=pagina,
+            por_pagina=por_pagina
+        )
     
     except Exception as e:
         st.error(f"Erro ao buscar correções: {str(e)}")
-        return {}
+        return [], 0, []
 
 def render_gerenciar_correcoes():
     st.markdown("<div style='height: 80px;'></div>", unsafe_allow_html=True)
     st.subheader("📝 Gerenciar Correções")
     
     try:
-        categorias = db.reference("respostas_revisadas/categorias").get() or []
+        categorias = referencia(f"{RAIZ}/{CATEGORIAS}").get() or []
         
         # Filtros
         col1, col2 = st.columns(2)
@@ -478,16 +622,57 @@ def render_gerenciar_correcoes():
         
         with col2:
             termo_busca = st.text_input("Buscar por texto:")
-        
-        # Carrega as correções
-        correcoes = buscar_correcoes(categoria_selecionada, termo_busca)
+
+        col3, col4 = st.columns(2)
+        with col3:
+            filtro_status = st.selectbox("Status:", ["Todos", "Ativas", "Inativas"])
+        with col4:
+            filtro_uso = st.selectbox("Uso:", list(FILTROS_USO))
+        status = {"Ativas": "ativo", "Inativas": "inativo"}.get(filtro_status)
+
+        # Mudar o filtro volta para a primeira página
+        filtros = (categoria_selecionada, termo_busca, filtro_status, filtro_uso)
+        if st.session_state.get("correcoes_filtros") != filtros:
+            st.session_state.correcoes_filtros = filtros
+            st.session_state.correcoes_pagina = 1
+        pagina = st.session_state.correcoes_pagina
+
+        # Carrega só a página atual
+        correcoes, total, truncados = buscar_correcoes(
+            categoria_selecionada, termo_busca, status, filtro_uso, pagina, CORRECOES_POR_PAGINA
+        )
+        if not correcoes and total:
+            # A página ficou além do fim (ex.: depois de excluir): vai para a última
+            pagina = st.session_state.correcoes_pagina = -(-total // CORRECOES_POR_PAGINA)
+            correcoes, total, truncados = buscar_correcoes(
+                categoria_selecionada, termo_busca, status, filtro_uso, pagina, CORRECOES_POR_PAGINA
+            )
+
+        if truncados:
+            st.warning(
+                f"Palavras demais começam com {', '.join(repr(t) for t in truncados)}: a busca usou só as "
+                f"{MAX_EXPANSOES_PREFIXO} primeiras em ordem alfabética. Digite mais letras para ver tudo."
+            )
         
         if not correcoes:
             st.info("Nenhuma correção encontrada com esses filtros")
             return
+
+        paginas = max(-(-total // CORRECOES_POR_PAGINA), 1)
+        col_anterior, col_pagina, col_proxima = st.columns([1, 2, 1])
+        with col_anterior:
+            if pagina > 1 and st.button("⬅️ Anterior", key="correcoes_anterior"):
+                st.session_state.correcoes_pagina = pagina - 1
+                st.rerun()
+        with col_pagina:
+            st.caption(f"Página {pagina} de {paginas} ({total} correções)")
+        with col_proxima:
+            if pagina < paginas and st.button("Próxima ➡️", key="correcoes_proxima"):
+                st.session_state.correcoes_pagina = pagina + 1
+                st.rerun()
         
         # Mostra as correções sem expanders aninhados
-        for correcao_id, dados in correcoes.items():
+        for correcao_id, dados, _ in correcoes:
             status_icon = "🟢" if dados.get('status') == "ativo" else "🔴"
             edit_icon = "✏️" if dados.get('editado', False) else "✅"
             
@@ -517,23 +702,20 @@ def render_gerenciar_correcoes():
                     # Botões de ação...
                     if st.button(f"🗑️ Excluir", key=f"del_{correcao_id}"):
                         if st.checkbox(f"Confirmar exclusão da correção {correcao_id[:6]}...?", key=f"confirm_del_{correcao_id}"):
-                            # Remove de todos os lugares
-                            db.reference(f"respostas_revisadas/por_categoria/{dados['categoria']}/{correcao_id}").delete()
-                            db.reference(f"respostas_revisadas/todas_correcoes/{correcao_id}").delete()
+                            # Remove as duas cópias de uma vez
+                            gravar_correcao(correcao_id, atualizacao_exclusao(correcao_id, dados.get('categoria')), None)
                             st.success("Correção excluída!")
                             st.rerun()
         
                     # Adicione botão para desativar/reativar
                     if dados.get("status") == "ativo":
                         if st.button("🚫 Desativar", key=f"disable_{correcao_id}"):
-                            db.reference(f"respostas_revisadas/todas_correcoes/{correcao_id}").update({"status": "inativo"})
-                            db.reference(f"respostas_revisadas/por_categoria/{dados['categoria']}/{correcao_id}").update({"status": "inativo"})
+                            editar_correcao(correcao_id, dados, {"status": "inativo"})
                             st.success("Correção desativada!")
                             st.rerun()
                     else:  # Este else deve estar alinhado com o if principal
                         if st.button("✅ Reativar", key=f"enable_{correcao_id}"):
-                            db.reference(f"respostas_revisadas/todas_correcoes/{correcao_id}").update({"status": "ativo"})
-                            db.reference(f"respostas_revisadas/por_categoria/{dados['categoria']}/{correcao_id}").update({"status": "ativo"})
+                            editar_correcao(correcao_id, dados, {"status": "ativo"})
                             st.success("Correção reativada!")
                             st.rerun()
         
@@ -560,21 +742,15 @@ def render_gerenciar_correcoes():
                         
                         if st.form_submit_button("💾 Salvar Alterações"):
                             if nova_resposta:
-                                # Atualiza a correção
-                                dados_atualizados = {
-                                    **dados,
+                                # Só os campos alterados; mudando de categoria, a cópia
+                                # sai da antiga e vai para a nova no mesmo update
+                                campos = {
                                     "resposta_revisada": nova_resposta,
                                     "categoria": nova_categoria,
-                                    "timestamp": datetime.now().isoformat()
+                                    "timestamp": datetime.now().isoformat(),
+                                    "editado": dados.get('editado', False) or nova_resposta != dados.get('resposta_revisada')
                                 }
-                                
-                                # Remove da categoria antiga (se mudou)
-                                if nova_categoria != dados['categoria']:
-                                    db.reference(f"respostas_revisadas/por_categoria/{dados['categoria']}/{correcao_id}").delete()
-                                
-                                # Salva nas novas referências
-                                db.reference(f"respostas_revisadas/por_categoria/{nova_categoria}/{correcao_id}").set(dados_atualizados)
-                                db.reference(f"respostas_revisadas/todas_correcoes/{correcao_id}").set(dados_atualizados)
+                                editar_correcao(correcao_id, dados, campos)
                                 
                                 st.success("✅ Correção atualizada!")
                                 st.session_state.pop('editando_correcao', None)
@@ -586,92 +762,39 @@ def render_gerenciar_correcoes():
     except Exception as e:
         st.error(f"Erro ao carregar correções: {str(e)}")
 
-def carregar_respostas_revisadas():
-    try:
-        ref = db.reference("respostas_revisadas")
-        return ref.get() or {}
-    except Exception as e:
-        st.error(f"Erro ao carregar respostas revisadas: {str(e)}")
-        return {}
-
 def buscar_resposta_revisada(pergunta):
     try:
-        respostas = carregar_respostas_revisadas()
-        for user_id, user_respostas in respostas.items():
-            for ts, resposta in user_respostas.items():
-                if resposta['status'] == 'revisado' and similaridade_pergunta(pergunta, resposta['pergunta']) > 0.7:
-                    return resposta['resposta_revisada']
+        # Quase-duplicatas pelo índice MinHash/LSH: o SequenceMatcher só roda
+        # nas correções que caem num balde em comum com a pergunta
+        resultado = obter_indice_correcoes().buscar_quase_duplicata(pergunta, limiar=0.7)
+        if resultado:
+            return resultado[1].get("resposta_revisada")
         return None
     except Exception as e:
         st.error(f"Erro ao buscar resposta revisada: {str(e)}")
         return None
 
-def similaridade_pergunta(pergunta1, pergunta2):
-    """Calcula similaridade entre perguntas usando SequenceMatcher"""
-    # Normaliza as perguntas
-    p1 = pergunta1.lower().strip()
-    p2 = pergunta2.lower().strip()
-    
-    # Usa SequenceMatcher para uma comparação mais inteligente
-    return SequenceMatcher(None, p1, p2).ratio()
+def carregar_interacoes(tamanho=50, antes=None, user_id=None, dia=None):
+    """Uma página do feed de interações (mais novas primeiro) e o cursor da próxima.
 
-def carregar_interacoes():
-    """Carrega todas as interações usuário-IA do Firebase"""
+    Com `user_id` a consulta vai no índice do usuário; com `dia`, só a faixa
+    de chaves daquele dia. Nada é filtrado no cliente.
+    """
     try:
-        ref = db.reference("logs/usuarios")
-        todos_usuarios = ref.get() or {}
-        
-        todas_interacoes = []
-        
-        for user_id, user_data in todos_usuarios.items():
-            chats = user_data.get("chats", {})
-            
-            for chat_id, chat_data in chats.items():
-                mensagens = chat_data.get("mensagens", [])
-                
-                # Debug: Verifique a estrutura das mensagens
-                if not isinstance(mensagens, list):
-                    st.warning(f"Estrutura inválida de mensagens para chat {chat_id}")
-                    continue
-                
-                # Percorre as mensagens em pares
-                for i in range(len(mensagens)-1):
-                    if mensagens[i]["sender"] == "user" and mensagens[i+1]["sender"] == "bot":
-                        timestamp = chat_data.get("ultima_atualizacao")
-                        if not timestamp:
-                            timestamp = datetime.now().isoformat()
-                            
-                        todas_interacoes.append({
-                            "user": user_id,
-                            "chat_id": chat_id,
-                            "pergunta": mensagens[i].get("text", ""),
-                            "resposta": mensagens[i+1].get("text", ""),
-                            "timestamp": timestamp,
-                            "metadata": {
-                                "feedback": mensagens[i+1].get("feedback", None)
-                            }
-                        })
-        
-        # Ordena por timestamp
-        todas_interacoes.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-        
-        # Debug: Mostra quantas interações foram encontradas
-        st.session_state['debug_interacoes_count'] = len(todas_interacoes)
-        
-        return todas_interacoes
-        
+        ref = referencia(f"{POR_USUARIO}/{user_id}" if user_id else FEED)
+        pagina, cursor = pagina_por_chave(ref, tamanho, antes, dia)
+        return [dict(entrada, id=push_id) for push_id, entrada in pagina], cursor
     except Exception as e:
         st.error(f"Erro ao carregar interações: {str(e)}")
-        # Debug adicional
-        if 'todos_usuarios' in locals():
-            st.write("Estrutura dos usuários:", list(todos_usuarios.keys()))
-        return []
+        return [], None
 
 
 # --- Funções Auxiliares ---
 def carregar_memoria():
     try:
-        ref = db.reference("memoria_global")
+        # Uma gravação da memória ainda na fila tem que aparecer na leitura
+        obter_fila_persistencia().aguardar("memoria_global", timeout=10)
+        ref = referencia("memoria_global")
         memoria = ref.get()
         if memoria is None:
             st.warning("Nenhum dado encontrado na memória global")
@@ -683,91 +806,220 @@ def carregar_memoria():
         return []
 
 def salvar_memoria(mem):
+    """Agenda a gravação da memória; devolve o Future da gravação (ou False)"""
     try:
-        db.reference("memoria_global").set(mem)
-        return True
+        futuro = obter_fila_persistencia().enfileirar({"memoria_global": mem})
+        # Respostas geradas com a memória antiga não servem mais
+        obter_cache_respostas().descartar_outras_versoes(versao_memoria(mem))
+        return futuro
     except Exception as e:
         st.error(f"Erro ao salvar memória: {str(e)}")
         return False
 
 def salvar_feedback(user_id, pergunta, resposta, feedback, tipo):
     try:
-        ref = db.reference(f"logs/feedbacks/{user_id}")
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        feedback_data = {
-            "pergunta": pergunta,
-            "resposta": resposta,
-            "tipo_feedback": tipo,
-            "timestamp": datetime.now().isoformat()
-        }
-        ref.child(ts).set(feedback_data)
-        return True
+        # Entrada, índices por tipo/usuário e contadores num único update
+        return obter_fila_persistencia().enfileirar(atualizacao_feedback(
+            gerar_push_id(), user_id, pergunta, resposta, tipo, datetime.now().isoformat()
+        ))
     except Exception as e:
         st.error(f"Erro ao salvar feedback: {str(e)}")
         return False
 
 def salvar_historico_chat(user_id, chat_id, historico):
+    """Agenda a gravação das mensagens ainda não salvas e dos metadados do chat.
+
+    Não espera o Firebase: devolve o Future da gravação (ou False). As
+    mensagens contam como salvas já ao entrar na fila, que cuida das
+    retentativas; se a gravação falhar de vez, a contagem volta e elas
+    vão de novo no próximo salvamento.
+    """
     try:
         if not historico:
             return False
         
-        primeira_msg = next((msg["text"] for msg in historico if msg["sender"] == "user"), "Chat sem título")[:50]
-        ref = db.reference(f"logs/usuarios/{user_id}/chats/{chat_id}")
-        ref.set({
-            "titulo": primeira_msg,
-            "mensagens": historico,
-            "ultima_atualizacao": datetime.now().isoformat()
+        # `historico` pode ser só o final do chat (blocos carregados a partir de `inicio`)
+        inicio = st.session_state.get("inicio_mensagens", {}).get(chat_id, 0)
+        salvas = st.session_state.setdefault("mensagens_salvas", {})
+        ja_salvas = min(max(salvas.get(chat_id, 0) - inicio, 0), len(historico))
+        # Sem o começo do chat a primeira pergunta não está aqui; o título fica como está
+        primeira_msg = None if inicio else next(
+            (msg["text"] for msg in historico if msg["sender"] == "user"), "Chat sem título"
+        )[:50]
+        caminho = f"logs/usuarios/{user_id}/chats/{chat_id}"
+        # Só as mensagens novas (chaves m000000, m000001...) e os metadados;
+        # o resto do nó (mensagens antigas, resumo) fica como está
+        agora = datetime.now().isoformat()
+        atualizacao = atualizacao_chat(historico, ja_salvas, primeira_msg, agora, inicio)
+        gravacao = {f"{caminho}/{chave}": valor for chave, valor in atualizacao.items()}
+        # Cada resposta nova da IA entra também no feed do "Treinar IA"
+        for posicao, pergunta, resposta in entradas_novas(historico, ja_salvas, inicio):
+            gravacao.update(atualizacao_interacao(gerar_push_id(), user_id, chat_id, posicao, pergunta, resposta, agora))
+        # A entrada do índice da barra lateral vai no mesmo update
+        gravacao.update({
+            f"{caminho_indice(user_id, chat_id)}/{campo}": atualizacao[campo]
+            for campo in CAMPOS if campo in atualizacao
         })
-        return True
+        futuro = obter_fila_persistencia().enfileirar(gravacao)
+        anterior = inicio + ja_salvas
+        salvas[chat_id] = inicio + len(historico)
+
+        def reverter(futuro):
+            # Roda na thread da fila: mexe só no dict capturado, não no session_state
+            if futuro.exception() is not None:
+                salvas[chat_id] = min(salvas.get(chat_id, 0), anterior)
+
+        futuro.add_done_callback(reverter)
+        return futuro
     except Exception as e:
         st.error(f"Erro ao salvar histórico: {str(e)}")
         return False
 
-def carregar_historico_chats(user_id):
+def carregar_historico_chats(user_id, tamanho=20, antes=None):
+    """Uma página do índice de chats (mais recentes primeiro) e o cursor da próxima"""
     try:
-        ref = db.reference(f"logs/usuarios/{user_id}/chats")
-        chats = ref.get()
-        return chats if chats else {}
+        obter_fila_persistencia().aguardar(caminho_indice(user_id), timeout=5)
+        pagina, cursor = pagina_chats(referencia(caminho_indice(user_id)), tamanho, antes)
+        if not pagina and antes is None:
+            pagina, cursor = indexar_chats_antigos(user_id, tamanho)
+        return pagina, cursor
     except Exception as e:
         st.error(f"Erro ao carregar histórico: {str(e)}")
-        return {}
+        return [], None
+
+def indexar_chats_antigos(user_id, tamanho):
+    """Usuário ainda sem índice (antes do backfill): monta uma vez a partir dos chats"""
+    ref = referencia(f"logs/usuarios/{user_id}/chats")
+    if not ref.get(shallow=True):
+        return [], None
+    entradas = {chat_id: entrada_indice(chat) for chat_id, chat in (ref.get() or {}).items()}
+    obter_fila_persistencia().enfileirar(
+        {caminho_indice(user_id, chat_id): entrada for chat_id, entrada in entradas.items()}
+    )
+    ordenadas = sorted(entradas.items(), key=lambda item: (item[1].get("ultima_atualizacao", ""), item[0]), reverse=True)
+    pagina = ordenadas[:tamanho]
+    cursor = (pagina[-1][1].get("ultima_atualizacao", ""), pagina[-1][0]) if len(ordenadas) > tamanho else None
+    return pagina, cursor
+
+def carregar_chat(user_id, chat_id, total=None):
+    """Final de um chat (mensagens e resumo), só quando ele é aberto.
+
+    Vem o último bloco de mensagens e o que o resumo ainda não cobre; os
+    blocos anteriores só com carregar_mensagens_anteriores. Devolve
+    {"inicio", "mensagens", "resumo"}, onde `inicio` é a posição no chat da
+    primeira mensagem carregada.
+    """
+    try:
+        caminho = f"logs/usuarios/{user_id}/chats/{chat_id}"
+        obter_fila_persistencia().aguardar(caminho, timeout=5)
+        ref = referencia(caminho)
+        if total is None:
+            total = ref.child("total_mensagens").get()
+        resumo = ref.child("resumo").get()
+        inicio = inicio_bloco(total or 0, (resumo or {}).get("ate_indice"))
+        mensagens = carregar_bloco(ref.child("mensagens"), inicio) if total else []
+        if not total or len(mensagens) < total - inicio:
+            # Chat ainda no formato antigo (chaves fora da faixa): vem inteiro
+            inicio, mensagens = 0, ler_mensagens(ref.child("mensagens").get())
+        return {"inicio": inicio, "mensagens": mensagens, "resumo": resumo}
+    except Exception as e:
+        st.error(f"Erro ao carregar chat: {str(e)}")
+        return None
+
+def abrir_chat(chat_id, chat):
+    """Coloca na sessão o chat devolvido por carregar_chat"""
+    st.session_state.current_chat_id = chat_id
+    st.session_state.messages = chat["mensagens"]
+    st.session_state.setdefault("inicio_mensagens", {})[chat_id] = chat["inicio"]
+    st.session_state.setdefault("mensagens_salvas", {})[chat_id] = chat["inicio"] + len(chat["mensagens"])
+    st.session_state.resumo_chat = resumo_relativo(chat["resumo"], chat["inicio"])
+    st.session_state.pop("resumo_pendente", None)
+
+def resumo_relativo(resumo, inicio):
+    """Resumo com ate_indice contado a partir da primeira mensagem carregada"""
+    if not resumo:
+        return resumo
+    return dict(resumo, ate_indice=max(resumo.get("ate_indice", 0) - inicio, 0))
+
+def carregar_mensagens_anteriores(user_id, chat_id):
+    """Bloco anterior às mensagens carregadas, colocado no começo do histórico"""
+    inicios = st.session_state.setdefault("inicio_mensagens", {})
+    inicio = inicios.get(chat_id, 0)
+    try:
+        anteriores = carregar_bloco(
+            referencia(f"logs/usuarios/{user_id}/chats/{chat_id}/mensagens"),
+            max(inicio - TAMANHO_BLOCO, 0), inicio
+        )
+    except Exception as e:
+        st.error(f"Erro ao carregar mensagens anteriores: {str(e)}")
+        return
+    if not anteriores:
+        return
+    st.session_state.messages = anteriores + st.session_state.messages
+    inicios[chat_id] = inicio - len(anteriores)
+    resumo = st.session_state.get("resumo_chat")
+    if resumo:
+        st.session_state.resumo_chat = dict(resumo, ate_indice=resumo.get("ate_indice", 0) + len(anteriores))
 
 def criar_usuario(email, senha, nome_usuario):
     try:
         user_id = nome_usuario.lower()
-        ref = db.reference(f"usuarios/{user_id}")
+        ref = referencia(f"usuarios/{user_id}")
         
         if ref.get():
             return False, "Usuário já existe"
-            
-        ref.set({
-            "email": email,
+
+        # O e-mail é reservado no índice antes: dois cadastros com o mesmo
+        # e-mail ao mesmo tempo não passam os dois
+        ref_email = referencia(caminho_email(email))
+        if not reservar_email(ref_email, user_id):
+            return False, "E-mail já cadastrado"
+
+        dados = {
+            "email": normalizar_email(email),
             "senha": senha,
             "nome_usuario": nome_usuario,
             "nivel": 0,  # Nível padrão 0 (usuário comum)
             "criado_em": datetime.now().isoformat()
-        })
+        }
+        # Transação também no usuário, para o mesmo nome não ser criado duas vezes
+        if ref.transaction(lambda atual: atual or dados) != dados:
+            liberar_email(ref_email, user_id)
+            return False, "Usuário já existe"
         return True, "Usuário criado com sucesso"
     except Exception as e:
         return False, f"Erro ao criar usuário: {str(e)}"
 
+def buscar_usuario_por_email(email):
+    """(user_id, dados) do dono do e-mail, pelo índice; None se não existe"""
+    ref_email = referencia(caminho_email(email))
+    user_id = ref_email.get()
+    if user_id:
+        dados = referencia(f"usuarios/{user_id}").get()
+        if dados and normalizar_email(dados.get("email")) == normalizar_email(email):
+            return user_id, dados
+
+    # Usuário de antes do índice (migracoes.py emails ainda não rodou): consulta
+    # por e-mail, indexada no servidor (".indexOn": ["email"] em usuarios, ver
+    # database.rules.json), e já deixa a entrada no índice. Os cadastros
+    # antigos guardavam o e-mail como foi digitado, então tenta os dois
+    for variante in dict.fromkeys((normalizar_email(email), (email or "").strip())):
+        encontrados = referencia("usuarios").order_by_child("email").equal_to(variante).limit_to_first(1).get()
+        for user_id, dados in (encontrados or {}).items():
+            reservar_email(ref_email, user_id)
+            return user_id, dados
+    return None
+
 def autenticar_usuario(email, senha):
     try:
-        # Procurar todos os usuários e comparar e-mail e senha
-        ref = db.reference("usuarios")
-        usuarios = ref.get()
-
-        if not usuarios:
-            return False, None, "Nenhum usuário encontrado no banco de dados."
-
-        for user_id, dados in usuarios.items():
-            if dados.get("email") == email:
-                if dados.get("senha") == senha:
-                    return True, dados, "Login bem-sucedido"
-                else:
-                    return False, None, "Senha incorreta"
-
-        return False, None, "Usuário não encontrado"
+        encontrado = buscar_usuario_por_email(email)
+        if encontrado is None:
+            return False, None, "Usuário não encontrado"
+
+        _, dados = encontrado
+        if dados.get("senha") == senha:
+            return True, dados, "Login bem-sucedido"
+        return False, None, "Senha incorreta"
     except Exception as e:
         return False, None, f"Erro na autenticação: {str(e)}"
 
@@ -787,70 +1039,22 @@ def processar_comando_dev(comando, user_data):
     
     return None, None
 
-def calcular_similaridade(pergunta1, pergunta2):
-    """Calcula similaridade entre perguntas com lógica mais sofisticada"""
-    # Normaliza as perguntas
-    p1 = pergunta1.lower().strip()
-    p2 = pergunta2.lower().strip()
-    
-    # Caso sejam idênticas
-    if p1 == p2:
-        return 1.0
-    
-    # Verifica se uma contém a outra
-    if p1 in p2 or p2 in p1:
-        return 0.9
-    
-    # Lógica por palavras-chave
-    palavras_p1 = set(p1.split())
-    palavras_p2 = set(p2.split())
-    
-    # Calcula interseção
-    palavras_comuns = palavras_p1.intersection(palavras_p2)
-    total_palavras = max(len(palavras_p1), len(palavras_p2))
-    
-    return len(palavras_comuns) / total_palavras
-
 def buscar_correcao_efetiva(pergunta):
     try:
-        # Busca em todas as correções ativas
-        ref = db.reference("respostas_revisadas/todas_correcoes")
-        todas_correcoes = ref.get() or {}
-        
+        # Busca nas correções ativas pelo índice em memória: primeiro pela
+        # impressão digital (O(1)), depois só pontua as correções que têm
+        # chance de passar do threshold
         melhor_correcao = None
-        melhor_pontuacao = 0
         melhor_id = None
         
-        for correcao_id, dados in todas_correcoes.items():
-            if dados.get("status") != "ativo":
-                continue
-                
-            # Calcula similaridade (pode melhorar com embeddings depois)
-            similaridade = calcular_similaridade(pergunta, dados.get("pergunta", ""))
-            
-            # Se for mais similar que o threshold e melhor que a anterior
-            if similaridade > 0.7 and similaridade > melhor_pontuacao:
-                melhor_pontuacao = similaridade
-                melhor_correcao = dados.get("resposta_revisada")
-                melhor_id = correcao_id
+        resultado = obter_indice_correcoes().buscar(pergunta, limiar=0.7)
+        if resultado:
+            melhor_id, dados, _ = resultado
+            melhor_correcao = dados.get("resposta_revisada")
         
-        # Atualiza estatísticas de uso
+        # Atualiza estatísticas de uso (acumulado em memória e gravado em lote)
         if melhor_id:
-            ref_correcao = db.reference(f"respostas_revisadas/todas_correcoes/{melhor_id}")
-            correcao_data = ref_correcao.get() or {}
-            
-            ref_correcao.update({
-                "uso_count": (correcao_data.get("uso_count", 0) + 1),
-                "last_used": datetime.now().isoformat()
-            })
-            
-            # Atualiza também na categoria
-            categoria = correcao_data.get("categoria")
-            if categoria:
-                db.reference(f"respostas_revisadas/por_categoria/{categoria}/{melhor_id}").update({
-                    "uso_count": (correcao_data.get("uso_count", 0) + 1),
-                    "last_used": datetime.now().isoformat()
-                })
+            obter_contadores_uso().registrar(melhor_id)
         
         return melhor_correcao
     
@@ -862,83 +1066,240 @@ def buscar_correcao_efetiva(pergunta):
         st.error(f"Erro ao buscar correções: {str(e)}")
         return None
 
-def gerar_resposta(memoria, prompt, user_name=None, historico_conversa=None):
+def buscar_resposta_pronta(consulta):
+    """Correção ou resposta revisada para a pergunta, se existir"""
     # Passo 1: Verifica se há uma correção revisada para esta pergunta
-    correcao = buscar_correcao_efetiva(prompt)
+    correcao = buscar_correcao_efetiva(consulta)
     if correcao:
         return correcao
     
-    # Passo 2: Se não houver correção, usa a memória global
-    if memoria:
-        contexto_memoria = "\n".join(memoria)
-    else:
-        contexto_memoria = ""
-    resposta_revisada = buscar_resposta_revisada(prompt)
-    if resposta_revisada:
-        return resposta_revisada
+    # Passo 2: Quase-duplicata de uma pergunta revisada
+    return buscar_resposta_revisada(consulta)
+
+def montar_mensagens(memoria, prompt, user_name=None, historico_conversa=None, resumo=None):
+    """Mensagens para a API dentro do orçamento de tokens do prompt.
+
+    Entram as entradas da memória global mais relevantes para a pergunta,
+    o resumo das mensagens antigas (se houver) e as mensagens seguintes da
+    conversa, como turnos de verdade.
+    """
+    consulta = normalizar_consulta(prompt)
     agora = datetime.now().strftime("%d/%m/%Y %H:%M")
-    
-    # Construir contexto da conversa
-    contexto_conversa = ""
-    if historico_conversa and len(historico_conversa) > 1:
-        contexto_conversa = "\nContexto da conversa atual:\n"
-        for msg in historico_conversa[-5:]:  # Pegar as últimas 5 mensagens como contexto
-            if msg["sender"] == "user":
-                contexto_conversa += f"Usuário: {msg['text']}\n"
-            else:
-                contexto_conversa += f"Assistente: {msg['text']}\n"
-    
     nome_usuario = user_name or "usuário"
+    system_prompt = PROMPT_SISTEMA.format(agora=agora, nome_usuario=nome_usuario).strip()
+
+    # A última mensagem do histórico é a própria pergunta; o que o resumo
+    # já cobre não vai cru
+    resumo = resumo or {}
+    historico = (historico_conversa or [])[resumo.get("ate_indice", 0):-1]
+    msgs, estatisticas = montar_contexto(
+        system_prompt, memoria, consulta, historico,
+        orcamento=ORCAMENTO_PROMPT, fracao_memoria=FRACAO_MEMORIA_PROMPT,
+        resumo=resumo.get("texto")
+    )
+    logger.info(
+        "prompt tokens=%d memoria=%d/%d historico=%d/%d resumo=%s",
+        estatisticas["tokens"], estatisticas["memoria"], estatisticas["memoria_total"],
+        estatisticas["historico"], estatisticas["historico_total"],
+        resumo.get("ate_indice", "-")
+    )
+    return msgs
+
+def chave_geracao(consulta, memoria, msgs, nivel="padrao"):
+    """Chave para juntar pedidos iguais feitos ao mesmo tempo por sessões diferentes.
+
+    Só junta quem mandaria exatamente as mesmas mensagens: o prompt de
+    sistema montado (com o nome do usuário), a memória escolhida e o
+    histórico. Pedidos do mesmo nível são atendidos pelos mesmos modelos.
+    """
+    return chave_requisicao(consulta, memoria, f"nivel:{nivel}", msgs)
 
-    system_prompt = f"""
-    Hoje é {agora}. Você é o SantChat, IA oficial do Santander.
-
-    Responda com clareza e de forma direta.
-    Mantenha o contexto da conversa atual.
-    Não invente informações sobre datas ou produtos.
-    Se o usuário perguntar qual é o nome dele, diga: "Seu nome é {nome_usuario}".
+def rotear_pedido(consulta, historico_conversa=None):
+    """(nível, cadeia de modelos) escolhidos pelo roteador para a pergunta"""
+    nivel, modelos = obter_roteador().rotear(consulta, (historico_conversa or [])[:-1])
+    logger.info("roteamento nivel=%s cadeia=%s", nivel, ",".join(modelos))
+    return nivel, modelos
 
-    ⚠️ Importante: Quando quiser mostrar algo em **negrito**, use diretamente `**texto**`, sem colocar entre crases ou aspas.
-    Evite usar o símbolo de crase (`) ao redor de exemplos de Markdown.
-    Exemplo correto: Para negrito, use **assim**.
-    Exemplo errado: Para negrito, use `**assim**`.
+def chave_cache(consulta, memoria, nivel="padrao", historico_conversa=None):
+    """Chave no cache de respostas, ou None se a resposta não deve ser reaproveitada.
 
-    Nunca explique Markdown como código, apenas mostre já formatado.
+    A pergunta entra como foi digitada (em minúsculas), nunca sem as
+    stopwords: "meu saldo" não pode servir a resposta de "seu saldo". O
+    "v2" separa das entradas antigas, gravadas com a pergunta normalizada.
     """
+    # Só perguntas soltas: com conversa anterior ou pedindo o nome, a
+    # resposta depende de quem pergunta
+    if any(msg["sender"] == "user" for msg in (historico_conversa or [])[:-1]):
+        return None
+    if "nome" in consulta.tokens:
+        return None
+    return ("v2",) + chave_requisicao(consulta, memoria, f"nivel:{nivel}") + (
+        hash_template(PROMPT_SISTEMA), ORCAMENTO_PROMPT, FRACAO_MEMORIA_PROMPT
+    )
 
-
-    msgs = [{"role": "system", "content": system_prompt.strip()}]
-    if memoria:
-        msgs.append({"role": "system", "content": "\n".join(memoria)})
-    msgs.append({"role": "user", "content": prompt})
+def guardar_no_cache(chave_em_cache, resposta, user_name=None):
+    if not chave_em_cache or not resposta:
+        return
+    if user_name and user_name.lower() in resposta.lower():
+        return
+    try:
+        obter_cache_respostas().guardar(chave_em_cache, resposta, versao=chave_em_cache[1])
+    except Exception as e:
+        logger.warning("Erro ao gravar no cache de respostas: %s", e)
+
+def resposta_contingencia(consulta, chave_em_cache, erro):
+    """Resposta quando a IA falhou: cache vencido, correção parecida ou aviso curto"""
+    logger.warning("Geração falhou (%s: %s); tentando resposta de contingência", type(erro).__name__, erro)
+    if chave_em_cache:
+        resposta = obter_cache_respostas().obter(chave_em_cache, aceitar_expirada=True)
+        if resposta:
+            return resposta
+    # Correção com limiar mais baixo que o normal (0.7): melhor uma resposta
+    # revisada próxima do que nenhuma
+    resultado = obter_indice_correcoes().buscar(consulta, limiar=0.5)
+    if resultado:
+        return resultado[1].get("resposta_revisada")
+
+    if isinstance(erro, CircuitoAberto):
+        return "⚠️ O serviço de IA está instável no momento. Tente novamente em alguns instantes."
+    if isinstance(erro, TimeoutError):
+        return "⚠️ A IA demorou demais para responder. Tente novamente em alguns instantes."
+    if isinstance(erro, ErroOpenRouter):
+        return f"Erro na API OpenRouter: {erro.status} - {erro.texto}"
+    return f"⚠️ Erro ao gerar resposta: {str(erro)}"
+
+def gerar_resposta(memoria, prompt, user_name=None, historico_conversa=None, resumo=None):
+    # Normaliza o prompt uma vez só para todas as buscas de correção
+    consulta = ConsultaNormalizada(prompt)
+    resposta_pronta = buscar_resposta_pronta(consulta)
+    if resposta_pronta:
+        return resposta_pronta
+
+    nivel, modelos = rotear_pedido(consulta, historico_conversa)
+    chave_em_cache = chave_cache(consulta, memoria, nivel, historico_conversa)
+    if chave_em_cache:
+        resposta = obter_cache_respostas().obter(chave_em_cache)
+        if resposta:
+            return resposta
+
+    msgs = montar_mensagens(memoria, consulta, user_name, historico_conversa, resumo)
+    chave = chave_geracao(consulta, memoria, msgs, nivel)
 
     try:
-        resp = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {OPENROUTER_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "deepseek/deepseek-r1-0528:free",
-                "messages": msgs,
-                "max_tokens": 50000,
-                "temperature": 0.7
-            },
-            timeout=15
-        )
+        resposta = obter_servico_geracao().completar(chave, OPENROUTER_KEY, msgs, modelos).result(
+            timeout=TIMEOUT_GERACAO
+        ).strip()
+        guardar_no_cache(chave_em_cache, resposta, user_name)
+        return resposta or "⚠️ A resposta da IA veio vazia ou incompleta."
+    except Exception as e:
+        return resposta_contingencia(consulta, chave_em_cache, e)
 
-        if resp.status_code != 200:
-            return f"Erro na API OpenRouter: {resp.status_code} - {resp.text}"
+def gerar_resposta_stream(memoria, prompt, user_name=None, historico_conversa=None, resumo=None, cancelar=None):
+    """Versão em streaming de gerar_resposta: gera a resposta em pedaços.
 
-        data = resp.json()
-        if "choices" in data and data["choices"]:
-            return data["choices"][0]["message"]["content"].strip()
-        else:
-            return "⚠️ A resposta da IA veio vazia ou incompleta."
+    Erros antes do primeiro pedaço viram a resposta, como em gerar_resposta.
+    Depois dele são propagados, para quem consome salvar o que já chegou.
+    Enquanto a IA não manda nada, sai um pedaço vazio a cada
+    INTERVALO_PARAR segundos; acionar `cancelar` encerra a leitura.
+    """
+    consulta = ConsultaNormalizada(prompt)
+    resposta_pronta = buscar_resposta_pronta(consulta)
+    if resposta_pronta:
+        yield resposta_pronta
+        return
+
+    nivel, modelos = rotear_pedido(consulta, historico_conversa)
+    chave_em_cache = chave_cache(consulta, memoria, nivel, historico_conversa)
+    if chave_em_cache:
+        resposta = obter_cache_respostas().obter(chave_em_cache)
+        if resposta:
+            yield resposta
+            return
+
+    msgs = montar_mensagens(memoria, consulta, user_name, historico_conversa, resumo)
+    chave = chave_geracao(consulta, memoria, msgs, nivel)
 
+    fluxo = obter_servico_geracao().transmitir(
+        chave, OPENROUTER_KEY, msgs, modelos, cancelar=cancelar, espera=INTERVALO_PARAR
+    )
+    recebeu = False
+    partes = []
+    try:
+        for pedaco in fluxo:
+            if not pedaco:
+                yield pedaco
+                continue
+            recebeu = True
+            partes.append(pedaco)
+            yield pedaco
     except Exception as e:
-        return f"⚠️ Erro ao gerar resposta: {str(e)}"
+        if recebeu:
+            raise
+        yield resposta_contingencia(consulta, chave_em_cache, e)
+    else:
+        if cancelar is not None and cancelar.is_set():
+            return
+        if not recebeu:
+            yield "⚠️ A resposta da IA veio vazia ou incompleta."
+        guardar_no_cache(chave_em_cache, "".join(partes).strip(), user_name)
+    finally:
+        # Fecha a conexão também quando a geração é cancelada
+        fluxo.close()
+
+def resumo_da_conversa():
+    """Resumo do chat atual; adota o que terminou de ser gerado em segundo plano"""
+    pendente = st.session_state.get("resumo_pendente")
+    if pendente and pendente["futuro"].done():
+        del st.session_state["resumo_pendente"]
+        chat_id = st.session_state.get("current_chat_id")
+        if pendente["chat_id"] == chat_id:
+            try:
+                # O futuro traz a posição absoluta no chat
+                st.session_state.resumo_chat = resumo_relativo(
+                    pendente["futuro"].result(), st.session_state.get("inicio_mensagens", {}).get(chat_id, 0)
+                )
+            except Exception:
+                pass
+    return st.session_state.get("resumo_chat")
+
+def atualizar_resumo_conversa():
+    """Atualiza o resumo em segundo plano quando há mensagens antigas suficientes"""
+    if st.session_state.get("resumo_pendente") or "current_chat_id" not in st.session_state:
+        return
+    historico = st.session_state.get("messages", [])
+    resumo = resumo_da_conversa() or {}
+    trecho = trecho_para_resumir(historico, resumo)
+    if trecho is None:
+        return
+
+    inicio, fim = trecho
+    user_id = st.session_state.get("user_id")
+    chat_id = st.session_state.current_chat_id
+    # No banco ate_indice conta desde a primeira mensagem do chat, não do que foi carregado
+    deslocamento = st.session_state.get("inicio_mensagens", {}).get(chat_id, 0)
+    geracao = obter_servico_geracao().completar(
+        ("resumo", user_id, chat_id, fim), OPENROUTER_KEY,
+        mensagens_resumo(resumo.get("texto"), historico[inicio:fim]),
+        obter_roteador().cadeia("padrao")
+    )
+    fila = obter_fila_persistencia()
+    futuro = Future()
+
+    def concluir(geracao):
+        try:
+            texto = geracao.result()
+            if not texto.strip():
+                raise ValueError("resumo vazio")
+            atualizado = novo_resumo(texto, deslocamento + fim)
+            if user_id:
+                fila.enfileirar({f"logs/usuarios/{user_id}/chats/{chat_id}/resumo": atualizado})
+            futuro.set_result(atualizado)
+        except Exception as e:
+            logger.warning("Erro ao atualizar o resumo do chat %s: %s", chat_id, e)
+            futuro.set_exception(e)
+
+    geracao.add_done_callback(concluir)
+    st.session_state.resumo_pendente = {"chat_id": chat_id, "futuro": futuro}
 
 # --- Componentes da UI ---
 def render_header():
@@ -1027,6 +1388,8 @@ def render_login_sidebar():
 
                 new_chat_id = str(uuid.uuid4())
                 st.session_state.current_chat_id = new_chat_id
+                st.session_state.pop("resumo_chat", None)
+                st.session_state.pop("resumo_pendente", None)
                 st.session_state.messages = [{
                     "sender": "bot",
                     "text": "Olá! Sou o SantChat, IA oficial do Santander. Estou agora com você para o que precisar, me conta como posso te apoiar hoje?"
@@ -1036,25 +1399,33 @@ def render_login_sidebar():
             st.markdown('<div class="chat-history">', unsafe_allow_html=True)
             st.markdown('<div class="sidebar-title">Histórico de Chats</div>', unsafe_allow_html=True)
 
-            chats = carregar_historico_chats(st.session_state.user_id)
+            # Primeira página relida a cada rerun; as seguintes ficam na sessão
+            # até o usuário pedir mais
+            chats, cursor = carregar_historico_chats(st.session_state.user_id, CHATS_POR_PAGINA)
+            anteriores = st.session_state.get("chats_anteriores")
+            if anteriores:
+                vistos = {chat_id for chat_id, _ in chats}
+                chats += [(chat_id, dados) for chat_id, dados in anteriores["itens"] if chat_id not in vistos]
+                cursor = anteriores["cursor"]
             if chats:
-                # Ordenar os chats por data (mais recentes primeiro)
-                chats_ordenados = sorted(
-                    chats.items(),
-                    key=lambda item: item[1].get("ultima_atualizacao", ""),
-                    reverse=True
-                )
-
-                for chat_id, chat_data in chats_ordenados:
+                for chat_id, chat_data in chats:
                     if st.button(
                         chat_data.get("titulo", "Chat sem título"),
                         key=f"chat_{chat_id}",
                         help=f"Última atualização: {chat_data.get('ultima_atualizacao', '')}",
                         use_container_width=True
                     ):
-                        st.session_state.current_chat_id = chat_id
-                        st.session_state.messages = chat_data.get("mensagens", [])
-                        st.rerun()
+                        chat = carregar_chat(st.session_state.user_id, chat_id, chat_data.get("total_mensagens"))
+                        if chat is not None:
+                            abrir_chat(chat_id, chat)
+                            st.rerun()
+                if cursor and st.button("Carregar mais", key="mais_chats_btn", use_container_width=True):
+                    mais, proximo = carregar_historico_chats(st.session_state.user_id, CHATS_POR_PAGINA, cursor)
+                    st.session_state.chats_anteriores = {
+                        "itens": (anteriores["itens"] if anteriores else []) + mais,
+                        "cursor": proximo
+                    }
+                    st.rerun()
             else:
                 st.markdown('<div style="color: #999; font-size: 0.9rem;">Nenhum chat anterior</div>', unsafe_allow_html=True)
 
@@ -1071,7 +1442,7 @@ def render_login_sidebar():
 
         menu_itens = ["Chat"]
         if int(st.session_state.get("user_data", {}).get("nivel", 0)) == -8:
-            menu_itens += ["Memória IA", "Feedbacks", "Treinar IA", "Gerenciar Correções"]    # Adicione privilegios para dev
+            menu_itens += ["Memória IA", "Feedbacks", "Treinar IA", "Gerenciar Correções", "Roteamento IA"]    # Adicione privilegios para dev
 
         choice = st.radio("Navegação", menu_itens, label_visibility="collapsed")
 
@@ -1104,6 +1475,21 @@ def render_memoria_ia():
     else:
         st.info("Nenhuma informação na memória ainda.")
 
+    with st.expander("Cache de respostas"):
+        cache = obter_cache_respostas()
+        metricas = cache.metricas
+        tamanho = cache.tamanho()
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Taxa de acerto", f"{cache.taxa_acerto():.0%}")
+        col2.metric("Em memória", tamanho["memoria"])
+        col3.metric("Em disco", tamanho["disco"])
+        st.caption(
+            f"Acertos: {metricas['acertos_memoria']} em memória, {metricas['acertos_disco']} em disco · "
+            f"Faltas: {metricas['faltas']} · Expiradas: {metricas['expiradas']} · "
+            f"Removidas por espaço: {metricas['remocoes_memoria']} em memória, {metricas['remocoes_disco']} em disco · "
+            f"Invalidadas pela memória: {metricas['invalidadas']} · "
+            f"Servidas vencidas com a IA fora do ar: {metricas['servidas_expiradas']}"
+        )
     
     st.subheader("Adicionar à Memória")
     nova_info = st.text_area("Nova informação para a memória")
@@ -1114,91 +1500,158 @@ def render_memoria_ia():
         else:
             st.error("Erro ao salvar na memória")
 
+def render_roteamento_ia():
+    st.markdown("<div style='height: 80px;'></div>", unsafe_allow_html=True)
+    st.subheader("🧭 Roteamento de Modelos")
+
+    roteador = obter_roteador()
+    servico = obter_servico_geracao()
+
+    st.markdown("**Tabela de roteamento** (do mais barato ao mais caro em cada nível)")
+    for nivel, modelos in roteador.tabela().items():
+        st.markdown(f"*{nivel}*")
+        st.dataframe(modelos, use_container_width=True, hide_index=True)
+
+    st.markdown("**Estatísticas observadas**")
+    estatisticas = servico.metricas_modelos.resumo()
+    if estatisticas:
+        linhas = []
+        for modelo, dados in estatisticas.items():
+            linhas.append({
+                "modelo": modelo,
+                "qualidade": roteador.catalogo.get(modelo, "-"),
+                "TTFT EWMA (ms)": round(dados["ewma_ttft_ms"]) if dados["ewma_ttft_ms"] else None,
+                "total EWMA (ms)": round(dados["ewma_total_ms"]) if dados["ewma_total_ms"] else None,
+                "erro EWMA": f"{dados['ewma_erro']:.0%}",
+                "vazão (car/s)": round(dados["ewma_vazao"]) if dados["ewma_vazao"] else None,
+                "TTFT p50/p99 (ms)": f"{dados['ttft_p50_ms'] or '-'} / {dados['ttft_p99_ms'] or '-'}",
+                "limiar hedge (s)": round(dados["limiar_hedge_s"], 1),
+                "sucessos": dados["sucessos"],
+                "erros": dados["erros"],
+                "hedges": dados["hedges"],
+                "vitórias": dados["vitorias"],
+            })
+        st.dataframe(linhas, use_container_width=True, hide_index=True)
+    else:
+        st.info("Nenhuma chamada aos modelos desde que o servidor subiu.")
+    st.caption(f"Serviço de geração: {servico.estatisticas}")
+
+    st.markdown("**Disjuntores**")
+    disjuntores = servico.disjuntores.estado()
+    if disjuntores:
+        st.dataframe(
+            [{"modelo": modelo, **dados} for modelo, dados in disjuntores.items()],
+            use_container_width=True, hide_index=True
+        )
+    else:
+        st.info("Nenhum disjuntor acionado ainda.")
+
+    st.markdown("**Testar classificação**")
+    pergunta_teste = st.text_input("Pergunta de exemplo", key="roteamento_teste")
+    if pergunta_teste:
+        nivel, cadeia = roteador.rotear(ConsultaNormalizada(pergunta_teste))
+        st.write(f"Nível: **{nivel}** · Cadeia: {' → '.join(cadeia)}")
+
+def carregar_feedbacks(tamanho, cursor=None, user_id=None, tipo=None):
+    """Uma página de feedbacks (mais novos primeiro), o cursor da próxima e o total do filtro"""
+    no = no_feedbacks(user_id, tipo)
+    pagina, proximo = pagina_por_chave(referencia(no), tamanho, decodificar_cursor(cursor, no))
+    total = referencia(caminho_contador(no)).get() or 0
+    feedbacks = [dict(feedback, id=push_id) for push_id, feedback in pagina]
+    return feedbacks, (codificar_cursor(no, proximo) if proximo else None), total
+
 def render_feedbacks():
     st.markdown("<div style='height: 80px;'></div>", unsafe_allow_html=True)
-    st.subheader("📊 Feedbacks dos Usuários (Últimos 50)")
+    st.subheader("📊 Feedbacks dos Usuários")
     
-    try:  # Este try deve estar alinhado com o início da função
-        ref = db.reference("logs/feedbacks")
-        feedbacks = ref.get()
-        
+    try:
+        # Filtros
+        st.sidebar.subheader("Filtros")
+        filtro_tipo = st.sidebar.selectbox("Tipo de Feedback", ["Todos"] + list(ROTULOS.values()))
+        filtro_usuario = st.sidebar.text_input("Filtrar por ID de Usuário").strip().lower()
+
+        # Cursores das páginas já vistas; mudar o filtro volta para a primeira
+        filtros = (filtro_tipo, filtro_usuario)
+        if st.session_state.get("feedbacks_filtros") != filtros:
+            st.session_state.feedbacks_filtros = filtros
+            st.session_state.feedbacks_cursores = [None]
+        cursores = st.session_state.feedbacks_cursores
+
+        feedbacks, proximo, total = carregar_feedbacks(
+            FEEDBACKS_POR_PAGINA, cursores[-1], filtro_usuario or None, normalizar_tipo(filtro_tipo)
+        )
+
         if not feedbacks:
             st.info("Nenhum feedback encontrado no banco de dados")
             return
-        
-        # Cria lista plana de todos os feedbacks
-        todos_feedbacks = []
-        for user_id, user_data in feedbacks.items():
-            for timestamp, feedback in user_data.items():
-                feedback['user_id'] = user_id
-                feedback['timestamp'] = timestamp
-                todos_feedbacks.append(feedback)
-        
-        # Ordena por timestamp (mais recente primeiro)
-        todos_feedbacks.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-        
-        # Filtros
-        st.sidebar.subheader("Filtros")
-        filtro_tipo = st.sidebar.selectbox("Tipo de Feedback", ["Todos", "Positivo", "Negativo"])
-        filtro_usuario = st.sidebar.text_input("Filtrar por ID de Usuário")
-        
-        # Aplica filtros
-        if filtro_tipo != "Todos":
-            todos_feedbacks = [f for f in todos_feedbacks 
-                              if f.get('tipo_feedback', '').lower() == filtro_tipo.lower()]
-        
-        if filtro_usuario:
-            todos_feedbacks = [f for f in todos_feedbacks if filtro_usuario.lower() in f.get('user_id', '').lower()]
-
-        # Paginação
-        items_por_pagina = 10
-        pagina = st.sidebar.number_input('Página', min_value=1, 
-                                       max_value=(len(todos_feedbacks)//items_por_pagina + 1), 
-                                       value=1)
-        inicio = (pagina - 1) * items_por_pagina
-        fim = inicio + items_por_pagina
-
-        # Mostra os feedbacks paginados
-        for feedback in todos_feedbacks[inicio:fim]:
+
+        paginas = max(-(-total // FEEDBACKS_POR_PAGINA), len(cursores))
+        col_anterior, col_pagina, col_proxima = st.columns([1, 2, 1])
+        with col_anterior:
+            if len(cursores) > 1 and st.button("⬅️ Anterior", key="feedbacks_anterior"):
+                cursores.pop()
+                st.rerun()
+        with col_pagina:
+            st.caption(f"Página {len(cursores)} de {paginas} ({total} feedbacks)")
+        with col_proxima:
+            if proximo and st.button("Próxima ➡️", key="feedbacks_proxima"):
+                cursores.append(proximo)
+                st.rerun()
+
+        # Mostra os feedbacks da página
+        for feedback in feedbacks:
             with st.expander(f"Feedback de {feedback.get('user_id', '')} - {feedback.get('timestamp', '')}"):
-                st.write(f"**Tipo:** {feedback.get('tipo_feedback', '')}")
+                tipo = feedback.get('tipo_feedback', '')
+                st.write(f"**Tipo:** {ROTULOS.get(tipo, tipo)}")
                 st.write(f"**Pergunta:** {feedback.get('pergunta', '')}")
                 st.write(f"**Resposta:** {feedback.get('resposta', '')}")
                 st.write(f"**Data:** {feedback.get('timestamp', '')}")
                 
-    except Exception as e:  # Este except deve estar alinhado com o try
+    except Exception as e:
         st.error(f"Erro ao carregar feedbacks: {str(e)}")
-        if 'feedbacks' in locals():
-            st.write("Estrutura atual dos feedbacks:", feedbacks)
 
 def render_treinar_ia():
     st.markdown("<div style='height: 80px;'></div>", unsafe_allow_html=True)
     st.subheader("📚 Treinar IA - Revisão de Respostas")
     
+    # Filtros
+    st.sidebar.subheader("Filtros")
+    filtro_usuario = st.sidebar.text_input("Filtrar por usuário").strip().lower()
+    filtro_data = st.sidebar.date_input("Filtrar por data")
+
+    # Cursores das páginas já vistas; mudar o filtro volta para a primeira
+    filtros = (filtro_usuario, filtro_data)
+    if st.session_state.get("treinar_filtros") != filtros:
+        st.session_state.treinar_filtros = filtros
+        st.session_state.treinar_cursores = [None]
+    cursores = st.session_state.treinar_cursores
+
     with st.spinner("Carregando interações..."):
-        interacoes = carregar_interacoes()
+        interacoes, proximo = carregar_interacoes(
+            INTERACOES_POR_PAGINA, cursores[-1], filtro_usuario or None, filtro_data or None
+        )
     
     if not interacoes:
         st.warning("Nenhuma interação encontrada para revisão")
         return
-    
-    # Filtros
-    st.sidebar.subheader("Filtros")
-    filtro_usuario = st.sidebar.text_input("Filtrar por usuário")
-    filtro_data = st.sidebar.date_input("Filtrar por data")
-    
-    # Aplica filtros
-    if filtro_usuario:
-        interacoes = [i for i in interacoes if filtro_usuario.lower() in i['user'].lower()]
-    
-    if filtro_data:
-        interacoes = [i for i in interacoes if 
-                     datetime.strptime(i['timestamp'].split('T')[0], "%Y-%m-%d").date() == filtro_data]
+
+    col_anterior, col_pagina, col_proxima = st.columns([1, 2, 1])
+    with col_anterior:
+        if len(cursores) > 1 and st.button("⬅️ Mais novas"):
+            cursores.pop()
+            st.rerun()
+    with col_pagina:
+        st.caption(f"Página {len(cursores)}")
+    with col_proxima:
+        if proximo and st.button("Mais antigas ➡️"):
+            cursores.append(proximo)
+            st.rerun()
     
     # Mostra as interações
-    for idx, interacao in enumerate(interacoes[:50]):
+    for posicao, interacao in enumerate(interacoes):
+        idx = interacao["id"]
         status_cor = "🟢" if interacao.get('status') == "aprovado" else "✏️"
-        with st.expander(f"{status_cor} Interação {idx+1} - {interacao['user']} ({interacao['timestamp']})"):
+        with st.expander(f"{status_cor} Interação {(len(cursores) - 1) * INTERACOES_POR_PAGINA + posicao + 1} - {interacao['user']} ({interacao['timestamp']})"):
             st.markdown(f"""
             **❓ Pergunta:**  
             {interacao['pergunta']}
@@ -1257,6 +1710,70 @@ def compensar_header_fixo():
     st.markdown("<div style='height: 80px;'></div>", unsafe_allow_html=True)
 
 
+def transmitir_resposta_chat(prompt):
+    """Mostra a resposta da IA à medida que chega e salva no histórico.
+
+    Clicar em "Parar" reinicia o script, o que o Streamlit só percebe na
+    próxima chamada st.*: por isso a leitura devolve um pedaço vazio a cada
+    INTERVALO_PARAR segundos sem token (até antes do primeiro), e o loop
+    redesenha a área da resposta. A interrupção cai no finally, que aciona o
+    evento de cancelamento da sessão e guarda o que já tinha chegado, assim
+    como quando o stream cai.
+    """
+    user_name = st.session_state.get("user_data", {}).get("nome_usuario")
+    st.markdown(f'<div class="user-msg">{prompt}</div>', unsafe_allow_html=True)
+    cancelar = st.session_state.cancelar_geracao = threading.Event()
+    st.button("⏹️ Parar", key="parar_geracao", on_click=cancelar.set)
+    area_resposta = st.empty()
+
+    fluxo = gerar_resposta_stream(
+        st.session_state.get("memoria", []),
+        prompt,
+        user_name,
+        st.session_state.messages,
+        resumo_da_conversa(),
+        cancelar=cancelar
+    )
+    partes = []
+    desfecho = "cancelada"
+    ultimo_desenho = 0
+    try:
+        for pedaco in fluxo:
+            partes.append(pedaco)
+            # Redesenha no máximo a cada 50ms para não reconverter o Markdown a
+            # cada token; pedaço vazio (IA em silêncio) redesenha sempre
+            if not pedaco or time.monotonic() - ultimo_desenho >= 0.05:
+                area_resposta.markdown(f'<div class="bot-msg">{markdown("".join(partes))} ▌</div>', unsafe_allow_html=True)
+                ultimo_desenho = time.monotonic()
+        if not cancelar.is_set():
+            desfecho = "completa"
+    except Exception as e:
+        desfecho = "interrompida"
+        erro = str(e)
+    finally:
+        cancelar.set()
+        fluxo.close()
+        mensagem = {"sender": "bot", "text": "".join(partes)}
+        if desfecho == "cancelada":
+            mensagem["text"] += "\n\n_(geração interrompida pelo usuário)_"
+            mensagem["parcial"] = True
+        elif desfecho == "interrompida":
+            mensagem["text"] += f"\n\n⚠️ _A resposta foi interrompida: {erro}_"
+            mensagem["parcial"] = True
+        st.session_state.messages.append(mensagem)
+
+        # Salva o chat, inclusive com a resposta parcial
+        if "current_chat_id" in st.session_state and "user_id" in st.session_state:
+            salvar_historico_chat(
+                st.session_state.user_id,
+                st.session_state.current_chat_id,
+                st.session_state.messages
+            )
+        atualizar_resumo_conversa()
+
+    st.rerun()
+
+
 def render_chat_interface():
     st.markdown(f"""
     <div class="main-container">
@@ -1278,6 +1795,13 @@ def render_chat_interface():
                 }
             ]
 
+        # Chat aberto só com os últimos blocos: os anteriores sob demanda
+        chat_atual = st.session_state.get("current_chat_id")
+        if st.session_state.get("inicio_mensagens", {}).get(chat_atual) and st.session_state.get("user_id"):
+            if st.button("Carregar mensagens anteriores", key="mensagens_anteriores_btn", use_container_width=True):
+                carregar_mensagens_anteriores(st.session_state.user_id, chat_atual)
+                st.rerun()
+
         # Exibir todas as mensagens
         for idx, message in enumerate(st.session_state.messages):
             if message["sender"] == "user":
@@ -1322,6 +1846,7 @@ def render_chat_interface():
         st.markdown('</div>', unsafe_allow_html=True)
 
     # Input do usuário
+    streaming = st.secrets.get("STREAMING_RESPOSTAS", True)
     with st.form(key="message_form", clear_on_submit=True):
         user_input = st.text_area(
             "Digite sua mensagem:",
@@ -1358,14 +1883,16 @@ def render_chat_interface():
             # Adiciona mensagem do usuário
             st.session_state.messages.append({"sender": "user", "text": user_input})
 
-            # Gera resposta da IA
-            user_name = user_data.get("nome_usuario")
+        # Sem streaming: gera a resposta inteira de uma vez
+        if submit_button and user_input and not streaming:
+            user_name = st.session_state.get("user_data", {}).get("nome_usuario")
             with st.spinner("Gerando resposta..."):
                 resposta = gerar_resposta(
                     st.session_state.get("memoria", []),
                     user_input,
                     user_name,
-                    st.session_state.messages
+                    st.session_state.messages,
+                    resumo_da_conversa()
                 )
 
             # Adiciona resposta do bot
@@ -1378,11 +1905,17 @@ def render_chat_interface():
                     st.session_state.current_chat_id,
                     st.session_state.messages
                 )
+            atualizar_resumo_conversa()
 
             st.rerun()
 
             st.markdown("</div>", unsafe_allow_html=True)
 
+    # Com streaming, a geração fica fora do form (o botão de parar não pode
+    # estar dentro dele)
+    if submit_button and user_input and streaming:
+        transmitir_resposta_chat(user_input)
+
 
         
 
@@ -1415,19 +1948,18 @@ def aplicar_estilo_customizado():
 # --- Função Principal ---
 def main():
     try:
-        initialize_firebase()
         # Testa a conexão
-        db.reference("test_connection").get()
+        referencia("test_connection").get()
     except Exception as e:
-        st.error(f"Erro ao conectar ao Firebase: {str(e)}")
+        st.error(f"Erro ao conectar ao banco: {str(e)}")
         st.stop()
         
     # Adicione temporariamente  para debug
-    #st.write("Estrutura do Firebase:", db.reference("logs").get())
+    #st.write("Estrutura do Firebase:", referencia("logs").get())
     
     # Carregar configurações
     load_css()
-    initialize_firebase()
+    obter_armazenamento()
     aplicar_estilo_customizado()
 
     
@@ -1437,6 +1969,15 @@ def main():
     openai.api_key = OPENROUTER_KEY
     openai.base_url = "https://openrouter.ai/api/v1"
 
+    # Pool de conexões compartilhado com a OpenRouter (só muda se o secret mudar)
+    configurar_http(
+        pool_tamanho=st.secrets.get("HTTP_POOL_TAMANHO"),
+        timeout_conexao=st.secrets.get("HTTP_TIMEOUT_CONEXAO"),
+        timeout_leitura=st.secrets.get("HTTP_TIMEOUT_LEITURA")
+    )
+    # Compressão do texto das mensagens longas ("nenhum", "zlib" ou "zstd")
+    configurar_codec(st.secrets.get("CODEC_MENSAGENS", "nenhum"))
+
     # Inicialização do estado da sessão
     if "user_type" not in st.session_state:
         st.session_state.update({
@@ -1471,6 +2012,8 @@ def main():
         # Mostra aviso se for visitante
         if st.session_state.get("user_type") == "guest":
             st.info("👤 Você está como visitante — suas conversas não serão salvas.", icon="⚠️")
+    elif choice == "Roteamento IA" and st.session_state.get("user_data", {}).get("nivel") == -8:
+        render_roteamento_ia()
 
 
 
@@ -0,0 +1,140 @@
+"""Onde os dados ficam: Firebase, memória ou SQLite local.
+
+O app todo fala com o banco pela interface de referências do
+firebase_admin.db (reference(), child(), get(), set(), update(),
+transaction(), listen(), consultas), então trocar de armazenamento é trocar
+quem devolve essas referências:
+
+- "firebase": o Realtime Database de verdade;
+- "memoria": o BancoFake (firebase_fake), some quando o processo acaba;
+- "sqlite": a mesma árvore num arquivo SQLite em modo WAL, para rodar o app,
+  os índices e os benchmarks numa máquina sem rede.
+
+No SQLite cada folha da árvore é uma linha (caminho, valor em JSON), com o
+caminho como chave primária: ler ou apagar um nó é uma varredura de faixa
+no índice (caminho = 'a/b' ou 'a/b/' < caminho < 'a/b0'). listen() só
+enxerga as escritas do próprio processo.
+"""
+import json
+import os
+import sqlite3
+
+from firebase_fake import BancoFake
+
+TIPOS = ("firebase", "memoria", "sqlite")
+
+
+class ArmazenamentoFirebase:
+    """Realtime Database via firebase_admin; `credenciais` é o caminho do JSON ou o dict"""
+
+    def __init__(self, credenciais=None, url=None):
+        import firebase_admin
+        from firebase_admin import credentials, db
+
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(credentials.Certificate(credenciais), {"databaseURL": url})
+        self._db = db
+
+    def reference(self, caminho="/"):
+        return self._db.reference(caminho)
+
+
+class ArmazenamentoMemoria(BancoFake):
+    """Tudo em memória, no processo"""
+
+
+def _faixa(caminho):
+    """Linhas do nó `caminho` (ele mesmo, se for folha, e os descendentes)"""
+    if not caminho:
+        return "1 = 1", ()
+    return "(caminho = ? OR (caminho > ? AND caminho < ?))", (caminho, caminho + "/", caminho + "0")
+
+
+def _folhas(prefixo, valor):
+    if isinstance(valor, dict):
+        for chave, filho in valor.items():
+            yield from _folhas(f"{prefixo}/{chave}" if prefixo else chave, filho)
+    else:
+        yield prefixo, json.dumps(valor, ensure_ascii=False)
+
+
+class ArmazenamentoSQLite(BancoFake):
+    """A árvore do Realtime Database num arquivo SQLite (WAL), uma linha por folha"""
+
+    def __init__(self, caminho="dados/santchat.sqlite3", dados=None):
+        super().__init__()
+        if os.path.dirname(caminho):
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute("PRAGMA synchronous=NORMAL")
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS nos (caminho TEXT PRIMARY KEY, valor TEXT NOT NULL) WITHOUT ROWID"
+        )
+        if dados:
+            self._set([], dados)
+
+    def _ler(self, segmentos):
+        caminho = "/".join(segmentos)
+        condicao, parametros = _faixa(caminho)
+        linhas = self._conexao.execute(f"SELECT caminho, valor FROM nos WHERE {condicao}", parametros).fetchall()
+        raiz = None
+        for linha, valor in linhas:
+            relativo = linha[len(caminho):].lstrip("/")
+            if not relativo:
+                return json.loads(valor)
+            if raiz is None:
+                raiz = {}
+            no = raiz
+            partes = relativo.split("/")
+            for parte in partes[:-1]:
+                no = no.setdefault(parte, {})
+            no[partes[-1]] = json.loads(valor)
+        return raiz
+
+    def _escrever(self, segmentos, valor):
+        caminho = "/".join(segmentos)
+        condicao, parametros = _faixa(caminho)
+        self._conexao.execute(f"DELETE FROM nos WHERE {condicao}", parametros)
+        # Escrever dentro de uma folha a transforma em nó
+        ancestrais = ["/".join(segmentos[:i]) for i in range(1, len(segmentos))]
+        if ancestrais:
+            self._conexao.execute(
+                f"DELETE FROM nos WHERE caminho IN ({','.join('?' * len(ancestrais))})", ancestrais
+            )
+        if valor is not None:
+            self._conexao.executemany("INSERT INTO nos (caminho, valor) VALUES (?, ?)", _folhas(caminho, valor))
+
+    # Cada set()/update() é uma transação do SQLite
+    def _set(self, segmentos, valor):
+        with self._lock:
+            self._conexao.execute("BEGIN")
+            try:
+                super()._set(segmentos, valor)
+            except BaseException:
+                self._conexao.execute("ROLLBACK")
+                raise
+            self._conexao.execute("COMMIT")
+
+    def _update(self, segmentos, valores):
+        with self._lock:
+            self._conexao.execute("BEGIN")
+            try:
+                super()._update(segmentos, valores)
+            except BaseException:
+                self._conexao.execute("ROLLBACK")
+                raise
+            self._conexao.execute("COMMIT")
+
+    def fechar(self):
+        self._conexao.close()
+
+
+def criar_armazenamento(tipo="firebase", credenciais=None, url=None, caminho="dados/santchat.sqlite3", dados=None):
+    if tipo == "firebase":
+        return ArmazenamentoFirebase(credenciais, url)
+    if tipo == "memoria":
+        return ArmazenamentoMemoria(dados)
+    if tipo == "sqlite":
+        return ArmazenamentoSQLite(caminho, dados)
+    raise ValueError(f"Armazenamento desconhecido: {tipo} (use {', '.join(TIPOS)})")
@@ -0,0 +1,329 @@
+"""Micro-benchmarks que rodam sem rede, contra servidores locais.
+
+Uso:
+    python benchmarks.py http [--requisicoes 300] [--threads 8]
+    python benchmarks.py codec [--mensagens 400] [--repeticoes 20]
+    python benchmarks.py armazenamento [--operacoes 200] [--credenciais firebase_key.json --url https://...]
+"""
+import argparse
+import json
+import random
+import socket
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _HandlerOpenRouter(BaseHTTPRequestHandler):
+    # HTTP/1.1 para o servidor manter a conexão aberta entre requisições
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        # Como um servidor de verdade: sem Nagle, senão o keep-alive esbarra no
+        # ACK atrasado (~40ms) entre o envio dos headers e o do corpo
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _escrever_pedaco(self, dados):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(dados), dados))
+        self.wfile.flush()
+
+    def do_POST(self):
+        corpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])) or b"{}")
+        servidor = self.server
+        if servidor.atraso:
+            time.sleep(servidor.atraso)
+
+        if not corpo.get("stream"):
+            saida = json.dumps({"choices": [{"message": {"content": servidor.resposta}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(saida)))
+            self.end_headers()
+            self.wfile.write(saida)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            self._escrever_pedaco(b": OPENROUTER PROCESSING\n\n")
+            for palavra in servidor.resposta.split(" "):
+                evento = {"choices": [{"delta": {"content": palavra + " "}}]}
+                self._escrever_pedaco(f"data: {json.dumps(evento)}\n\n".encode())
+                if servidor.atraso_token:
+                    time.sleep(servidor.atraso_token)
+            self._escrever_pedaco(b"data: [DONE]\n\n")
+            self._escrever_pedaco(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # Cliente cancelou a geração
+            self.close_connection = True
+
+
+class ServidorOpenRouterFalso(ThreadingHTTPServer):
+    """Servidor local com a mesma forma de resposta do /chat/completions"""
+
+    daemon_threads = True
+
+    def __init__(self, resposta="Olá! Sou o SantChat.", atraso=0.0, atraso_token=0.0):
+        super().__init__(("127.0.0.1", 0), _HandlerOpenRouter)
+        self.resposta = resposta
+        self.atraso = atraso
+        self.atraso_token = atraso_token
+        self.conexoes = 0
+
+    def get_request(self):
+        conexao = super().get_request()
+        self.conexoes += 1
+        return conexao
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/api/v1/chat/completions"
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+def _medir(funcao, requisicoes, threads):
+    tempos = []
+
+    def uma():
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+
+    inicio = time.perf_counter()
+    if threads == 1:
+        for _ in range(requisicoes):
+            uma()
+    else:
+        with ThreadPoolExecutor(threads) as executor:
+            list(executor.map(lambda _: uma(), range(requisicoes)))
+    total = time.perf_counter() - inicio
+    return {
+        "media_ms": statistics.mean(tempos),
+        "p50_ms": statistics.median(tempos),
+        "p95_ms": sorted(tempos)[int(len(tempos) * 0.95) - 1],
+        "req_s": requisicoes / total,
+    }
+
+
+def benchmark_http(requisicoes=300, threads=8):
+    """Conexão nova por requisição (requests.post) x pool compartilhado.
+
+    Localmente só o handshake TCP é economizado; contra a OpenRouter o pool
+    também evita o handshake TLS, então a diferença real é maior.
+    """
+    import requests
+    import cliente_llm
+
+    corpo = {"model": cliente_llm.MODELO_PADRAO, "messages": [{"role": "user", "content": "oi"}]}
+    resultados = {}
+    with ServidorOpenRouterFalso() as servidor:
+        for paralelas in (1, threads):
+            servidor.conexoes = 0
+            resultados[("requests.post", paralelas)] = _medir(
+                lambda: requests.post(servidor.url, json=corpo, timeout=5).json(),
+                requisicoes, paralelas
+            )
+            resultados[("requests.post", paralelas)]["conexoes"] = servidor.conexoes
+
+            servidor.conexoes = 0
+            cliente_llm.configurar_http(pool_tamanho=max(threads, 1))
+            resultados[("pool", paralelas)] = _medir(
+                lambda: cliente_llm.obter_sessao().post(servidor.url, json=corpo, timeout=5).json(),
+                requisicoes, paralelas
+            )
+            resultados[("pool", paralelas)]["conexoes"] = servidor.conexoes
+
+    print(f"{'cliente':<15}{'threads':>8}{'média ms':>10}{'p50 ms':>9}{'p95 ms':>9}{'req/s':>9}{'conexões':>10}")
+    for (cliente, paralelas), r in resultados.items():
+        print(f"{cliente:<15}{paralelas:>8}{r['media_ms']:>10.2f}{r['p50_ms']:>9.2f}"
+              f"{r['p95_ms']:>9.2f}{r['req_s']:>9.0f}{r['conexoes']:>10}")
+    for paralelas in (1, threads):
+        economia = resultados[("requests.post", paralelas)]["media_ms"] - resultados[("pool", paralelas)]["media_ms"]
+        print(f"Economia por requisição com {paralelas} thread(s): {economia:.2f} ms")
+    return resultados
+
+
+_FRASES = [
+    "Para contratar o empréstimo pessoal, acesse o app do Santander e vá em Crédito.",
+    "A taxa de juros depende do seu perfil e do prazo escolhido, que pode chegar a 60 meses.",
+    "Você pode simular as parcelas antes de confirmar, sem compromisso.",
+    "O valor cai na conta corrente em até um dia útil depois da aprovação.",
+    "Se preferir, um gerente pode te atender pelo WhatsApp ou na agência.",
+    "**Importante:** confira o Custo Efetivo Total (CET) antes de assinar o contrato.",
+    "- Cartão de crédito: anuidade zero com gastos a partir de R$ 100 por mês;",
+    "- Pix: transferências gratuitas e na hora, 24 horas por dia;",
+    "Para antecipar parcelas, use a opção Amortizar no detalhe do contrato.",
+    "Em caso de dúvida sobre cobranças, o prazo de contestação é de 90 dias.",
+    "Vamos comparar as duas opções considerando o valor total pago ao final do período.",
+    "Na primeira, a parcela é menor, mas o prazo maior aumenta o total de juros.",
+]
+
+
+def _transcricao(mensagens, semente=1):
+    """Chat sintético: perguntas curtas e respostas longas, como as do modelo de raciocínio"""
+    aleatorio = random.Random(semente)
+    historico = []
+    for i in range(mensagens):
+        if i % 2 == 0:
+            historico.append({"sender": "user", "text": aleatorio.choice(_FRASES)[:60] + "?"})
+        else:
+            paragrafos = [" ".join(aleatorio.choices(_FRASES, k=aleatorio.randint(3, 8)))
+                          for _ in range(aleatorio.randint(1, 6))]
+            historico.append({"sender": "bot", "text": "\n\n".join(paragrafos)})
+    return historico
+
+
+def benchmark_codec(mensagens=400, repeticoes=20):
+    """Bytes trafegados e tempo de decodificação do nó `mensagens` de um chat longo.
+
+    Compara o formato atual (texto puro) com zlib e zstd (se o pacote
+    zstandard estiver instalado), lendo o chat inteiro e só o último bloco,
+    que é o que vem ao abrir um chat.
+    """
+    import codec_mensagens
+    from mensagens_chat import TAMANHO_BLOCO, chave_mensagem, ler_mensagens
+
+    historico = _transcricao(mensagens)
+    codecs = ["nenhum", "zlib"] + (["zstd"] if codec_mensagens.zstandard is not None else [])
+    resultados = {}
+    for codec in codecs:
+        no = {chave_mensagem(i): codec_mensagens.codificar_mensagem(msg, codec) for i, msg in enumerate(historico)}
+        bloco = {chave: msg for chave, msg in no.items() if chave >= chave_mensagem(mensagens - TAMANHO_BLOCO)}
+        json_completo = json.dumps(no, ensure_ascii=False).encode("utf-8")
+        json_bloco = json.dumps(bloco, ensure_ascii=False).encode("utf-8")
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            lidas = ler_mensagens(json.loads(json_completo))
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        assert lidas == historico
+        resultados[codec] = {
+            "bytes_chat": len(json_completo),
+            "bytes_bloco": len(json_bloco),
+            "decodificar_ms": statistics.median(tempos),
+        }
+
+    base = resultados["nenhum"]["bytes_chat"]
+    print(f"{mensagens} mensagens, {len(json.dumps(historico, ensure_ascii=False)) // 1024} KiB de texto; "
+          f"bloco final de {TAMANHO_BLOCO}")
+    print(f"{'codec':<8}{'chat KiB':>10}{'% atual':>9}{'bloco KiB':>11}{'decodificar ms':>16}")
+    for codec, r in resultados.items():
+        print(f"{codec:<8}{r['bytes_chat'] / 1024:>10.1f}{100 * r['bytes_chat'] / base:>9.0f}"
+              f"{r['bytes_bloco'] / 1024:>11.1f}{r['decodificar_ms']:>16.2f}")
+    return resultados
+
+
+def _latencias(operacao, repeticoes):
+    tempos = []
+    for i in range(repeticoes):
+        inicio = time.perf_counter()
+        operacao(i)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    return {"p50_ms": statistics.median(tempos), "p95_ms": tempos[max(int(len(tempos) * 0.95) - 1, 0)]}
+
+
+def benchmark_armazenamento(operacoes=200, credenciais=None, url=None):
+    """Latência por operação em cada armazenamento, com as operações que o app faz.
+
+    Sem --url só roda os locais (memória e SQLite); com --url e --credenciais
+    inclui o Firebase, gravando tudo sob /benchmarks (que é apagado no fim).
+    """
+    import os
+    import tempfile
+    from armazenamento import criar_armazenamento
+    from indice_chats import caminho_indice, pagina_chats
+    from mensagens_chat import TAMANHO_BLOCO, atualizacao_chat, carregar_bloco, inicio_bloco
+
+    pasta = tempfile.mkdtemp()
+    bancos = {
+        "memoria": criar_armazenamento("memoria"),
+        "sqlite": criar_armazenamento("sqlite", caminho=os.path.join(pasta, "benchmark.sqlite3")),
+    }
+    if url:
+        bancos["firebase"] = criar_armazenamento("firebase", credenciais=credenciais, url=url)
+
+    historico = _transcricao(200)
+    correcao = {"pergunta": "Como faço um Pix?", "resposta_revisada": _FRASES[0], "categoria": "pix", "status": "ativo"}
+    resultados = {}
+    for nome, banco in bancos.items():
+        raiz = banco.reference("benchmarks")
+        user = "usuarios/bench"
+        # Um chat longo e um índice com `operacoes` chats
+        raiz.update({f"{user}/chats/longo/{chave}": valor
+                     for chave, valor in atualizacao_chat(historico, 0, "longo", "2025-01-01").items()})
+        raiz.update({f"{caminho_indice('bench', f'c{i:05d}')}": {"titulo": f"chat {i}", "ultima_atualizacao": f"2025-01-01T{i:08d}"}
+                     for i in range(operacoes)})
+
+        def salvar_turno(i):
+            atualizacao = atualizacao_chat(historico[:2], 0, "turno", f"2025-01-02T{i:08d}", inicio=2 * i)
+            raiz.update({f"{user}/chats/turnos/{chave}": valor for chave, valor in atualizacao.items()})
+
+        def abrir_chat(i):
+            ref = raiz.child(f"{user}/chats/longo/mensagens")
+            carregar_bloco(ref, inicio_bloco(len(historico)))
+
+        resultados[nome] = {
+            "set": _latencias(lambda i: raiz.child(f"correcoes/c{i}").set(correcao), operacoes),
+            "get": _latencias(lambda i: raiz.child(f"correcoes/c{i}").get(), operacoes),
+            "update (turno)": _latencias(salvar_turno, operacoes),
+            "página do índice": _latencias(
+                lambda i: pagina_chats(raiz.child(caminho_indice("bench")), 20), max(operacoes // 10, 1)),
+            f"bloco de {TAMANHO_BLOCO} msgs": _latencias(abrir_chat, max(operacoes // 10, 1)),
+        }
+        raiz.delete()
+        if hasattr(banco, "fechar"):
+            banco.fechar()
+
+    print(f"{'operação':<22}" + "".join(f"{nome + ' p50':>16}{'p95':>9}" for nome in bancos))
+    for operacao in next(iter(resultados.values())):
+        print(f"{operacao:<22}" + "".join(
+            f"{resultados[nome][operacao]['p50_ms']:>16.3f}{resultados[nome][operacao]['p95_ms']:>9.3f}"
+            for nome in bancos
+        ))
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    http = subparsers.add_parser("http", help="conexão nova x pool keep-alive para a OpenRouter")
+    http.add_argument("--requisicoes", type=int, default=300)
+    http.add_argument("--threads", type=int, default=8)
+
+    codec = subparsers.add_parser("codec", help="bytes e decodificação das mensagens: texto puro x zlib x zstd")
+    codec.add_argument("--mensagens", type=int, default=400)
+    codec.add_argument("--repeticoes", type=int, default=20)
+
+    armazenamento = subparsers.add_parser("armazenamento", help="latência por operação: memória x SQLite x Firebase")
+    armazenamento.add_argument("--operacoes", type=int, default=200)
+    armazenamento.add_argument("--credenciais", help="JSON da conta de serviço (com --url, inclui o Firebase)")
+    armazenamento.add_argument("--url", help="URL do Realtime Database")
+
+    args = parser.parse_args()
+    if args.benchmark == "http":
+        benchmark_http(args.requisicoes, args.threads)
+    elif args.benchmark == "codec":
+        benchmark_codec(args.mensagens, args.repeticoes)
+    elif args.benchmark == "armazenamento":
+        benchmark_armazenamento(args.operacoes, args.credenciais, args.url)
+
+
+if __name__ == "__main__":
+    main()
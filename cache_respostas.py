@@ -0,0 +1,157 @@
+"""Cache das respostas geradas pela IA, em dois níveis.
+
+- Memória: LRU limitado (OrderedDict), por processo.
+- Disco: SQLite, sobrevive a reinícios e é dividido pelos processos da
+  mesma máquina.
+
+A chave é a de servico_geracao.chave_requisicao sem o contexto (pergunta
+como foi digitada, em minúsculas; versão da memória global; nível do
+modelo) mais o hash do template do prompt de sistema; ver chave_cache no
+app. Como a versão da memória faz parte da chave, mudar a
+memória já torna as entradas antigas inalcançáveis; descartar_outras_versoes
+só libera o espaço delas.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def hash_template(template):
+    return hashlib.sha1(template.encode("utf-8")).hexdigest()[:12]
+
+
+class CacheRespostas:
+    def __init__(self, caminho="cache/respostas.sqlite3", max_memoria=512, max_disco=20000, ttl=6 * 3600):
+        self._max_memoria = max_memoria
+        self._max_disco = max_disco
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._memoria = OrderedDict()  # chave -> (resposta, versao, expira_em)
+        self.metricas = {
+            "acertos_memoria": 0, "acertos_disco": 0, "faltas": 0, "expiradas": 0,
+            "gravacoes": 0, "remocoes_memoria": 0, "remocoes_disco": 0, "invalidadas": 0,
+            "servidas_expiradas": 0,
+        }
+
+        self._banco = None
+        if caminho:
+            if os.path.dirname(caminho):
+                os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            self._banco = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+            self._banco.execute("PRAGMA journal_mode=WAL")
+            self._banco.execute("PRAGMA synchronous=NORMAL")
+            self._banco.execute("""
+                CREATE TABLE IF NOT EXISTS respostas (
+                    chave TEXT PRIMARY KEY,
+                    versao TEXT NOT NULL,
+                    resposta TEXT NOT NULL,
+                    expira_em REAL NOT NULL,
+                    ultimo_acesso REAL NOT NULL
+                )
+            """)
+            self._banco.execute("CREATE INDEX IF NOT EXISTS respostas_acesso ON respostas (ultimo_acesso)")
+            self._banco.execute("CREATE INDEX IF NOT EXISTS respostas_versao ON respostas (versao)")
+
+    @staticmethod
+    def _serializar(chave):
+        return hashlib.sha1(json.dumps(chave, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def _guardar_memoria(self, chave, valor):
+        self._memoria[chave] = valor
+        self._memoria.move_to_end(chave)
+        while len(self._memoria) > self._max_memoria:
+            self._memoria.popitem(last=False)
+            self.metricas["remocoes_memoria"] += 1
+
+    def obter(self, chave, aceitar_expirada=False):
+        """Resposta guardada para a chave, ou None se não houver ou tiver expirado.
+
+        Uma entrada expirada sai da memória na primeira leitura e a busca
+        segue para o disco, onde as expiradas só saem na poda; até lá,
+        `aceitar_expirada` devolve a resposta velha (usado quando a IA está
+        fora do ar). "expiradas" conta cada entrada uma vez por nível, ao
+        sair dele.
+        """
+        chave = self._serializar(chave)
+        agora = time.time()
+        with self._lock:
+            valor = self._memoria.get(chave)
+            if valor is not None and (valor[2] > agora or aceitar_expirada):
+                self._memoria.move_to_end(chave)
+                self.metricas["acertos_memoria" if valor[2] > agora else "servidas_expiradas"] += 1
+                return valor[0]
+            if valor is not None:
+                del self._memoria[chave]
+                self.metricas["expiradas"] += 1
+
+            if self._banco is not None:
+                linha = self._banco.execute(
+                    "SELECT resposta, versao, expira_em FROM respostas WHERE chave = ?", (chave,)
+                ).fetchone()
+                if linha is not None and (linha[2] > agora or aceitar_expirada):
+                    self._banco.execute("UPDATE respostas SET ultimo_acesso = ? WHERE chave = ?", (agora, chave))
+                    # Expirada não volta para a memória: só vale como último recurso
+                    if linha[2] > agora:
+                        self._guardar_memoria(chave, linha)
+                    self.metricas["acertos_disco" if linha[2] > agora else "servidas_expiradas"] += 1
+                    return linha[0]
+
+            if not aceitar_expirada:
+                self.metricas["faltas"] += 1
+            return None
+
+    def guardar(self, chave, resposta, versao=""):
+        chave = self._serializar(chave)
+        agora = time.time()
+        valor = (resposta, versao, agora + self._ttl)
+        with self._lock:
+            self._guardar_memoria(chave, valor)
+            self.metricas["gravacoes"] += 1
+            if self._banco is None:
+                return
+            self._banco.execute(
+                "INSERT OR REPLACE INTO respostas (chave, versao, resposta, expira_em, ultimo_acesso) VALUES (?, ?, ?, ?, ?)",
+                (chave, versao, resposta, valor[2], agora)
+            )
+            # Limpa em lote para não pagar um COUNT a cada gravação
+            if self.metricas["gravacoes"] % 100 == 0:
+                self._podar_disco(agora)
+
+    def _podar_disco(self, agora):
+        expiradas = self._banco.execute("DELETE FROM respostas WHERE expira_em <= ?", (agora,)).rowcount
+        self.metricas["expiradas"] += expiradas
+        excesso = self._banco.execute("SELECT COUNT(*) FROM respostas").fetchone()[0] - self._max_disco
+        if excesso > 0:
+            removidas = self._banco.execute(
+                "DELETE FROM respostas WHERE chave IN "
+                "(SELECT chave FROM respostas ORDER BY ultimo_acesso LIMIT ?)", (excesso,)
+            ).rowcount
+            self.metricas["remocoes_disco"] += removidas
+
+    def descartar_outras_versoes(self, versao):
+        """Apaga as respostas geradas com outra versão da memória global"""
+        with self._lock:
+            antigas = [chave for chave, valor in self._memoria.items() if valor[1] != versao]
+            for chave in antigas:
+                del self._memoria[chave]
+            removidas = len(antigas)
+            if self._banco is not None:
+                removidas = self._banco.execute("DELETE FROM respostas WHERE versao != ?", (versao,)).rowcount
+            self.metricas["invalidadas"] += removidas
+            return removidas
+
+    def tamanho(self):
+        with self._lock:
+            em_disco = 0
+            if self._banco is not None:
+                em_disco = self._banco.execute("SELECT COUNT(*) FROM respostas").fetchone()[0]
+            return {"memoria": len(self._memoria), "disco": em_disco}
+
+    def taxa_acerto(self):
+        acertos = self.metricas["acertos_memoria"] + self.metricas["acertos_disco"]
+        total = acertos + self.metricas["faltas"]
+        return acertos / total if total else 0.0
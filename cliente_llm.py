@@ -0,0 +1,278 @@
+import json
+import logging
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+URL_OPENROUTER = "https://openrouter.ai/api/v1/chat/completions"
+MODELO_PADRAO = "deepseek/deepseek-r1-0528:free"
+
+logger = logging.getLogger("santchat.llm")
+
+# --- Cliente HTTP compartilhado (pool de conexões com keep-alive) ---
+CONFIG_HTTP = {
+    "pool_conexoes": 4,      # hosts diferentes guardados no pool
+    "pool_tamanho": 32,      # conexões abertas por host
+    "timeout_conexao": 5,
+    "timeout_leitura": 60,
+}
+
+_lock_http = threading.Lock()
+_adaptador = None
+_sessoes = threading.local()
+
+
+def configurar_http(**config):
+    """Altera CONFIG_HTTP; se algo mudou, o pool é recriado na próxima requisição"""
+    global _adaptador
+    desconhecidas = set(config) - set(CONFIG_HTTP)
+    if desconhecidas:
+        raise ValueError(f"Configuração HTTP desconhecida: {', '.join(sorted(desconhecidas))}")
+    with _lock_http:
+        novas = {k: v for k, v in config.items() if v is not None and CONFIG_HTTP[k] != v}
+        if not novas:
+            return
+        CONFIG_HTTP.update(novas)
+        if _adaptador is not None:
+            _adaptador.close()
+        _adaptador = None
+
+
+def _obter_adaptador():
+    global _adaptador
+    with _lock_http:
+        if _adaptador is None:
+            _adaptador = HTTPAdapter(
+                pool_connections=CONFIG_HTTP["pool_conexoes"],
+                pool_maxsize=CONFIG_HTTP["pool_tamanho"],
+                max_retries=0
+            )
+        return _adaptador
+
+
+def obter_sessao():
+    """Session da thread atual, montada sobre o adaptador do processo.
+
+    O pool do urllib3 dentro do HTTPAdapter é thread-safe e é ele que guarda
+    as conexões abertas (TCP + TLS). Já a Session tem estado próprio (cookies,
+    headers), então cada thread de script do Streamlit usa a sua.
+    """
+    adaptador = _obter_adaptador()
+    sessao = getattr(_sessoes, "sessao", None)
+    # Recria se o pool foi reconfigurado depois que esta Session foi montada
+    if sessao is None or sessao.adapters.get("https://") is not adaptador:
+        sessao = requests.Session()
+        sessao.mount("https://", adaptador)
+        sessao.mount("http://", adaptador)
+        _sessoes.sessao = sessao
+    return sessao
+
+
+def _timeout(timeout):
+    if timeout is not None:
+        return timeout
+    return (CONFIG_HTTP["timeout_conexao"], CONFIG_HTTP["timeout_leitura"])
+
+
+class StreamInterrompido(Exception):
+    """A conexão do stream terminou antes do [DONE]"""
+
+
+class ErroOpenRouter(Exception):
+    """Resposta de erro da API (status diferente de 200 ou evento de erro no stream)"""
+
+    def __init__(self, status, texto, retry_after=None):
+        super().__init__(f"{status} - {texto}")
+        self.status = status
+        self.texto = texto
+        # Segundos pedidos pelo servidor no header Retry-After (429/503)
+        self.retry_after = retry_after
+
+
+def _retry_after(resp):
+    valor = resp.headers.get("Retry-After")
+    if not valor:
+        return None
+    try:
+        return max(float(valor), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(valor) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _interromper(resp):
+    """Fecha a conexão de um stream, acordando uma leitura parada nela em
+    outra thread (só o close() não acorda um recv bloqueado)"""
+    conexao = getattr(resp.raw, "_connection", None)
+    sock = getattr(conexao, "sock", None)
+    if sock is None:
+        # Com "Connection: close" o http.client solta o socket da conexão;
+        # ele continua no arquivo de onde a resposta é lida
+        arquivo = getattr(getattr(resp.raw, "_fp", None), "fp", None)
+        sock = getattr(getattr(arquivo, "raw", None), "_sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    resp.close()
+
+
+class Cancelamento(threading.Event):
+    """Event de cancelamento que também derruba os streams ligados a ele.
+
+    transmitir() só confere o evento entre uma linha e outra do SSE; com um
+    Cancelamento, set() interrompe na hora a leitura de quem ainda não
+    recebeu nada (ex.: o perdedor de um hedge).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock_respostas = threading.Lock()
+        self._respostas = set()
+
+    def vincular(self, resp):
+        with self._lock_respostas:
+            if not self.is_set():
+                self._respostas.add(resp)
+                return
+        _interromper(resp)
+
+    def desvincular(self, resp):
+        with self._lock_respostas:
+            self._respostas.discard(resp)
+
+    def set(self):
+        super().set()
+        with self._lock_respostas:
+            respostas, self._respostas = self._respostas, set()
+        for resp in respostas:
+            _interromper(resp)
+
+
+def _cabecalhos(chave_api):
+    return {
+        "Authorization": f"Bearer {chave_api}",
+        "Content-Type": "application/json"
+    }
+
+
+def completar(chave_api, mensagens, modelo=MODELO_PADRAO, max_tokens=50000, temperature=0.7, timeout=None):
+    """Chamada bloqueante: devolve o texto inteiro da resposta"""
+    inicio = time.perf_counter()
+    resp = obter_sessao().post(
+        URL_OPENROUTER,
+        headers=_cabecalhos(chave_api),
+        json={
+            "model": modelo,
+            "messages": mensagens,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        },
+        timeout=_timeout(timeout)
+    )
+    logger.info("openrouter modelo=%s status=%s total=%.0fms",
+                modelo, resp.status_code, (time.perf_counter() - inicio) * 1000)
+
+    if resp.status_code != 200:
+        raise ErroOpenRouter(resp.status_code, resp.text, _retry_after(resp))
+
+    data = resp.json()
+    if "choices" in data and data["choices"]:
+        return data["choices"][0]["message"]["content"].strip()
+    return ""
+
+
+def transmitir(chave_api, mensagens, modelo=MODELO_PADRAO, max_tokens=50000, temperature=0.7,
+               timeout=None, cancelar=None):
+    """Gerador com os pedaços de texto da resposta, lidos do SSE (stream: true).
+
+    Para quando `cancelar` (threading.Event) é acionado ou quando o gerador é
+    fechado; nos dois casos a conexão é encerrada. Se `cancelar` é um
+    Cancelamento, acioná-lo interrompe até uma leitura parada esperando o
+    próximo pedaço. O tempo até o primeiro token e o tempo total vão para o
+    log.
+    """
+    inicio = time.perf_counter()
+    primeiro_token = None
+    caracteres = 0
+    desfecho = "erro"
+
+    resp = obter_sessao().post(
+        URL_OPENROUTER,
+        headers=_cabecalhos(chave_api),
+        json={
+            "model": modelo,
+            "messages": mensagens,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True
+        },
+        stream=True,
+        timeout=_timeout(timeout)
+    )
+    if isinstance(cancelar, Cancelamento):
+        cancelar.vincular(resp)
+    try:
+        if resp.status_code != 200:
+            raise ErroOpenRouter(resp.status_code, resp.text, _retry_after(resp))
+
+        # O SSE não declara charset; sem isso o requests decodifica como latin-1
+        resp.encoding = "utf-8"
+        desfecho = "cancelada"
+        for linha in resp.iter_lines(decode_unicode=True):
+            if cancelar is not None and cancelar.is_set():
+                break
+            # Linhas vazias separam eventos; ":" são comentários de keep-alive
+            if not linha or linha.startswith(":") or not linha.startswith("data:"):
+                continue
+            dados = linha[len("data:"):].strip()
+            if dados == "[DONE]":
+                desfecho = "completa"
+                break
+
+            evento = json.loads(dados)
+            if "error" in evento:
+                erro = evento["error"]
+                raise ErroOpenRouter(erro.get("code", "stream"), erro.get("message", str(erro)))
+
+            escolhas = evento.get("choices") or [{}]
+            pedaco = (escolhas[0].get("delta") or {}).get("content")
+            if pedaco:
+                if primeiro_token is None:
+                    primeiro_token = time.perf_counter()
+                    logger.info("openrouter modelo=%s ttft=%.0fms",
+                                modelo, (primeiro_token - inicio) * 1000)
+                caracteres += len(pedaco)
+                yield pedaco
+        else:
+            raise StreamInterrompido("Conexão encerrada antes do fim da resposta")
+    except ErroOpenRouter:
+        desfecho = "erro"
+        raise
+    except Exception:
+        # Conexão derrubada pelo próprio cancelamento: termina sem erro
+        if cancelar is not None and cancelar.is_set():
+            desfecho = "cancelada"
+            return
+        desfecho = "interrompida"
+        raise
+    finally:
+        if isinstance(cancelar, Cancelamento):
+            cancelar.desvincular(resp)
+        resp.close()
+        fim = time.perf_counter()
+        logger.info(
+            "openrouter modelo=%s stream=%s ttft=%s total=%.0fms caracteres=%d",
+            modelo, desfecho,
+            f"{(primeiro_token - inicio) * 1000:.0f}ms" if primeiro_token else "-",
+            (fim - inicio) * 1000, caracteres
+        )
@@ -0,0 +1,78 @@
+"""Compressão do texto das mensagens longas gravadas no Firebase.
+
+O Realtime Database só guarda JSON, então o texto comprimido vai em base64
+num campo próprio, com o nome do codec na frente:
+
+    {"sender": "bot", "texto_z": "zlib:eJzLSM3JyVcozy/KSQEAGgQEXQ=="}
+
+Só vale para textos a partir de `LIMIAR_CARACTERES`: abaixo disso o
+base64 come o que a compressão economiza. O codec de gravação é escolhido
+em configurar_codec(); a leitura reconhece qualquer um pelo prefixo, então
+trocar de codec não exige migrar nada. zstd usa o pacote `zstandard`, se
+estiver instalado.
+"""
+import base64
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CAMPO = "texto_z"
+LIMIAR_CARACTERES = 512
+CODECS = ("nenhum", "zlib", "zstd")
+
+_config = {"codec": "nenhum", "limiar": LIMIAR_CARACTERES}
+
+
+def configurar_codec(codec="nenhum", limiar=LIMIAR_CARACTERES):
+    """Codec usado nas próximas gravações ("nenhum", "zlib" ou "zstd")"""
+    if codec not in CODECS:
+        raise ValueError(f"Codec desconhecido: {codec}")
+    if codec == "zstd" and zstandard is None:
+        raise ValueError("Codec zstd pede o pacote zstandard")
+    _config.update(codec=codec, limiar=limiar)
+
+
+def comprimir(texto, codec):
+    dados = texto.encode("utf-8")
+    if codec == "zlib":
+        dados = zlib.compress(dados, 6)
+    elif codec == "zstd":
+        dados = zstandard.ZstdCompressor(level=6).compress(dados)
+    else:
+        raise ValueError(f"Codec desconhecido: {codec}")
+    return f"{codec}:{base64.b64encode(dados).decode('ascii')}"
+
+
+def descomprimir(valor):
+    codec, _, dados = valor.partition(":")
+    dados = base64.b64decode(dados)
+    if codec == "zlib":
+        return zlib.decompress(dados).decode("utf-8")
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("Mensagem em zstd, mas o pacote zstandard não está instalado")
+        return zstandard.ZstdDecompressor().decompress(dados).decode("utf-8")
+    raise ValueError(f"Codec desconhecido: {codec}")
+
+
+def codificar_mensagem(mensagem, codec=None):
+    """Mensagem como vai para o banco: texto longo comprimido, o resto igual"""
+    codec = codec or _config["codec"]
+    texto = mensagem.get("text")
+    if codec == "nenhum" or not isinstance(texto, str) or len(texto) < _config["limiar"]:
+        return mensagem
+    codificada = {chave: valor for chave, valor in mensagem.items() if chave != "text"}
+    codificada[CAMPO] = comprimir(texto, codec)
+    return codificada
+
+
+def decodificar_mensagem(mensagem):
+    """Mensagem como o app usa, com `text` de volta"""
+    if not isinstance(mensagem, dict) or CAMPO not in mensagem:
+        return mensagem
+    decodificada = {chave: valor for chave, valor in mensagem.items() if chave != CAMPO}
+    decodificada["text"] = descomprimir(mensagem[CAMPO])
+    return decodificada
@@ -0,0 +1,95 @@
+import atexit
+import threading
+from datetime import datetime
+
+
+class ContadoresUso:
+    """Acumula os usos das correções em memória e grava em lote (write-behind).
+
+    Cada descarga é um único update() multi-caminho em respostas_revisadas com
+    incremento no servidor ({".sv": {"increment": n}}), então usos de sessões
+    e instâncias concorrentes nunca se perdem. A descarga acontece a cada
+    `intervalo` segundos, quando os usos pendentes chegam a `max_pendentes`,
+    e na saída do processo.
+    """
+
+    def __init__(self, referencia, indice, intervalo=10.0, max_pendentes=200):
+        self._referencia = referencia
+        self._indice = indice
+        self._intervalo = intervalo
+        self._max_pendentes = max_pendentes
+        self._lock = threading.Lock()
+        self._pendentes = {}
+        self._total_pendente = 0
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+        atexit.register(self.encerrar)
+
+    def registrar(self, correcao_id):
+        """Conta um uso da correção; não faz nenhuma chamada ao Firebase"""
+        agora = datetime.now().isoformat()
+        with self._lock:
+            usos, _ = self._pendentes.get(correcao_id, (0, None))
+            self._pendentes[correcao_id] = (usos + 1, agora)
+            self._total_pendente += 1
+            cheio = self._total_pendente >= self._max_pendentes
+            if self._thread is None and not self._parar.is_set():
+                self._thread = threading.Thread(target=self._executar, name="contadores-uso", daemon=True)
+                self._thread.start()
+        if cheio:
+            self._acordar.set()
+
+    def _executar(self):
+        while not self._parar.is_set():
+            self._acordar.wait(self._intervalo)
+            self._acordar.clear()
+            try:
+                self.descarregar()
+            except Exception:
+                # Os usos voltaram para a fila; tenta de novo no próximo ciclo
+                pass
+
+    def descarregar(self):
+        """Grava os usos pendentes num único update. Retorna quantos usos gravou"""
+        with self._lock:
+            pendentes, self._pendentes = self._pendentes, {}
+            self._total_pendente = 0
+        if not pendentes:
+            return 0
+
+        atualizacao = {}
+        for correcao_id, (usos, ultimo_uso) in pendentes.items():
+            # todas_correcoes sempre conta, mesmo que o índice ainda não tenha
+            # a correção; a cópia da categoria só quando o índice sabe qual é
+            caminhos = [f"todas_correcoes/{correcao_id}"]
+            dados = self._indice.obter(correcao_id)
+            if dados and dados.get("categoria"):
+                caminhos.append(f"por_categoria/{dados['categoria']}/{correcao_id}")
+            for caminho in caminhos:
+                atualizacao[f"{caminho}/uso_count"] = {".sv": {"increment": usos}}
+                atualizacao[f"{caminho}/last_used"] = ultimo_uso
+
+        try:
+            if atualizacao:
+                self._referencia.update(atualizacao)
+        except Exception:
+            # Devolve para a próxima descarga sem perder usos
+            with self._lock:
+                for correcao_id, (usos, ultimo_uso) in pendentes.items():
+                    usos_novos, ultimo_novo = self._pendentes.get(correcao_id, (0, None))
+                    self._pendentes[correcao_id] = (usos + usos_novos, ultimo_novo or ultimo_uso)
+                    self._total_pendente += usos
+            raise
+        return sum(usos for usos, _ in pendentes.values())
+
+    def encerrar(self, timeout=5.0):
+        """Para a thread e grava o que ainda estiver pendente"""
+        self._parar.set()
+        self._acordar.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        try:
+            self.descarregar()
+        except Exception:
+            pass
@@ -0,0 +1,151 @@
+"""Montagem do prompt dentro de um orçamento de tokens.
+
+Em vez de mandar a memória global inteira a cada chamada, as entradas são
+ranqueadas por BM25 contra a pergunta (índice montado uma vez por versão
+da memória) e as mais relevantes entram até o limite reservado para elas.
+O resto do orçamento vai para as últimas mensagens da conversa, enviadas
+como turnos de verdade (user/assistant).
+
+A contagem de tokens é uma estimativa local, sem tokenizador do modelo:
+palavras longas contam como vários tokens (~4 caracteres cada) e cada
+sinal de pontuação conta como um.
+"""
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from normalizacao import tokens_normalizados
+from servico_geracao import versao_memoria
+
+_PECAS = re.compile(r"\w+|[^\w\s]")
+
+# Custo fixo de cada mensagem no formato de chat (papel, separadores)
+TOKENS_POR_MENSAGEM = 4
+
+
+def estimar_tokens(texto):
+    return sum(math.ceil(len(peca) / 4) for peca in _PECAS.findall(texto or ""))
+
+
+def tokens_mensagens(mensagens):
+    return sum(estimar_tokens(msg["content"]) + TOKENS_POR_MENSAGEM for msg in mensagens)
+
+
+class IndiceMemoria:
+    """BM25 sobre as entradas da memória global"""
+
+    def __init__(self, memoria, k1=1.5, b=0.75):
+        self.entradas = [str(entrada) for entrada in memoria if entrada]
+        self.tokens = [estimar_tokens(entrada) for entrada in self.entradas]
+        self._k1 = k1
+        self._b = b
+        self._por_termo = {}
+        self._tamanhos = []
+        for i, entrada in enumerate(self.entradas):
+            termos = tokens_normalizados(entrada)
+            self._tamanhos.append(len(termos))
+            for termo, frequencia in Counter(termos).items():
+                self._por_termo.setdefault(termo, []).append((i, frequencia))
+        total = len(self.entradas)
+        self._media = sum(self._tamanhos) / total if total else 0
+        self._idf = {
+            termo: math.log(1 + (total - len(postagens) + 0.5) / (len(postagens) + 0.5))
+            for termo, postagens in self._por_termo.items()
+        }
+
+    def pontuar(self, termos):
+        """Pontuação BM25 de cada entrada que tem algum termo da consulta"""
+        pontos = {}
+        for termo in set(termos):
+            for i, frequencia in self._por_termo.get(termo, ()):
+                normalizacao = 1 - self._b + self._b * self._tamanhos[i] / (self._media or 1)
+                pontos[i] = pontos.get(i, 0.0) + self._idf[termo] * frequencia * (self._k1 + 1) / (
+                    frequencia + self._k1 * normalizacao)
+        return pontos
+
+    def selecionar(self, termos, orcamento):
+        """Entradas mais relevantes que cabem no orçamento, na ordem original.
+
+        Se a memória inteira cabe, vai inteira (inclusive o que não tem
+        termo em comum com a pergunta, como antes).
+        """
+        if sum(self.tokens) + TOKENS_POR_MENSAGEM <= orcamento:
+            return list(self.entradas)
+        pontos = self.pontuar(termos)
+        escolhidas = []
+        usado = TOKENS_POR_MENSAGEM
+        for i in sorted(pontos, key=lambda i: (-pontos[i], i)):
+            if usado + self.tokens[i] > orcamento:
+                continue
+            escolhidas.append(i)
+            usado += self.tokens[i]
+        return [self.entradas[i] for i in sorted(escolhidas)]
+
+
+_indices = OrderedDict()
+_lock_indices = threading.Lock()
+
+
+def indice_memoria(memoria):
+    """Índice da versão atual da memória (guarda os das últimas versões)"""
+    versao = versao_memoria(memoria)
+    with _lock_indices:
+        indice = _indices.get(versao)
+        if indice is None:
+            indice = _indices[versao] = IndiceMemoria(memoria or [])
+            while len(_indices) > 4:
+                _indices.popitem(last=False)
+        return indice
+
+
+def selecionar_historico(historico, orcamento):
+    """Mensagens mais recentes (antes da pergunta atual) que cabem no orçamento"""
+    turnos = []
+    usado = 0
+    for msg in reversed(historico):
+        texto = msg.get("text") or ""
+        custo = estimar_tokens(texto) + TOKENS_POR_MENSAGEM
+        if usado + custo > orcamento:
+            break
+        papel = "user" if msg.get("sender") == "user" else "assistant"
+        turnos.append({"role": papel, "content": texto})
+        usado += custo
+    turnos.reverse()
+    return turnos
+
+
+def montar_contexto(sistema, memoria, consulta, historico, orcamento=4000, fracao_memoria=0.5, resumo=None):
+    """Mensagens para a API: sistema, memória selecionada, resumo, histórico e a pergunta.
+
+    `consulta` é uma ConsultaNormalizada; `historico` são as mensagens da
+    sessão antes da pergunta atual que o `resumo` (texto) ainda não cobre.
+    Devolve (mensagens, estatisticas).
+    """
+    mensagens_sistema = [{"role": "system", "content": sistema}]
+    pergunta = {"role": "user", "content": consulta.pergunta}
+    disponivel = max(orcamento - tokens_mensagens(mensagens_sistema + [pergunta]), 0)
+
+    indice = indice_memoria(memoria)
+    entradas = indice.selecionar(consulta.tokens, int(disponivel * fracao_memoria))
+    mensagem_memoria = []
+    if entradas:
+        mensagem_memoria = [{"role": "system", "content": "\n".join(entradas)}]
+    disponivel -= tokens_mensagens(mensagem_memoria)
+
+    mensagem_resumo = []
+    if resumo:
+        mensagem_resumo = [{"role": "system", "content": f"Resumo da conversa até aqui:\n{resumo}"}]
+        disponivel -= tokens_mensagens(mensagem_resumo)
+
+    turnos = selecionar_historico(historico or [], disponivel)
+    mensagens = mensagens_sistema + mensagem_memoria + mensagem_resumo + turnos + [pergunta]
+    estatisticas = {
+        "tokens": tokens_mensagens(mensagens),
+        "memoria": len(entradas),
+        "memoria_total": len(indice.entradas),
+        "historico": len(turnos),
+        "historico_total": len(historico or []),
+        "resumo": bool(resumo),
+    }
+    return mensagens, estatisticas
@@ -0,0 +1,142 @@
+"""Feed das interações usuário/IA para a página "Treinar IA".
+
+Cada resposta da IA salva vira uma entrada em interacoes/{push_id}, gravada
+no mesmo update() das mensagens do chat. O push_id é como o do Firebase
+(8 caracteres de timestamp em ms + 12 aleatórios, numa base que mantém a
+ordem alfabética), então a ordem das chaves é a ordem no tempo:
+
+- paginação: order_by_key().end_at(cursor).limit_to_last(n), do mais novo
+  para o mais antigo, com o último push_id da página como cursor;
+- filtro por data: o dia é uma faixa de chaves (push_id_limite do início e
+  do fim do dia), sem olhar o conteúdo;
+- filtro por usuário: a entrada é repetida em
+  indices/interacoes_por_usuario/{user}/{push_id}, e a mesma consulta roda
+  nesse nó (com data também, pela faixa de chaves).
+"""
+import hashlib
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+FEED = "interacoes"
+POR_USUARIO = "indices/interacoes_por_usuario"
+
+# Alfabeto do Firebase, em ordem ASCII
+ALFABETO = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+
+def _codificar_tempo(ms):
+    caracteres = []
+    for _ in range(8):
+        caracteres.append(ALFABETO[ms % 64])
+        ms //= 64
+    return "".join(reversed(caracteres))
+
+
+def tempo_push_id(push_id):
+    """Timestamp (ms) de um push_id"""
+    ms = 0
+    for caractere in push_id[:8]:
+        ms = ms * 64 + ALFABETO.index(caractere)
+    return ms
+
+
+class GeradorPushId:
+    """Push IDs crescentes, mesmo vários no mesmo milissegundo"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ultimo_ms = None
+        self._aleatorio = []
+
+    def gerar(self, ms=None):
+        ms = int(time.time() * 1000) if ms is None else ms
+        with self._lock:
+            if ms == self._ultimo_ms:
+                # Mesmo ms: soma 1 na parte aleatória para continuar crescente
+                for posicao in range(11, -1, -1):
+                    if self._aleatorio[posicao] != 63:
+                        self._aleatorio[posicao] += 1
+                        break
+                    self._aleatorio[posicao] = 0
+            else:
+                self._ultimo_ms = ms
+                self._aleatorio = [random.randrange(64) for _ in range(12)]
+            return _codificar_tempo(ms) + "".join(ALFABETO[i] for i in self._aleatorio)
+
+
+_gerador = GeradorPushId()
+
+
+def gerar_push_id(ms=None):
+    return _gerador.gerar(ms)
+
+
+def push_id_fixo(ms, semente, ordem):
+    """push_id determinístico (para o backfill poder rodar de novo sem duplicar)"""
+    resumo = hashlib.sha1(str(semente).encode("utf-8")).digest()
+    prefixo = "".join(ALFABETO[b % 64] for b in resumo[:6])
+    sufixo = "".join(ALFABETO[(ordem >> (6 * i)) % 64] for i in range(5, -1, -1))
+    return _codificar_tempo(ms) + prefixo + sufixo
+
+
+def push_id_limite(ms, fim=False):
+    """Menor (ou maior, com fim=True) push_id possível no milissegundo `ms`"""
+    return _codificar_tempo(ms) + (ALFABETO[-1] if fim else ALFABETO[0]) * 12
+
+
+def faixa_do_dia(dia):
+    """(primeira, última) chave possível em `dia` (date), no fuso local"""
+    inicio = datetime(dia.year, dia.month, dia.day)
+    fim = inicio + timedelta(days=1)
+    return push_id_limite(int(inicio.timestamp() * 1000)), push_id_limite(int(fim.timestamp() * 1000) - 1, fim=True)
+
+
+def entradas_novas(historico, ja_salvas, inicio=0):
+    """(posição, pergunta, resposta) das respostas da IA ainda não salvas, com a pergunta logo antes"""
+    for indice in range(max(ja_salvas, 1), len(historico)):
+        mensagem, anterior = historico[indice], historico[indice - 1]
+        if mensagem.get("sender") == "bot" and anterior.get("sender") == "user":
+            yield inicio + indice, anterior.get("text", ""), mensagem.get("text", "")
+
+
+def atualizacao_interacao(push_id, user_id, chat_id, posicao, pergunta, resposta, timestamp):
+    """Caminhos do update() multi-caminho para uma interação: o feed e o índice do usuário"""
+    entrada = {
+        "user": user_id,
+        "chat_id": chat_id,
+        "indice": posicao,
+        "pergunta": pergunta,
+        "resposta": resposta,
+        "timestamp": timestamp,
+    }
+    return {
+        f"{FEED}/{push_id}": entrada,
+        f"{POR_USUARIO}/{user_id}/{push_id}": entrada,
+    }
+
+
+def pagina_por_chave(ref, tamanho, antes=None, dia=None):
+    """Uma página de um nó com push_ids como chave (o feed, o índice de um
+    usuário, os feedbacks...), da entrada mais nova para a mais antiga.
+
+    `antes` é o cursor devolvido pela página anterior; `dia` restringe à
+    faixa de chaves daquele dia. Devolve ([(push_id, entrada), ...], cursor
+    da próxima página ou None).
+    """
+    consulta = ref.order_by_key()
+    fim = None
+    if dia is not None:
+        inicio, fim = faixa_do_dia(dia)
+        consulta = consulta.start_at(inicio)
+    if antes is not None:
+        fim = antes if fim is None else min(fim, antes)
+    if fim is not None:
+        consulta = consulta.end_at(fim)
+    # end_at inclui o próprio cursor, que já foi mostrado
+    itens = [(chave, valor) for chave, valor in reversed(list((consulta.limit_to_last(tamanho + 2).get() or {}).items()))
+             if chave != antes]
+    pagina = itens[:tamanho]
+    cursor = pagina[-1][0] if len(itens) > tamanho else None
+    return pagina, cursor
@@ -0,0 +1,199 @@
+"""Fila de gravação em segundo plano (write-behind) para o Realtime Database.
+
+Quem grava chama enfileirar() com um dict caminho -> valor (como num
+update() multi-caminho a partir da raiz) e segue em frente; uma thread do
+processo junta o que estiver pendente e grava em um update() só.
+
+Gravações repetidas no mesmo caminho ficam só com a última, a não ser
+que a nova seja um incremento ({".sv": {"increment": n}}): dois incrementos
+somam, e um incremento sobre um valor ainda pendente é aplicado nele. Como o
+update() do Firebase recusa um caminho e um descendente dele na mesma
+chamada, a fila resolve isso ao juntar:
+- um caminho novo que é ancestral de pendentes substitui todos eles;
+- um caminho novo dentro de um pendente é aplicado dentro do valor dele.
+
+Falhas são repetidas com backoff. enfileirar() devolve um Future para quem
+precisar esperar a gravação, e aguardar() espera tudo o que está pendente
+sob um caminho antes de uma leitura (ler o que acabou de escrever).
+"""
+import atexit
+import copy
+import logging
+import threading
+import time
+from concurrent.futures import Future, wait
+
+logger = logging.getLogger("santchat.persistencia")
+
+
+def _segmentos(caminho):
+    return tuple(s for s in str(caminho).split("/") if s)
+
+
+def _incremento(valor):
+    """n de um {".sv": {"increment": n}}; None se o valor não é um incremento"""
+    if isinstance(valor, dict) and len(valor) == 1 and isinstance(valor.get(".sv"), dict):
+        return valor[".sv"].get("increment")
+    return None
+
+
+def _sobrepor(anterior, valor):
+    """O que fica pendente quando `valor` é gravado por cima de `anterior`"""
+    incremento = _incremento(valor)
+    if incremento is None:
+        return valor
+    incremento_anterior = _incremento(anterior)
+    if incremento_anterior is not None:
+        return {".sv": {"increment": incremento_anterior + incremento}}
+    # Valor comum ainda não gravado: o incremento vale sobre ele (como no
+    # Firebase, o que não é número conta como 0)
+    if isinstance(anterior, (int, float)) and not isinstance(anterior, bool):
+        return anterior + incremento
+    return incremento
+
+
+def _relacionados(a, b):
+    """Um caminho é ancestral do outro (ou são iguais)"""
+    return a[:len(b)] == b or b[:len(a)] == a
+
+
+class FilaPersistencia:
+    def __init__(self, referencia, intervalo=0.2, max_caminhos=500, tentativas=8):
+        self._referencia = referencia
+        self._intervalo = intervalo
+        self._max_caminhos = max_caminhos
+        self._tentativas = tentativas
+        self._condicao = threading.Condition()
+        self._pendentes = {}  # segmentos -> valor
+        self._futuros = []    # (caminhos, Future) ainda na fila
+        self._em_voo = []     # (caminhos, Future) sendo gravados
+        self._parar = False
+        self._thread = None
+        self.estatisticas = {"gravacoes": 0, "coalescidas": 0, "lotes": 0, "falhas": 0, "descartadas": 0}
+        atexit.register(self.encerrar)
+
+    def enfileirar(self, atualizacao):
+        """Agenda a gravação; o Future resolve quando ela chegar ao banco"""
+        futuro = Future()
+        caminhos = tuple(_segmentos(caminho) for caminho in atualizacao)
+        with self._condicao:
+            if self._parar:
+                raise RuntimeError("Fila de persistência encerrada")
+            vazia = not self._pendentes
+            for caminho, valor in zip(caminhos, atualizacao.values()):
+                self._mesclar(caminho, copy.deepcopy(valor))
+            self._futuros.append((caminhos, futuro))
+            self.estatisticas["gravacoes"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._executar, name="fila-persistencia", daemon=True)
+                self._thread.start()
+            # Acorda a thread só para começar um lote ou quando ele encheu;
+            # no meio do intervalo, as gravações só se juntam ao lote
+            if vazia or len(self._pendentes) >= self._max_caminhos:
+                self._condicao.notify_all()
+        return futuro
+
+    def _mesclar(self, caminho, valor):
+        for tamanho in range(len(caminho), -1, -1):
+            ancestral = caminho[:tamanho]
+            if ancestral not in self._pendentes:
+                continue
+            self.estatisticas["coalescidas"] += 1
+            if tamanho == len(caminho):
+                self._pendentes[caminho] = _sobrepor(self._pendentes[caminho], valor)
+                return
+            # Dentro de um valor que já vai ser gravado inteiro: altera o valor
+            no = self._pendentes[ancestral]
+            if not isinstance(no, dict):
+                no = self._pendentes[ancestral] = {}
+            for segmento in caminho[tamanho:-1]:
+                if not isinstance(no.get(segmento), dict):
+                    no[segmento] = {}
+                no = no[segmento]
+            valor = _sobrepor(no.get(caminho[-1]), valor)
+            if valor is None:
+                no.pop(caminho[-1], None)
+            else:
+                no[caminho[-1]] = valor
+            return
+
+        descendentes = [c for c in self._pendentes if c[:len(caminho)] == caminho]
+        for descendente in descendentes:
+            del self._pendentes[descendente]
+        self.estatisticas["coalescidas"] += len(descendentes)
+        self._pendentes[caminho] = valor
+
+    def _executar(self):
+        while True:
+            with self._condicao:
+                while not self._pendentes and not self._parar:
+                    self._condicao.wait()
+                if not self._pendentes:
+                    return
+                # Espera o intervalo para juntar mais gravações no mesmo lote,
+                # a não ser que o lote encha ou a fila esteja encerrando
+                prazo = time.monotonic() + self._intervalo
+                while not self._parar and len(self._pendentes) < self._max_caminhos:
+                    restante = prazo - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._condicao.wait(restante)
+                lote, self._pendentes = self._pendentes, {}
+                self._em_voo, self._futuros = self._futuros, []
+            self._gravar(lote)
+
+    def _gravar(self, lote):
+        itens = [("/".join(caminho), valor) for caminho, valor in lote.items()]
+        tentativa = 0
+        inicio = 0
+        while True:
+            try:
+                # Sem conflito entre caminhos do lote, dá para dividir em partes
+                while inicio < len(itens):
+                    parte = dict(itens[inicio:inicio + self._max_caminhos])
+                    self._referencia.update(parte)
+                    inicio += len(parte)
+                    self.estatisticas["lotes"] += 1
+                resultado, erro = True, None
+                break
+            except Exception as e:
+                tentativa += 1
+                self.estatisticas["falhas"] += 1
+                if tentativa >= self._tentativas:
+                    logger.error("Gravação descartada depois de %d tentativas (%d caminhos): %s",
+                                 tentativa, len(itens) - inicio, e)
+                    self.estatisticas["descartadas"] += len(itens) - inicio
+                    resultado, erro = None, e
+                    break
+                espera = min(0.5 * 2 ** (tentativa - 1), 30.0)
+                logger.warning("Erro ao gravar lote (tentativa %d), nova tentativa em %.1fs: %s", tentativa, espera, e)
+                time.sleep(espera)
+
+        with self._condicao:
+            futuros, self._em_voo = self._em_voo, []
+        for _, futuro in futuros:
+            if erro is None:
+                futuro.set_result(resultado)
+            else:
+                futuro.set_exception(erro)
+
+    def aguardar(self, caminho="/", timeout=None):
+        """Espera as gravações pendentes que tocam `caminho` (ou algo dentro/acima dele)"""
+        alvo = _segmentos(caminho)
+        with self._condicao:
+            futuros = [
+                futuro for caminhos, futuro in self._futuros + self._em_voo
+                if any(_relacionados(c, alvo) for c in caminhos)
+            ]
+        if futuros:
+            wait(futuros, timeout)
+        return all(futuro.done() for futuro in futuros)
+
+    def encerrar(self, timeout=10.0):
+        """Grava o que falta e para a thread"""
+        with self._condicao:
+            self._parar = True
+            self._condicao.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
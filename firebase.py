@@ -1,20 +1,22 @@
-import firebase_admin
-from firebase_admin import credentials, db
+from armazenamento import criar_armazenamento
+
+_armazenamento = None
 
 def iniciar_firebase():
-    if not firebase_admin._apps:
-        cred = credentials.Certificate("firebase_credentials.json")
-        firebase_admin.initialize_app(cred, {
-            'databaseURL': "https://santchat-ia-default-rtdb.firebaseio.com/"  # 🔁 coloque sua URL aqui!
-        })
+    global _armazenamento
+    if _armazenamento is None:
+        _armazenamento = criar_armazenamento(
+            "firebase",
+            credenciais="firebase_credentials.json",
+            url="https://santchat-ia-default-rtdb.firebaseio.com/"  # 🔁 coloque sua URL aqui!
+        )
+    return _armazenamento
 
 def salvar_memoria_firebase(memoria):
-    iniciar_firebase()
-    ref = db.reference("/memoria")
+    ref = iniciar_firebase().reference("/memoria")
     ref.set(memoria)
 
 def carregar_memoria_firebase():
-    iniciar_firebase()
-    ref = db.reference("/memoria")
+    ref = iniciar_firebase().reference("/memoria")
     dados = ref.get()
     return dados if dados else []
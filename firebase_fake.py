@@ -0,0 +1,323 @@
+"""Realtime Database em memória, para rodar a sincronização sem rede.
+
+Imita o que o firebase_admin.db faz: reference(), child(), get() (com
+shallow), set(), update() com múltiplos caminhos, delete(), transaction()
+e listen(), que entrega eventos "put"/"patch" com os mesmos campos
+(event_type, path, data) do db.Event. Valores de servidor
+({".sv": "timestamp"} e {".sv": {"increment": n}}) são resolvidos na
+escrita, como no servidor. Consultas (order_by_child/key, start_at,
+end_at, limit_to_first/last) seguem a ordenação do Firebase.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+
+class Evento:
+    """Mesma forma do firebase_admin.db.Event"""
+
+    def __init__(self, event_type, path, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+    def __repr__(self):
+        return f"Evento({self.event_type!r}, {self.path!r}, {self.data!r})"
+
+
+def _segmentos(caminho):
+    return [s for s in str(caminho).split("/") if s]
+
+
+def _caminho(segmentos):
+    return "/" + "/".join(segmentos)
+
+
+def _para_arvore(valor):
+    """Converte o valor para o formato guardado: sem None, dicts vazios ou listas"""
+    if isinstance(valor, list):
+        valor = {str(i): v for i, v in enumerate(valor)}
+    if isinstance(valor, dict):
+        arvore = {}
+        for chave, filho in valor.items():
+            filho = _para_arvore(filho)
+            if filho is not None:
+                arvore[str(chave)] = filho
+        return arvore or None
+    return valor
+
+
+def _resolver_servidor(valor, atual):
+    """Troca os valores de servidor pelo resultado, usando o valor atual do nó"""
+    if isinstance(valor, dict):
+        if ".sv" in valor:
+            operacao = valor[".sv"]
+            if operacao == "timestamp":
+                return int(time.time() * 1000)
+            if isinstance(operacao, dict) and "increment" in operacao:
+                base = atual if isinstance(atual, (int, float)) and not isinstance(atual, bool) else 0
+                return base + operacao["increment"]
+            raise ValueError(f"Valor de servidor não suportado: {operacao}")
+        atual = atual if isinstance(atual, dict) else {}
+        return {chave: _resolver_servidor(filho, atual.get(str(chave))) for chave, filho in valor.items()}
+    return valor
+
+
+def _para_json(valor):
+    """Converte o nó guardado para o que o Firebase devolve no get()"""
+    if not isinstance(valor, dict):
+        return valor
+    convertido = {chave: _para_json(filho) for chave, filho in valor.items()}
+    # Como o Firebase: chaves inteiras "quase sequenciais" viram lista
+    if all(chave.isdigit() for chave in convertido):
+        indices = [int(chave) for chave in convertido]
+        if max(indices) < 2 * len(indices):
+            lista = [None] * (max(indices) + 1)
+            for chave, filho in convertido.items():
+                lista[int(chave)] = filho
+            return lista
+    return dict(sorted(convertido.items()))
+
+
+def _ordem(valor):
+    """Ordem do Firebase: null, false, true, números, strings, objetos"""
+    if valor is None:
+        return (0,)
+    if isinstance(valor, bool):
+        return (1, valor)
+    if isinstance(valor, (int, float)):
+        return (2, valor)
+    if isinstance(valor, str):
+        return (3, valor)
+    return (4,)
+
+
+def _ordem_chave(chave):
+    """Chaves inteiras vêm antes, em ordem numérica; depois as outras, em ordem alfabética"""
+    if chave.lstrip("-").isdigit() and len(chave) < 11:
+        return (0, int(chave), "")
+    return (1, 0, chave)
+
+
+class RegistroOuvinte:
+    """Mesma interface do db.ListenerRegistration"""
+
+    def __init__(self, banco, segmentos, callback):
+        self._banco = banco
+        self.segmentos = segmentos
+        self.callback = callback
+
+    def close(self):
+        self._banco._remover_ouvinte(self)
+
+
+class BancoFake:
+    def __init__(self, dados=None):
+        self._lock = threading.RLock()
+        self._raiz = _para_arvore(copy.deepcopy(dados)) if dados else None
+        self._ouvintes = []
+
+    def reference(self, caminho="/"):
+        return ReferenciaFake(self, _segmentos(caminho))
+
+    # --- Árvore ---
+    def _ler(self, segmentos):
+        no = self._raiz
+        for segmento in segmentos:
+            if not isinstance(no, dict):
+                return None
+            no = no.get(segmento)
+        return no
+
+    def _escrever(self, segmentos, valor):
+        if not segmentos:
+            self._raiz = valor
+            return
+        if not isinstance(self._raiz, dict):
+            self._raiz = {}
+        pais = [self._raiz]
+        for segmento in segmentos[:-1]:
+            filho = pais[-1].get(segmento)
+            if not isinstance(filho, dict):
+                filho = pais[-1][segmento] = {}
+            pais.append(filho)
+        if valor is None:
+            pais[-1].pop(segmentos[-1], None)
+        else:
+            pais[-1][segmentos[-1]] = valor
+        # Nós que ficaram vazios deixam de existir
+        for nivel in range(len(pais) - 1, 0, -1):
+            if not pais[nivel]:
+                del pais[nivel - 1][segmentos[nivel - 1]]
+        if not self._raiz:
+            self._raiz = None
+
+    # --- Escritas com notificação ---
+    def _set(self, segmentos, valor):
+        with self._lock:
+            valor = _para_arvore(_resolver_servidor(copy.deepcopy(valor), self._ler(segmentos)))
+            self._escrever(segmentos, valor)
+            eventos = self._eventos_put(segmentos)
+        self._notificar(eventos)
+
+    def _update(self, segmentos, valores):
+        with self._lock:
+            valores = {
+                tuple(_segmentos(chave)): _para_arvore(_resolver_servidor(
+                    copy.deepcopy(valor), self._ler(segmentos + _segmentos(chave))))
+                for chave, valor in valores.items()
+            }
+            for relativo, valor in valores.items():
+                self._escrever(segmentos + list(relativo), valor)
+            eventos = []
+            for ouvinte in self._ouvintes:
+                alvo = ouvinte.segmentos
+                if segmentos[:len(alvo)] == alvo:
+                    relativo = segmentos[len(alvo):]
+                    dados = {"/".join(chave): _para_json(valor) for chave, valor in valores.items()}
+                    eventos.append((ouvinte, Evento("patch", _caminho(relativo), dados)))
+                elif alvo[:len(segmentos)] == segmentos:
+                    eventos.append((ouvinte, Evento("put", "/", _para_json(self._ler(alvo)))))
+        self._notificar(eventos)
+
+    def _eventos_put(self, segmentos):
+        eventos = []
+        for ouvinte in self._ouvintes:
+            alvo = ouvinte.segmentos
+            if segmentos[:len(alvo)] == alvo:
+                relativo = segmentos[len(alvo):]
+                dados = _para_json(self._ler(segmentos))
+                eventos.append((ouvinte, Evento("put", _caminho(relativo), dados)))
+            elif alvo[:len(segmentos)] == segmentos:
+                eventos.append((ouvinte, Evento("put", "/", _para_json(self._ler(alvo)))))
+        return eventos
+
+    @staticmethod
+    def _notificar(eventos):
+        for ouvinte, evento in eventos:
+            ouvinte.callback(copy.deepcopy(evento))
+
+    def _listen(self, segmentos, callback):
+        registro = RegistroOuvinte(self, segmentos, callback)
+        with self._lock:
+            self._ouvintes.append(registro)
+            inicial = Evento("put", "/", _para_json(copy.deepcopy(self._ler(segmentos))))
+        callback(inicial)
+        return registro
+
+    def _remover_ouvinte(self, registro):
+        with self._lock:
+            if registro in self._ouvintes:
+                self._ouvintes.remove(registro)
+
+
+class ReferenciaFake:
+    def __init__(self, banco, segmentos):
+        self._banco = banco
+        self._segmentos = segmentos
+
+    @property
+    def key(self):
+        return self._segmentos[-1] if self._segmentos else None
+
+    @property
+    def path(self):
+        return _caminho(self._segmentos)
+
+    def child(self, caminho):
+        return ReferenciaFake(self._banco, self._segmentos + _segmentos(caminho))
+
+    def get(self, shallow=False):
+        with self._banco._lock:
+            valor = copy.deepcopy(self._banco._ler(self._segmentos))
+        if shallow and isinstance(valor, dict):
+            return {chave: True if isinstance(filho, dict) else filho for chave, filho in valor.items()}
+        return _para_json(valor)
+
+    def set(self, valor):
+        self._banco._set(self._segmentos, valor)
+
+    def update(self, valores):
+        if valores:
+            self._banco._update(self._segmentos, valores)
+
+    def delete(self):
+        self._banco._set(self._segmentos, None)
+
+    def transaction(self, transaction_update):
+        with self._banco._lock:
+            atual = _para_json(copy.deepcopy(self._banco._ler(self._segmentos)))
+            novo = transaction_update(atual)
+            self._banco._set(self._segmentos, novo)
+            return _para_json(copy.deepcopy(self._banco._ler(self._segmentos)))
+
+    def listen(self, callback):
+        return self._banco._listen(self._segmentos, callback)
+
+    def order_by_child(self, caminho):
+        return ConsultaFake(self, lambda chave, valor: _ordem(_filho(valor, caminho)), _ordem)
+
+    def order_by_key(self):
+        return ConsultaFake(self, lambda chave, valor: _ordem_chave(chave), _ordem_chave)
+
+    def order_by_value(self):
+        return ConsultaFake(self, lambda chave, valor: _ordem(valor), _ordem)
+
+
+def _filho(valor, caminho):
+    for segmento in _segmentos(caminho):
+        if not isinstance(valor, dict):
+            return None
+        valor = valor.get(segmento)
+    return valor
+
+
+class ConsultaFake:
+    """Mesma interface do db.Query; get() devolve um OrderedDict na ordem pedida"""
+
+    def __init__(self, referencia, ordem, ordem_limite):
+        self._referencia = referencia
+        self._ordem = ordem
+        self._ordem_limite = ordem_limite
+        self._inicio = self._fim = None
+        self._primeiros = self._ultimos = None
+
+    def start_at(self, inicio):
+        self._inicio = inicio
+        return self
+
+    def end_at(self, fim):
+        self._fim = fim
+        return self
+
+    def equal_to(self, valor):
+        self._inicio = self._fim = valor
+        return self
+
+    def limit_to_first(self, limite):
+        self._primeiros = limite
+        return self
+
+    def limit_to_last(self, limite):
+        self._ultimos = limite
+        return self
+
+    def get(self):
+        banco = self._referencia._banco
+        with banco._lock:
+            no = copy.deepcopy(banco._ler(self._referencia._segmentos))
+        if not isinstance(no, dict):
+            return OrderedDict()
+        itens = sorted(no.items(), key=lambda item: (self._ordem(*item), _ordem_chave(item[0])))
+        if self._inicio is not None:
+            inicio = self._ordem_limite(self._inicio)
+            itens = [item for item in itens if self._ordem(*item) >= inicio]
+        if self._fim is not None:
+            fim = self._ordem_limite(self._fim)
+            itens = [item for item in itens if self._ordem(*item) <= fim]
+        if self._primeiros is not None:
+            itens = itens[:self._primeiros]
+        if self._ultimos is not None:
+            itens = itens[len(itens) - self._ultimos:] if self._ultimos < len(itens) else itens
+        return OrderedDict((chave, _para_json(valor)) for chave, valor in itens)
@@ -0,0 +1,178 @@
+"""Streaming com hedge entre os modelos de uma cadeia.
+
+O primeiro modelo da cadeia é chamado normalmente. Se ele não entrega o
+primeiro token dentro do limiar (percentil do TTFT dele, ver
+metricas_modelos), o próximo modelo é disparado em paralelo; se um modelo
+falha ou responde vazio antes do primeiro token, o próximo é disparado na
+hora. O primeiro que entregar um token vence e os outros são cancelados: o
+Cancelamento de cada um derruba a conexão, então um perdedor parado
+esperando o primeiro token não segura a thread nem o socket.
+
+As chamadas rodam no executor recebido (o de ServicoGeracao), que limita
+quantas ficam abertas ao mesmo tempo, hedges incluídos.
+
+Cada modelo passa pelo disjuntor dele (resiliencia): com o disjuntor
+aberto o modelo é pulado sem chamada, e erros transitórios antes do
+primeiro token são repetidos com backoff.
+"""
+import logging
+import queue
+import time
+
+import cliente_llm
+from resiliencia import CircuitoAberto, erro_transitorio, espera_retentativa
+
+logger = logging.getLogger("santchat.llm")
+
+
+def _executar(indice, modelo, chave_api, mensagens, metricas, disjuntores, tentativas, cancelar, fila):
+    """Chama o modelo (já liberado pelo disjuntor) e põe o resultado na fila"""
+    tentativa = 0
+    while True:
+        inicio = time.perf_counter()
+        ttft_ms = None
+        caracteres = 0
+        try:
+            for pedaco in cliente_llm.transmitir(chave_api, mensagens, modelo, cancelar=cancelar):
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - inicio) * 1000
+                    metricas.registrar_ttft(modelo, ttft_ms)
+                    disjuntores.registrar_sucesso(modelo)
+                caracteres += len(pedaco)
+                fila.put((indice, "pedaco", pedaco))
+        except Exception as e:
+            if ttft_ms is not None or cancelar.is_set():
+                if ttft_ms is None:
+                    disjuntores.liberar(modelo)
+                fila.put((indice, "erro", e))
+                return
+            metricas.registrar_erro(modelo)
+            if not erro_transitorio(e):
+                disjuntores.liberar(modelo)
+                fila.put((indice, "erro", e))
+                return
+            retry_after = getattr(e, "retry_after", None)
+            disjuntores.registrar_falha(modelo, retry_after)
+            tentativa += 1
+            if tentativa >= tentativas or not disjuntores.permitir(modelo):
+                fila.put((indice, "erro", e))
+                return
+            espera = espera_retentativa(tentativa - 1, retry_after)
+            logger.info("%s: %s, nova tentativa em %.1fs", modelo, e, espera)
+            # Acorda na hora se o pedido for cancelado durante a espera
+            if cancelar.wait(espera):
+                disjuntores.liberar(modelo)
+                fila.put((indice, "fim", None))
+                return
+            continue
+
+        if not cancelar.is_set():
+            metricas.registrar_sucesso(modelo, (time.perf_counter() - inicio) * 1000, ttft_ms, caracteres)
+        elif ttft_ms is None:
+            # Perdeu o hedge sem chegar ao primeiro token
+            metricas.registrar_desistencia(modelo, (time.perf_counter() - inicio) * 1000)
+        if ttft_ms is None:
+            disjuntores.liberar(modelo)
+        fila.put((indice, "fim", None))
+        return
+
+
+def _cancelar(candidato, disjuntores):
+    """Cancela a chamada de um candidato, esteja ela rodando ou na fila do executor"""
+    modelo, evento, futuro = candidato
+    evento.set()
+    if futuro.cancel():
+        # Nem chegou a começar: devolve a vaga que permitir() reservou
+        disjuntores.liberar(modelo)
+
+
+def transmitir_com_hedge(chave_api, mensagens, modelos, metricas, disjuntores, executor, cancelar=None,
+                         tentativas=3):
+    """Gerador com os pedaços da resposta do modelo que responder primeiro.
+
+    Cada modelo é chamado numa tarefa de `executor`; não use o mesmo executor
+    em que este gerador é consumido, ou os pedidos esperando nele podem tomar
+    todas as threads e as chamadas nunca começarem.
+
+    Erros depois do primeiro token do vencedor são propagados; se todos os
+    modelos falharem antes disso, propaga o erro do primeiro que falhou, ou
+    CircuitoAberto se nenhum pôde ser chamado.
+    """
+    fila = queue.Queue()
+    candidatos = []  # (modelo, Cancelamento, Future da chamada)
+    encerrados = set()
+    erros = []
+    vencedor = None
+
+    modelos = list(modelos)
+    pulados = []
+
+    def disparar():
+        """Chama o próximo modelo com o disjuntor fechado; None se não sobrou nenhum"""
+        while modelos:
+            modelo = modelos.pop(0)
+            if not disjuntores.permitir(modelo):
+                pulados.append(modelo)
+                continue
+            evento = cliente_llm.Cancelamento()
+            futuro = executor.submit(_executar, len(candidatos), modelo, chave_api, mensagens, metricas,
+                                     disjuntores, tentativas, evento, fila)
+            candidatos.append((modelo, evento, futuro))
+            return time.monotonic() + metricas.limiar_hedge(modelo)
+        return None
+
+    prazo = disparar()
+    if prazo is None:
+        raise CircuitoAberto(f"Modelos indisponíveis no momento: {', '.join(pulados)}")
+    try:
+        while True:
+            if cancelar is not None and cancelar.is_set():
+                return
+            pode_disparar = vencedor is None and bool(modelos)
+            espera = 0.25
+            if pode_disparar:
+                espera = min(max(prazo - time.monotonic(), 0), espera)
+            try:
+                indice, tipo, valor = fila.get(timeout=espera)
+            except queue.Empty:
+                if pode_disparar and time.monotonic() >= prazo:
+                    lento = candidatos[-1][0]
+                    metricas.registrar_hedge(lento)
+                    logger.info("hedge: %s sem primeiro token, disparando o próximo modelo", lento)
+                    prazo = disparar() or float("inf")
+                continue
+
+            if vencedor is not None and indice != vencedor:
+                continue
+
+            if tipo == "pedaco":
+                if vencedor is None:
+                    vencedor = indice
+                    metricas.registrar_vitoria(candidatos[indice][0])
+                    for outro, candidato in enumerate(candidatos):
+                        if outro != indice:
+                            _cancelar(candidato, disjuntores)
+                yield valor
+                continue
+
+            if vencedor is not None:
+                # Fim ou erro do próprio vencedor
+                if tipo == "erro":
+                    raise valor
+                return
+
+            # Falhou ou veio vazio antes de qualquer token: passa para o próximo
+            encerrados.add(indice)
+            if tipo == "erro":
+                erros.append(valor)
+            if modelos:
+                logger.info("hedge: %s falhou antes do primeiro token, disparando o próximo modelo",
+                            candidatos[indice][0])
+                prazo = disparar() or float("inf")
+            if len(encerrados) == len(candidatos):
+                if erros:
+                    raise erros[0]
+                return
+    finally:
+        for candidato in candidatos:
+            _cancelar(candidato, disjuntores)
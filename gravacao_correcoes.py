@@ -0,0 +1,74 @@
+"""Gravação das correções revisadas, um update() multi-caminho por operação.
+
+Cada correção tem duas cópias em respostas_revisadas:
+
+    todas_correcoes/{id}                 (índice, busca, contadores de uso)
+    por_categoria/{categoria}/{id}       (por categoria)
+
+Criar, editar, mudar de categoria, ativar/desativar e excluir montam aqui o
+dicionário caminho -> valor com as duas cópias e o app grava tudo num único
+update() a partir de respostas_revisadas: uma ida ao banco, e ou as duas
+cópias mudam ou nenhuma muda. Edições gravam só os campos alterados, para
+não apagar incrementos de uso_count feitos por outra instância no meio.
+
+A lista de categorias é a única coisa lida antes de gravar, e só quando a
+categoria é nova: a inclusão roda numa transação, então dois revisores
+criando categorias ao mesmo tempo não se sobrescrevem.
+"""
+
+RAIZ = "respostas_revisadas"
+TODAS = "todas_correcoes"
+POR_CATEGORIA = "por_categoria"
+CATEGORIAS = "categorias"
+
+
+def caminhos_correcao(correcao_id, categoria):
+    """Caminhos (relativos a RAIZ) das cópias de uma correção"""
+    caminhos = [f"{TODAS}/{correcao_id}"]
+    if categoria:
+        caminhos.append(f"{POR_CATEGORIA}/{categoria}/{correcao_id}")
+    return caminhos
+
+
+def atualizacao_nova(correcao_id, dados):
+    """update() de uma correção nova: as duas cópias inteiras"""
+    return {caminho: dados for caminho in caminhos_correcao(correcao_id, dados.get("categoria"))}
+
+
+def atualizacao_edicao(correcao_id, dados, campos):
+    """update() que aplica `campos` numa correção existente (`dados` é a versão atual).
+
+    Na mesma categoria, grava só os campos nas duas cópias. Mudando de
+    categoria, apaga a cópia antiga e grava a nova inteira, a partir de
+    `dados`: passe a versão do índice, que o listen() mantém em dia
+    (inclusive uso_count).
+    """
+    antiga = dados.get("categoria")
+    nova = campos.get("categoria", antiga)
+    atualizacao = {}
+    for caminho in caminhos_correcao(correcao_id, antiga):
+        if nova != antiga and caminho.startswith(f"{POR_CATEGORIA}/"):
+            atualizacao[caminho] = None
+            continue
+        for campo, valor in campos.items():
+            atualizacao[f"{caminho}/{campo}"] = valor
+    if nova != antiga and nova:
+        atualizacao[f"{POR_CATEGORIA}/{nova}/{correcao_id}"] = {**dados, **campos}
+    return atualizacao
+
+
+def atualizacao_exclusao(correcao_id, categoria):
+    """update() que apaga as duas cópias"""
+    return dict.fromkeys(caminhos_correcao(correcao_id, categoria))
+
+
+def incluir_categoria(ref_categorias, categoria):
+    """Acrescenta `categoria` à lista numa transação (não faz nada se já está lá)"""
+    def incluir(atual):
+        # O Firebase devolve a lista como dict se ela tiver buracos
+        lista = list(atual.values()) if isinstance(atual, dict) else list(atual or [])
+        if categoria not in lista:
+            lista.append(categoria)
+        return lista
+
+    return ref_categorias.transaction(incluir)
@@ -0,0 +1,60 @@
+"""Índice leve dos chats de cada usuário, para a barra lateral.
+
+Cada chat tem uma entrada em logs/usuarios/{user}/indice_chats/{chat} com
+só titulo, ultima_atualizacao e total_mensagens. A entrada é gravada no
+mesmo update() das mensagens (salvar_historico_chat), então nunca fica
+para trás do chat. A barra lateral lê o índice em páginas, do mais recente
+para o mais antigo, e as mensagens só são baixadas quando o chat é aberto.
+
+A consulta ordena por ultima_atualizacao, indexado no servidor pelas
+regras em database.rules.json:
+
+    "logs": {"usuarios": {"$uid": {"indice_chats": {".indexOn": ["ultima_atualizacao"]}}}}
+
+Sem o índice o servidor recusa a consulta (a do Admin SDK vai pela API REST).
+"""
+
+CAMPOS = ("titulo", "ultima_atualizacao", "total_mensagens")
+
+
+def caminho_indice(user_id, chat_id=None):
+    caminho = f"logs/usuarios/{user_id}/indice_chats"
+    return f"{caminho}/{chat_id}" if chat_id else caminho
+
+
+def entrada_indice(chat):
+    """Entrada do índice a partir dos metadados (ou do nó inteiro) do chat"""
+    entrada = {campo: chat.get(campo) for campo in CAMPOS if chat.get(campo) is not None}
+    entrada.setdefault("titulo", "Chat sem título")
+    return entrada
+
+
+def pagina_chats(ref_indice, tamanho, antes=None):
+    """Uma página do índice, do chat mais recente para o mais antigo.
+
+    `antes` é o cursor devolvido pela página anterior. Devolve
+    ([(chat_id, entrada), ...], cursor da próxima página ou None).
+    """
+    limite = tamanho + 1
+    while True:
+        consulta = ref_indice.order_by_child("ultima_atualizacao")
+        if antes is not None:
+            # end_at inclui o próprio cursor e os empates com ele, que são filtrados
+            consulta = consulta.end_at(antes[0])
+        resultado = list((consulta.limit_to_last(limite).get() or {}).items())
+        itens = resultado[::-1]
+        if antes is not None:
+            itens = [
+                (chat_id, entrada) for chat_id, entrada in itens
+                if (entrada.get("ultima_atualizacao", ""), chat_id) < tuple(antes)
+            ]
+        # Empates demais comeram a página: pede mais, se o banco tiver
+        if len(itens) > tamanho or len(resultado) < limite:
+            break
+        limite *= 2
+    pagina = itens[:tamanho]
+    cursor = None
+    if len(itens) > tamanho:
+        chat_id, entrada = pagina[-1]
+        cursor = (entrada.get("ultima_atualizacao", ""), chat_id)
+    return pagina, cursor
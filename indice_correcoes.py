@@ -0,0 +1,390 @@
+import bisect
+import math
+import threading
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+from minhash_lsh import IndiceLSH, assinatura_minhash, decodificar_assinatura
+from motor_similaridade import MotorSimilaridade
+from normalizacao import campos_gravados, normalizar_consulta, remover_acentos, tokens_normalizados
+
+
+def _trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+# Busca do "Gerenciar Correções": palavra na pergunta vale mais que na
+# resposta, e casar só o começo da palavra vale menos que a palavra inteira
+PESO_PERGUNTA = 2.0
+PESO_RESPOSTA = 1.0
+PESO_PREFIXO = 0.6
+# Um prefixo de uma letra casaria com o vocabulário inteiro; passando disso
+# a busca avisa que ficou incompleta
+MAX_EXPANSOES_PREFIXO = 200
+
+
+def _dobrar(texto):
+    """Minúsculas e sem acentos, para a busca por trecho"""
+    return remover_acentos(str(texto or "")).lower()
+
+
+class IndiceCorrecoes:
+    """Índice invertido token -> correção, compartilhado pelo processo.
+
+    Guarda todas as correções (ativas ou não), mas só as ativas entram nos
+    índices usados na busca. A busca devolve exatamente o mesmo resultado que
+    percorrer todas as correções com calcular_similaridade e o limiar > 0.7,
+    só que pontuando apenas as candidatas.
+
+    À parte, mantém um índice textual de todas elas (pergunta e resposta,
+    ativas ou não) para a tela "Gerenciar Correções" (pesquisar).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._correcoes = {}
+        self._textos = {}
+        self._tokens = {}
+        self._por_token = defaultdict(set)
+        # Para os casos "uma pergunta contém a outra" (pontuação 0.9), que
+        # podem acontecer sem nenhuma palavra em comum
+        self._por_trigrama = defaultdict(set)
+        self._ancoras = {}
+        self._por_ancora = defaultdict(set)
+        self._curtas = set()
+        # Snapshot vetorizado das ativas, refeito só quando elas mudam
+        self._motor = None
+        # Quase-duplicatas (SequenceMatcher) só são verificadas nos baldes LSH
+        self._lsh = IndiceLSH()
+        # Atalho O(1): impressão digital da pergunta normalizada -> IDs
+        self._impressoes = {}
+        self._por_impressao = defaultdict(set)
+        # Pergunta normalizada (a gravada), para comparar quase duplicatas
+        # sem acentos, pontuação e palavras funcionais
+        self._normalizadas = {}
+        # Busca textual de todas as correções (ativas ou não): termo -> IDs,
+        # com o vocabulário ordenado para achar prefixos por bisect
+        self._termos_busca = {}
+        self._busca_por_termo = defaultdict(set)
+        self._vocabulario = []
+
+    def carregar(self, todas_correcoes):
+        """Substitui o conteúdo do índice pelo nó todas_correcoes inteiro"""
+        with self._lock:
+            self._correcoes.clear()
+            self._textos.clear()
+            self._tokens.clear()
+            self._por_token.clear()
+            self._por_trigrama.clear()
+            self._ancoras.clear()
+            self._por_ancora.clear()
+            self._curtas.clear()
+            self._motor = None
+            self._lsh = IndiceLSH()
+            self._impressoes.clear()
+            self._por_impressao.clear()
+            self._normalizadas.clear()
+            self._termos_busca.clear()
+            self._busca_por_termo.clear()
+            self._vocabulario = []
+            for correcao_id, dados in (todas_correcoes or {}).items():
+                self.inserir(correcao_id, dados)
+
+    def inserir(self, correcao_id, dados):
+        """Insere ou substitui uma correção"""
+        with self._lock:
+            anterior = self._correcoes.get(correcao_id)
+            if (isinstance(anterior, dict) and isinstance(dados, dict)
+                    and anterior.get("pergunta") == dados.get("pergunta")
+                    and anterior.get("status") == dados.get("status")):
+                # Só mudaram campos que não entram no índice (ex.: uso_count)
+                self._correcoes[correcao_id] = dados
+                if anterior.get("resposta_revisada") != dados.get("resposta_revisada"):
+                    self._indexar_busca(correcao_id, dados)
+                return
+            self.remover(correcao_id)
+            if not isinstance(dados, dict):
+                return
+            self._correcoes[correcao_id] = dados
+            self._indexar_busca(correcao_id, dados)
+            if dados.get("status") != "ativo":
+                return
+            self._motor = None
+
+            texto = dados.get("pergunta", "").lower().strip()
+            tokens = set(texto.split())
+            self._textos[correcao_id] = texto
+            self._tokens[correcao_id] = tokens
+            for token in tokens:
+                self._por_token[token].add(correcao_id)
+
+            # Tokens, impressão e assinatura gravados junto com a correção;
+            # calcula só se faltarem ou forem de outra versão da normalização
+            normalizados, impressao = campos_gravados(dados)
+            self._normalizadas[correcao_id] = " ".join(normalizados)
+            if impressao:
+                self._impressoes[correcao_id] = impressao
+                self._por_impressao[impressao].add(correcao_id)
+
+            assinatura = decodificar_assinatura(dados.get("assinatura_minhash"))
+            if assinatura is None:
+                assinatura = assinatura_minhash(texto)
+            self._lsh.inserir(correcao_id, assinatura)
+
+            trigramas = _trigramas(texto)
+            if not trigramas:
+                self._curtas.add(correcao_id)
+                return
+            for trigrama in trigramas:
+                self._por_trigrama[trigrama].add(correcao_id)
+            # Um único trigrama (o mais raro no momento) basta para achar esta
+            # correção quando ela estiver contida no prompt
+            ancora = min(trigramas, key=lambda t: (len(self._por_trigrama[t]), t))
+            self._ancoras[correcao_id] = ancora
+            self._por_ancora[ancora].add(correcao_id)
+
+    def remover(self, correcao_id):
+        with self._lock:
+            self._correcoes.pop(correcao_id, None)
+            self._desindexar_busca(correcao_id)
+            texto = self._textos.pop(correcao_id, None)
+            if texto is None:
+                return
+            self._motor = None
+            self._lsh.remover(correcao_id)
+            self._normalizadas.pop(correcao_id, None)
+            impressao = self._impressoes.pop(correcao_id, None)
+            if impressao is not None:
+                self._descartar(self._por_impressao, impressao, correcao_id)
+            for token in self._tokens.pop(correcao_id, ()):
+                self._descartar(self._por_token, token, correcao_id)
+            for trigrama in _trigramas(texto):
+                self._descartar(self._por_trigrama, trigrama, correcao_id)
+            ancora = self._ancoras.pop(correcao_id, None)
+            if ancora is not None:
+                self._descartar(self._por_ancora, ancora, correcao_id)
+            self._curtas.discard(correcao_id)
+
+    def atualizar(self, correcao_id, campos):
+        """Aplica uma atualização parcial (ex.: status) numa correção existente"""
+        with self._lock:
+            dados = self._correcoes.get(correcao_id)
+            if dados is None:
+                return
+            self.inserir(correcao_id, {**dados, **campos})
+
+    def motor(self):
+        """MotorSimilaridade com as perguntas ativas (para repontuação em lote)"""
+        with self._lock:
+            if self._motor is None:
+                self._motor = MotorSimilaridade(self._textos)
+            return self._motor
+
+    def obter(self, correcao_id):
+        with self._lock:
+            return self._correcoes.get(correcao_id)
+
+    def categorias(self):
+        """Categorias em uso por alguma correção (todas já estão na lista de categorias)"""
+        with self._lock:
+            return {dados.get("categoria") for dados in self._correcoes.values()}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._correcoes)
+
+    def _indexar_busca(self, correcao_id, dados):
+        self._desindexar_busca(correcao_id)
+        termos = dict.fromkeys(tokens_normalizados(str(dados.get("resposta_revisada", ""))), PESO_RESPOSTA)
+        termos.update(dict.fromkeys(campos_gravados(dados)[0], PESO_PERGUNTA))
+        self._termos_busca[correcao_id] = termos
+        for termo in termos:
+            if termo not in self._busca_por_termo:
+                bisect.insort(self._vocabulario, termo)
+            self._busca_por_termo[termo].add(correcao_id)
+
+    def _desindexar_busca(self, correcao_id):
+        for termo in self._termos_busca.pop(correcao_id, ()):
+            self._descartar(self._busca_por_termo, termo, correcao_id)
+            if termo not in self._busca_por_termo:
+                del self._vocabulario[bisect.bisect_left(self._vocabulario, termo)]
+
+    def _casamentos(self, termo):
+        """({correcao_id: pontuação} das correções com `termo`, inteiro ou como
+        prefixo; True se havia mais que MAX_EXPANSOES_PREFIXO palavras com o prefixo)"""
+        total = len(self._termos_busca)
+        inicio = bisect.bisect_left(self._vocabulario, termo)
+        limite = inicio + MAX_EXPANSOES_PREFIXO
+        fim = bisect.bisect_left(self._vocabulario, termo + "\uffff", inicio, min(limite, len(self._vocabulario)))
+        truncado = fim == limite and limite < len(self._vocabulario) and self._vocabulario[limite].startswith(termo)
+        pontos = {}
+        for palavra in self._vocabulario[inicio:fim]:
+            ids = self._busca_por_termo[palavra]
+            idf = math.log(1 + total / len(ids))
+            fator = 1.0 if palavra == termo else PESO_PREFIXO
+            for correcao_id in ids:
+                valor = idf * fator * self._termos_busca[correcao_id][palavra]
+                if valor > pontos.get(correcao_id, 0):
+                    pontos[correcao_id] = valor
+        return pontos, truncado
+
+    def _trechos(self, trecho):
+        """{correcao_id: pontuação} das correções com `trecho` em qualquer
+        ponto da pergunta ou da resposta (varre todas)"""
+        trecho = _dobrar(trecho)
+        pontos = {}
+        for correcao_id, dados in self._correcoes.items():
+            if trecho in _dobrar(dados.get("pergunta")):
+                pontos[correcao_id] = PESO_PERGUNTA
+            elif trecho in _dobrar(dados.get("resposta_revisada")):
+                pontos[correcao_id] = PESO_RESPOSTA
+        return pontos
+
+    def pesquisar(self, termo_busca="", status=None, categoria=None, uso_minimo=None, uso_maximo=None,
+                  pagina=1, por_pagina=20):
+        """Busca textual para o "Gerenciar Correções", já paginada.
+
+        Cada palavra da busca tem que aparecer na pergunta ou na resposta,
+        inteira ou como começo de palavra. Se assim nada casa, ou se a busca
+        só tem palavras que a normalização descarta ("de", "o que"), vale o
+        texto digitado como trecho em qualquer ponto da pergunta ou da
+        resposta ("artão" acha "cartão"). Ordena pela pontuação (IDF,
+        pergunta acima da resposta, palavra inteira acima de prefixo) e, no
+        empate ou sem busca, pelas mais usadas e mais recentes. Devolve
+        ([(correcao_id, dados, pontuacao), ...], total de resultados,
+        palavras da busca cujo prefixo casou com palavras demais e foi cortado
+        em MAX_EXPANSOES_PREFIXO).
+        """
+        termo_busca = (termo_busca or "").strip()
+        termos = list(dict.fromkeys(tokens_normalizados(termo_busca)))
+        truncados = []
+        with self._lock:
+            pontos = None
+            for termo in termos:
+                casamentos, truncado = self._casamentos(termo)
+                if truncado:
+                    truncados.append(termo)
+                if pontos is None:
+                    pontos = casamentos
+                else:
+                    pontos = {i: pontos[i] + casamentos[i] for i in pontos.keys() & casamentos.keys()}
+                if not pontos:
+                    break
+            if not pontos and termo_busca:
+                pontos, truncados = self._trechos(termo_busca), []
+            elif pontos is None:
+                pontos = dict.fromkeys(self._correcoes, 0.0)
+
+            resultados = []
+            for correcao_id, pontuacao in pontos.items():
+                dados = self._correcoes[correcao_id]
+                if status and dados.get("status", "ativo") != status:
+                    continue
+                if categoria and dados.get("categoria") != categoria:
+                    continue
+                uso = dados.get("uso_count", 0) or 0
+                if uso_minimo is not None and uso < uso_minimo:
+                    continue
+                if uso_maximo is not None and uso > uso_maximo:
+                    continue
+                resultados.append((correcao_id, dados, pontuacao))
+
+        # Timestamp é texto ISO: a ordenação é estável, então primeiro os
+        # mais recentes e depois pontuação e uso por cima
+        resultados.sort(key=lambda r: str(r[1].get("timestamp", "")), reverse=True)
+        resultados.sort(key=lambda r: (-r[2], -(r[1].get("uso_count", 0) or 0)))
+        inicio = (max(pagina, 1) - 1) * por_pagina
+        return resultados[inicio:inicio + por_pagina], len(resultados), truncados
+
+    @staticmethod
+    def _descartar(indice, chave, correcao_id):
+        ids = indice.get(chave)
+        if ids is None:
+            return
+        ids.discard(correcao_id)
+        if not ids:
+            del indice[chave]
+
+    def _candidatas(self, texto, tokens, limiar):
+        # Prompts muito curtos estão contidos em quase tudo: varre as ativas
+        if len(texto) < 3:
+            return set(self._textos)
+
+        candidatas = set(self._curtas)
+
+        # 1. Sobreposição de palavras > limiar exige que a pergunta contenha
+        #    pelo menos um dos ceil((1 - limiar) * n) tokens mais raros do prompt
+        if tokens:
+            raros = sorted(tokens, key=lambda t: (len(self._por_token.get(t, ())), t))
+            for token in raros[:max(1, math.ceil((1 - limiar) * len(tokens)))]:
+                candidatas |= self._por_token.get(token, set())
+
+        # 2. Prompt contido na pergunta: a pergunta tem todos os trigramas do
+        #    prompt, inclusive o mais raro deles
+        trigramas = _trigramas(texto)
+        raro = min(trigramas, key=lambda t: len(self._por_trigrama.get(t, ())))
+        candidatas |= self._por_trigrama.get(raro, set())
+
+        # 3. Pergunta contida no prompt: a âncora dela é um trigrama do prompt
+        for trigrama in trigramas:
+            candidatas |= self._por_ancora.get(trigrama, set())
+
+        return candidatas
+
+    def buscar(self, pergunta, limiar=0.7):
+        """Retorna (correcao_id, dados, pontuacao) da melhor correção ativa
+        acima do limiar, ou None.
+
+        pergunta pode ser o texto ou uma ConsultaNormalizada já preparada.
+        Primeiro tenta a impressão digital (mesma pergunta a menos de
+        maiúsculas, acentos, pontuação e stopwords), que devolve 1.0.
+        """
+        consulta = normalizar_consulta(pergunta)
+
+        with self._lock:
+            exatas = self._por_impressao.get(consulta.impressao) if consulta.impressao else None
+            if exatas:
+                correcao_id = min(exatas)
+                return correcao_id, self._correcoes[correcao_id], 1.0
+
+            candidatas = self._candidatas(consulta.texto, consulta.palavras, limiar)
+            if not candidatas:
+                return None
+            motor = self.motor()
+            # Linhas em ordem crescente de ID: no empate fica o menor ID, como
+            # na varredura antiga (o Firebase devolve os filhos ordenados)
+            linhas = sorted(motor.linha_por_id[correcao_id] for correcao_id in candidatas)
+            resultado = motor.melhor(consulta, limiar, linhas=linhas)
+            if resultado is None:
+                return None
+            correcao_id, pontuacao = resultado
+            return correcao_id, self._correcoes[correcao_id], pontuacao
+
+    @staticmethod
+    def _razao(a, b, limiar):
+        """ratio() do SequenceMatcher, ou 0 se as cotas baratas já ficam no limiar"""
+        comparador = SequenceMatcher(None, a, b)
+        # Cotas superiores baratas antes do ratio() quadrático
+        if comparador.real_quick_ratio() <= limiar or comparador.quick_ratio() <= limiar:
+            return 0.0
+        return comparador.ratio()
+
+    def buscar_quase_duplicata(self, pergunta, limiar=0.7):
+        """Retorna (correcao_id, dados, ratio) da correção ativa mais parecida
+        pelo SequenceMatcher, verificando só as candidatas dos baldes LSH.
+
+        Compara o texto em minúsculas e também as formas normalizadas (a da
+        consulta, calculada uma vez, e a gravada na correção), e fica com a
+        maior razão: acentos e pontuação diferentes não escondem a duplicata.
+        """
+        consulta = normalizar_consulta(pergunta)
+
+        with self._lock:
+            melhor = None
+            for correcao_id in sorted(self._lsh.candidatos(consulta.assinatura)):
+                razao = self._razao(consulta.texto, self._textos[correcao_id], limiar)
+                if consulta.texto_normalizado:
+                    razao = max(razao, self._razao(consulta.texto_normalizado, self._normalizadas[correcao_id], limiar))
+                if razao > limiar and (melhor is None or razao > melhor[2]):
+                    melhor = (correcao_id, self._correcoes[correcao_id], razao)
+            return melhor
@@ -0,0 +1,43 @@
+"""Índice e-mail -> user_id, para o login não varrer todos os usuários.
+
+Cada e-mail tem uma entrada em indices/emails/{chave} com o user_id dono
+dele. A chave é o e-mail normalizado (minúsculas, sem espaços) com os
+caracteres que o Firebase não aceita em chaves trocados por %XX, como numa
+URL ("ana.souza@santander.com.br" -> "ana%2Esouza@santander%2Ecom%2Ebr"),
+então dois e-mails diferentes nunca caem na mesma chave.
+
+criar_usuario reserva o e-mail numa transação antes de criar o usuário: se
+dois cadastros disputam o mesmo e-mail, só um leva. O login lê a entrada e
+depois o usuário, duas leituras pontuais, com 100 ou 1.000.000 de usuários.
+"""
+
+INDICE = "indices/emails"
+
+# Não podem aparecer em chaves do Firebase (mais o próprio %, para a troca não colidir)
+_PROIBIDOS = "%.#$[]/"
+
+
+def normalizar_email(email):
+    return (email or "").strip().lower()
+
+
+def chave_email(email):
+    return "".join(f"%{ord(c):02X}" if c in _PROIBIDOS or ord(c) < 32 or ord(c) == 127 else c
+                   for c in normalizar_email(email))
+
+
+def caminho_email(email):
+    return f"{INDICE}/{chave_email(email)}"
+
+
+def reservar_email(ref_email, user_id):
+    """Reserva o e-mail para `user_id` numa transação; False se já é de outro usuário"""
+    def reservar(atual):
+        return user_id if atual in (None, user_id) else atual
+
+    return ref_email.transaction(reservar) == user_id
+
+
+def liberar_email(ref_email, user_id):
+    """Desfaz a reserva, se ela ainda é de `user_id`"""
+    ref_email.transaction(lambda atual: None if atual == user_id else atual)
@@ -0,0 +1,87 @@
+"""Feedbacks (👍/👎) com chave no tempo, índices por tipo e usuário e contadores.
+
+Cada feedback é gravado, num único update() multi-caminho, em:
+
+    feedbacks/{push_id}                                  (todos)
+    indices/feedbacks/tipo/{tipo}/{push_id}              (só positivos ou negativos)
+    indices/feedbacks/usuario/{user}/todos/{push_id}     (de um usuário)
+    indices/feedbacks/usuario/{user}/{tipo}/{push_id}    (de um usuário, por tipo)
+
+e soma 1 em contadores/{nó} de cada um desses nós (incremento de servidor).
+A página de feedbacks consulta o nó do filtro escolhido uma página por vez
+(pagina_por_chave, do mais novo para o mais antigo) e tira o total do
+contador, sem baixar nada além da página.
+
+O cursor entregue à página é opaco: base64 do nó consultado e do último
+push_id mostrado, então um cursor de outro filtro é ignorado.
+"""
+import base64
+import json
+
+FEEDBACKS = "feedbacks"
+INDICES = "indices/feedbacks"
+POR_USUARIO = f"{INDICES}/usuario"
+CONTADORES = "contadores"
+
+TIPOS = ("positive", "negative")
+
+# Como cada tipo aparece na tela (e variações gravadas por versões antigas)
+ROTULOS = {"positive": "Positivo", "negative": "Negativo"}
+_SINONIMOS = {"positivo": "positive", "like": "positive", "negativo": "negative", "dislike": "negative"}
+
+
+def normalizar_tipo(tipo):
+    """"positive"/"negative" a partir do rótulo da tela ou de valores antigos; None se não reconhece"""
+    tipo = (tipo or "").strip().lower()
+    tipo = _SINONIMOS.get(tipo, tipo)
+    return tipo if tipo in TIPOS else None
+
+
+def no_feedbacks(user_id=None, tipo=None):
+    """Nó a consultar para os filtros dados"""
+    if user_id:
+        return f"{POR_USUARIO}/{user_id}/{tipo or 'todos'}"
+    if tipo:
+        return f"{INDICES}/tipo/{tipo}"
+    return FEEDBACKS
+
+
+def caminho_contador(no):
+    return f"{CONTADORES}/{no}"
+
+
+def atualizacao_feedback(push_id, user_id, pergunta, resposta, tipo, timestamp, incrementar=True):
+    """update() multi-caminho de um feedback: a entrada em todos os nós e os contadores"""
+    tipo = normalizar_tipo(tipo)
+    if tipo is None:
+        raise ValueError("Tipo de feedback desconhecido")
+    entrada = {
+        "user_id": user_id,
+        "pergunta": pergunta,
+        "resposta": resposta,
+        "tipo_feedback": tipo,
+        "timestamp": timestamp,
+    }
+    atualizacao = {}
+    for no in (FEEDBACKS, no_feedbacks(tipo=tipo), no_feedbacks(user_id), no_feedbacks(user_id, tipo)):
+        atualizacao[f"{no}/{push_id}"] = entrada
+        if incrementar:
+            atualizacao[caminho_contador(no)] = {".sv": {"increment": 1}}
+    return atualizacao
+
+
+def codificar_cursor(no, push_id):
+    dados = json.dumps([no, push_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(dados).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(cursor, no):
+    """push_id do cursor; None se ele é inválido ou de outro nó"""
+    if not cursor:
+        return None
+    try:
+        dados = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        no_cursor, push_id = json.loads(dados)
+    except (ValueError, TypeError):
+        return None
+    return push_id if no_cursor == no else None
@@ -0,0 +1,98 @@
+"""Mensagens dos chats gravadas só uma vez (append-only).
+
+Cada mensagem fica em logs/usuarios/{user}/chats/{chat}/mensagens/m{idx:06d}.
+As chaves têm tamanho fixo, então a ordem alfabética do Firebase é a ordem
+da conversa. Salvar um turno manda só as mensagens novas e os metadados
+(titulo, ultima_atualizacao, total_mensagens) num único update().
+
+Chats antigos guardam `mensagens` como lista, que o Firebase devolve como
+lista ou como dict {"0": ..., "1": ...}. Um chat antigo que recebeu
+mensagens depois disso fica misto ("0", "1", ..., "m000002"). ler_mensagens
+entende os três formatos; migracoes.py converte os antigos.
+
+Transcrições longas são lidas em blocos de `TAMANHO_BLOCO` mensagens por
+faixa de chaves (carregar_bloco): ao abrir um chat só vem o bloco final, e
+os anteriores quando o usuário pede. O texto longo pode ir comprimido
+(codec_mensagens); ler_mensagens devolve tudo já decodificado.
+"""
+import re
+
+from codec_mensagens import codificar_mensagem, decodificar_mensagem
+
+PREFIXO = "m"
+TAMANHO_BLOCO = 50
+_CHAVE = re.compile(r"^m?(\d+)$")
+
+
+def chave_mensagem(indice):
+    return f"{PREFIXO}{indice:06d}"
+
+
+def indice_mensagem(chave):
+    """Posição da mensagem a partir da chave ("m000012" ou "12"); None se não for mensagem"""
+    encontrado = _CHAVE.match(str(chave))
+    return int(encontrado.group(1)) if encontrado else None
+
+
+def ler_mensagens(valor):
+    """Lista ordenada das mensagens, a partir do que o get() devolveu"""
+    if not valor:
+        return []
+    if isinstance(valor, list):
+        return [decodificar_mensagem(msg) for msg in valor if msg is not None]
+    por_indice = {}
+    for chave, msg in valor.items():
+        indice = indice_mensagem(chave)
+        if indice is None or msg is None:
+            continue
+        # Chave nova ganha da antiga se as duas existirem
+        if indice not in por_indice or str(chave).startswith(PREFIXO):
+            por_indice[indice] = msg
+    return [decodificar_mensagem(por_indice[i]) for i in sorted(por_indice)]
+
+
+def atualizacao_chat(historico, ja_salvas, titulo, agora, inicio=0):
+    """update() multi-caminho do nó do chat: mensagens a partir de `ja_salvas` e metadados
+
+    `inicio` é a posição no chat da primeira mensagem de `historico` (quando
+    só os últimos blocos foram carregados); `titulo` None não altera o título.
+    """
+    atualizacao = {
+        f"mensagens/{chave_mensagem(inicio + indice)}": codificar_mensagem(historico[indice])
+        for indice in range(ja_salvas, len(historico))
+    }
+    if titulo is not None:
+        atualizacao["titulo"] = titulo
+    atualizacao.update({
+        "ultima_atualizacao": agora,
+        "total_mensagens": inicio + len(historico),
+    })
+    return atualizacao
+
+
+def inicio_bloco(total, ate_indice=None, tamanho=TAMANHO_BLOCO):
+    """Primeira mensagem a carregar ao abrir um chat: o último bloco, e tudo o que
+    o resumo (que cobre até `ate_indice`) ainda não cobre"""
+    inicio = max(total - tamanho, 0)
+    if ate_indice is not None:
+        inicio = min(inicio, ate_indice)
+    return inicio - inicio % tamanho
+
+
+def carregar_bloco(ref_mensagens, inicio, fim=None):
+    """Mensagens [inicio, fim) por faixa de chaves.
+
+    Chaves do formato antigo ("0", "1"...) ficam fora da faixa: num chat não
+    migrado vêm menos mensagens do que o esperado.
+    """
+    consulta = ref_mensagens.order_by_key().start_at(chave_mensagem(inicio))
+    if fim is not None:
+        consulta = consulta.end_at(chave_mensagem(fim - 1))
+    return ler_mensagens(consulta.get())
+
+
+def converter_lista(valor):
+    """Mensagens no formato antigo (ou misto) -> dict com as chaves novas; None se já está no novo"""
+    if not valor or isinstance(valor, dict) and all(str(chave).startswith(PREFIXO) for chave in valor):
+        return None
+    return {chave_mensagem(i): codificar_mensagem(msg) for i, msg in enumerate(ler_mensagens(valor))}
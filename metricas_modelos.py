@@ -0,0 +1,162 @@
+"""Latência observada de cada modelo, usada para decidir quando fazer hedge.
+
+Cada modelo tem um histograma do tempo até o primeiro token (TTFT) e outro
+do tempo total, com baldes em progressão geométrica de 50ms a ~2min. Os
+contadores são reduzidos à metade de tempos em tempos, para o histograma
+acompanhar mudanças de comportamento do provedor.
+
+Para o roteador (roteador_modelos) também há médias móveis exponenciais
+(EWMA) do TTFT, do tempo total, da taxa de erro e da vazão em caracteres
+por segundo depois do primeiro token.
+"""
+import bisect
+import threading
+
+# Limites superiores dos baldes, em ms (50ms, 67ms, 91ms, ... ~2min)
+LIMITES_MS = [round(50 * 1.35 ** i) for i in range(27)]
+
+
+class HistogramaLatencia:
+    def __init__(self, meia_vida=500):
+        self._meia_vida = meia_vida
+        self.contagens = [0.0] * (len(LIMITES_MS) + 1)
+        self.total = 0.0
+        self.desde_reducao = 0
+
+    def registrar(self, ms):
+        self.contagens[bisect.bisect_left(LIMITES_MS, ms)] += 1
+        self.total += 1
+        self.desde_reducao += 1
+        if self.desde_reducao >= self._meia_vida:
+            self.contagens = [c / 2 for c in self.contagens]
+            self.total /= 2
+            self.desde_reducao = 0
+
+    def percentil(self, p):
+        """Limite superior do balde onde cai o percentil p (0-1), em ms; None sem amostras"""
+        if not self.total:
+            return None
+        alvo = p * self.total
+        acumulado = 0.0
+        for i, contagem in enumerate(self.contagens):
+            acumulado += contagem
+            if acumulado >= alvo and contagem:
+                return LIMITES_MS[i] if i < len(LIMITES_MS) else LIMITES_MS[-1] * 1.35
+        return LIMITES_MS[-1] * 1.35
+
+
+def _ewma(atual, valor, alfa):
+    return valor if atual is None else atual + alfa * (valor - atual)
+
+
+class MetricasModelos:
+    def __init__(self, percentil_hedge=0.9, amostras_minimas=20, limiar_padrao=8.0,
+                 limiar_minimo=1.0, limiar_maximo=20.0, alfa=0.2):
+        self.percentil_hedge = percentil_hedge
+        self.amostras_minimas = amostras_minimas
+        self.limiar_padrao = limiar_padrao
+        self.limiar_minimo = limiar_minimo
+        self.limiar_maximo = limiar_maximo
+        self.alfa = alfa
+        self._lock = threading.Lock()
+        self._modelos = {}
+
+    def _modelo(self, modelo):
+        dados = self._modelos.get(modelo)
+        if dados is None:
+            dados = self._modelos[modelo] = {
+                "ttft": HistogramaLatencia(),
+                "total": HistogramaLatencia(),
+                "sucessos": 0,
+                "erros": 0,
+                "hedges": 0,
+                "vitorias": 0,
+                "ewma_ttft_ms": None,
+                "ewma_total_ms": None,
+                "ewma_erro": 0.0,
+                "ewma_vazao": None,
+            }
+        return dados
+
+    def registrar_ttft(self, modelo, ms):
+        with self._lock:
+            dados = self._modelo(modelo)
+            dados["ttft"].registrar(ms)
+            dados["ewma_ttft_ms"] = _ewma(dados["ewma_ttft_ms"], ms, self.alfa)
+
+    def registrar_sucesso(self, modelo, ms, ttft_ms=None, caracteres=0):
+        with self._lock:
+            dados = self._modelo(modelo)
+            dados["total"].registrar(ms)
+            dados["sucessos"] += 1
+            dados["ewma_total_ms"] = _ewma(dados["ewma_total_ms"], ms, self.alfa)
+            dados["ewma_erro"] = _ewma(dados["ewma_erro"], 0.0, self.alfa)
+            geracao_ms = ms - (ttft_ms or 0)
+            if caracteres and geracao_ms > 0:
+                dados["ewma_vazao"] = _ewma(dados["ewma_vazao"], caracteres * 1000 / geracao_ms, self.alfa)
+
+    def registrar_erro(self, modelo):
+        with self._lock:
+            dados = self._modelo(modelo)
+            dados["erros"] += 1
+            dados["ewma_erro"] = _ewma(dados["ewma_erro"], 1.0, self.alfa)
+
+    def registrar_desistencia(self, modelo, ms):
+        """Cancelado sem primeiro token depois de `ms`: o TTFT real é pelo menos isso"""
+        with self._lock:
+            dados = self._modelo(modelo)
+            if dados["ewma_ttft_ms"] is None or ms > dados["ewma_ttft_ms"]:
+                dados["ewma_ttft_ms"] = _ewma(dados["ewma_ttft_ms"], ms, self.alfa)
+
+    def ewma(self, modelo):
+        """(ttft_ms, total_ms, taxa_erro, vazao em caracteres/s); None onde ainda não há amostra"""
+        with self._lock:
+            dados = self._modelos.get(modelo)
+            if dados is None:
+                return None, None, 0.0, None
+            return dados["ewma_ttft_ms"], dados["ewma_total_ms"], dados["ewma_erro"], dados["ewma_vazao"]
+
+    def registrar_hedge(self, modelo):
+        """`modelo` demorou demais para o primeiro token e outro foi disparado"""
+        with self._lock:
+            self._modelo(modelo)["hedges"] += 1
+
+    def registrar_vitoria(self, modelo):
+        with self._lock:
+            self._modelo(modelo)["vitorias"] += 1
+
+    def limiar_hedge(self, modelo):
+        """Segundos sem primeiro token antes de disparar o próximo modelo da cadeia"""
+        with self._lock:
+            histograma = self._modelo(modelo)["ttft"]
+            if histograma.total < self.amostras_minimas:
+                return self.limiar_padrao
+            ms = histograma.percentil(self.percentil_hedge)
+        return min(max(ms / 1000, self.limiar_minimo), self.limiar_maximo)
+
+    def resumo(self):
+        """Números de cada modelo para mostrar na tela ou no log"""
+        with self._lock:
+            modelos = list(self._modelos)
+        saida = {}
+        for modelo in modelos:
+            limiar = self.limiar_hedge(modelo)
+            with self._lock:
+                dados = self._modelos[modelo]
+                saida[modelo] = {
+                    "ttft_p50_ms": dados["ttft"].percentil(0.5),
+                    "ttft_p90_ms": dados["ttft"].percentil(0.9),
+                    "ttft_p99_ms": dados["ttft"].percentil(0.99),
+                    "total_p50_ms": dados["total"].percentil(0.5),
+                    "total_p99_ms": dados["total"].percentil(0.99),
+                    "sucessos": dados["sucessos"],
+                    "erros": dados["erros"],
+                    "hedges": dados["hedges"],
+                    "vitorias": dados["vitorias"],
+                    "limiar_hedge_s": limiar,
+                    "ewma_ttft_ms": dados["ewma_ttft_ms"],
+                    "ewma_total_ms": dados["ewma_total_ms"],
+                    "ewma_erro": dados["ewma_erro"],
+                    "ewma_vazao": dados["ewma_vazao"],
+                }
+        return saida
@@ -0,0 +1,279 @@
+"""Migrações de dados do Realtime Database, para rodar fora do Streamlit.
+
+Uso:
+    python migracoes.py --credenciais firebase_key.json --url https://<projeto>.firebaseio.com <migração> [--aplicar]
+    python migracoes.py --armazenamento sqlite --caminho dados/santchat.sqlite3 <migração> [--aplicar]
+
+Sem --aplicar só mostra o que seria alterado.
+
+mensagens: converte as mensagens dos chats do formato antigo (lista
+regravada inteira a cada turno) para o append-only de mensagens_chat
+(chaves m000000, m000001...). Cada chat é convertido numa transação, então
+uma sessão gravando no mesmo chat durante a migração não perde mensagens.
+
+indice-chats: cria logs/usuarios/{user}/indice_chats (indice_chats.py) para
+os chats que ainda não têm entrada, lendo só os metadados de cada chat.
+
+emails: cria o índice indices/emails (indice_emails.py) para os usuários
+existentes. E-mails repetidos entre usuários ficam com o cadastro mais
+antigo e são listados para resolver à mão.
+
+interacoes: preenche o feed do "Treinar IA" (feed_interacoes.py) com as
+respostas já salvas nos chats. Pula as respostas (chat e posição) que já
+estão no índice do usuário, seja porque salvar_historico_chat as gravou,
+seja porque a migração já rodou, então rodar de novo não duplica nada.
+
+feedbacks: copia os feedbacks de logs/feedbacks/{user}/{ts} para o
+formato de indice_feedbacks.py (feed, índices por tipo e usuário) e
+recalcula os contadores pela contagem dos nós. Também aqui os push_ids são
+fixos, então a migração pode rodar de novo.
+
+normalizacao: regrava pergunta_normalizada e impressao_digital das
+correções gravadas com outra versão da normalização (normalizacao.VERSAO),
+nas duas cópias. Sem isso o índice recalcula esses campos a cada carga.
+"""
+import argparse
+from datetime import datetime
+
+from armazenamento import TIPOS, criar_armazenamento
+from indice_chats import CAMPOS, caminho_indice, entrada_indice
+from feed_interacoes import POR_USUARIO as INTERACOES_POR_USUARIO, atualizacao_interacao, entradas_novas, push_id_fixo
+from indice_feedbacks import FEEDBACKS, POR_USUARIO, TIPOS as TIPOS_FEEDBACK, atualizacao_feedback, caminho_contador, no_feedbacks, normalizar_tipo
+from indice_emails import INDICE, chave_email
+from mensagens_chat import converter_lista, ler_mensagens
+from gravacao_correcoes import RAIZ, TODAS, caminhos_correcao
+from normalizacao import VERSAO, campos_normalizados
+
+
+banco = None
+
+
+def iniciar_armazenamento(tipo, credenciais=None, url=None, caminho=None):
+    global banco
+    banco = criar_armazenamento(tipo, credenciais=credenciais, url=url, caminho=caminho)
+
+
+def migrar_mensagens(aplicar=False):
+    usuarios = banco.reference("logs/usuarios").get(shallow=True) or {}
+    convertidos = 0
+    for user_id in usuarios:
+        chats = banco.reference(f"logs/usuarios/{user_id}/chats").get(shallow=True) or {}
+        for chat_id in chats:
+            ref = banco.reference(f"logs/usuarios/{user_id}/chats/{chat_id}")
+            mensagens = ref.child("mensagens").get()
+            if converter_lista(mensagens) is None:
+                continue
+            convertidos += 1
+            print(f"{user_id}/{chat_id}: {len(ler_mensagens(mensagens))} mensagens"
+                  + ("" if aplicar else " (simulação)"))
+            if not aplicar:
+                continue
+
+            def converter(atual):
+                novo = converter_lista(atual)
+                return atual if novo is None else novo
+
+            resultado = ref.child("mensagens").transaction(converter)
+            ref.update({"total_mensagens": len(ler_mensagens(resultado))})
+    print(f"{convertidos} chats {'convertidos' if aplicar else 'a converter'}")
+    return convertidos
+
+
+def indexar_chats(aplicar=False):
+    usuarios = banco.reference("logs/usuarios").get(shallow=True) or {}
+    criadas = 0
+    for user_id in usuarios:
+        chats = banco.reference(f"logs/usuarios/{user_id}/chats").get(shallow=True) or {}
+        indexados = banco.reference(caminho_indice(user_id)).get(shallow=True) or {}
+        entradas = {}
+        for chat_id in chats:
+            if chat_id in indexados:
+                continue
+            ref = banco.reference(f"logs/usuarios/{user_id}/chats/{chat_id}")
+            # Campo a campo, para não baixar as mensagens
+            metadados = {campo: ref.child(campo).get() for campo in CAMPOS}
+            if metadados["total_mensagens"] is None:
+                metadados["total_mensagens"] = len(ref.child("mensagens").get(shallow=True) or {})
+            entradas[caminho_indice(user_id, chat_id)] = entrada_indice(metadados)
+        if not entradas:
+            continue
+        criadas += len(entradas)
+        print(f"{user_id}: {len(entradas)} chats" + ("" if aplicar else " (simulação)"))
+        if aplicar:
+            banco.reference("/").update(entradas)
+    print(f"{criadas} entradas {'criadas' if aplicar else 'a criar'}")
+    return criadas
+
+
+def indexar_emails(aplicar=False):
+    usuarios = banco.reference("usuarios").get(shallow=True) or {}
+    indexados = banco.reference(INDICE).get(shallow=True) or {}
+    donos = {}
+    for user_id in usuarios:
+        ref = banco.reference(f"usuarios/{user_id}")
+        email = ref.child("email").get()
+        if not email:
+            print(f"{user_id}: sem e-mail")
+            continue
+        donos.setdefault(chave_email(email), []).append((ref.child("criado_em").get() or "", user_id))
+
+    entradas = {}
+    for chave, candidatos in donos.items():
+        candidatos.sort()
+        if len(candidatos) > 1:
+            print(f"{chave}: e-mail repetido em {', '.join(u for _, u in candidatos)}; fica {candidatos[0][1]}")
+        if chave not in indexados:
+            entradas[f"{INDICE}/{chave}"] = candidatos[0][1]
+
+    print(f"{len(entradas)} e-mails {'indexados' if aplicar else 'a indexar'}")
+    if aplicar:
+        itens = list(entradas.items())
+        for inicio in range(0, len(itens), 500):
+            banco.reference("/").update(dict(itens[inicio:inicio + 500]))
+    return len(entradas)
+
+
+def preencher_interacoes(aplicar=False):
+    usuarios = banco.reference("logs/usuarios").get(shallow=True) or {}
+    total = 0
+    for user_id in usuarios:
+        chats = banco.reference(f"logs/usuarios/{user_id}/chats").get(shallow=True) or {}
+        if not chats:
+            continue
+        # O app grava cada resposta nova com um push_id aleatório: o que já
+        # está no índice do usuário se reconhece pelo chat e pela posição
+        existentes = {
+            (entrada.get("chat_id"), entrada.get("indice"))
+            for entrada in (banco.reference(f"{INTERACOES_POR_USUARIO}/{user_id}").get() or {}).values()
+        }
+        entradas = {}
+        for chat_id in chats:
+            chat = banco.reference(f"logs/usuarios/{user_id}/chats/{chat_id}").get() or {}
+            timestamp = chat.get("ultima_atualizacao") or datetime.now().isoformat()
+            try:
+                ms = int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+            except ValueError:
+                ms = int(datetime.now().timestamp() * 1000)
+            for posicao, pergunta, resposta in entradas_novas(ler_mensagens(chat.get("mensagens")), 0):
+                if (chat_id, posicao) in existentes:
+                    continue
+                push_id = push_id_fixo(ms, f"{user_id}/{chat_id}", posicao)
+                entradas.update(atualizacao_interacao(push_id, user_id, chat_id, posicao, pergunta, resposta, timestamp))
+        if not entradas:
+            continue
+        total += len(entradas) // 2
+        print(f"{user_id}: {len(entradas) // 2} interações" + ("" if aplicar else " (simulação)"))
+        if aplicar:
+            itens = list(entradas.items())
+            for inicio in range(0, len(itens), 500):
+                banco.reference("/").update(dict(itens[inicio:inicio + 500]))
+    print(f"{total} interações {'gravadas' if aplicar else 'a gravar'}")
+    return total
+
+
+def _ms(timestamp):
+    try:
+        return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+    except (TypeError, ValueError):
+        return int(datetime.now().timestamp() * 1000)
+
+
+def migrar_feedbacks(aplicar=False):
+    usuarios = banco.reference("logs/feedbacks").get(shallow=True) or {}
+    entradas = {}
+    for user_id in usuarios:
+        for ts, feedback in (banco.reference(f"logs/feedbacks/{user_id}").get() or {}).items():
+            tipo = normalizar_tipo(feedback.get("tipo_feedback"))
+            if tipo is None:
+                print(f"{user_id}/{ts}: tipo desconhecido {feedback.get('tipo_feedback')!r}, ignorado")
+                continue
+            timestamp = feedback.get("timestamp") or ""
+            push_id = push_id_fixo(_ms(timestamp), f"{user_id}/{ts}", 0)
+            entradas.update(atualizacao_feedback(
+                push_id, user_id, feedback.get("pergunta", ""), feedback.get("resposta", ""), tipo, timestamp,
+                incrementar=False
+            ))
+    print(f"{len(entradas) // 4} feedbacks {'migrados' if aplicar else 'a migrar'}")
+    if not aplicar:
+        return len(entradas) // 4
+
+    itens = list(entradas.items())
+    for inicio in range(0, len(itens), 500):
+        banco.reference("/").update(dict(itens[inicio:inicio + 500]))
+
+    # Contadores pela contagem de cada nó (vale também para o que já estava no formato novo)
+    nos = [FEEDBACKS] + [no_feedbacks(tipo=tipo) for tipo in TIPOS_FEEDBACK]
+    for user_id in banco.reference(POR_USUARIO).get(shallow=True) or {}:
+        nos += [no_feedbacks(user_id)] + [no_feedbacks(user_id, tipo) for tipo in TIPOS_FEEDBACK]
+    banco.reference("/").update({
+        caminho_contador(no): len(banco.reference(no).get(shallow=True) or {}) for no in nos
+    })
+    return len(entradas) // 4
+
+
+def renormalizar_correcoes(aplicar=False):
+    correcoes = banco.reference(f"{RAIZ}/{TODAS}").get() or {}
+    atualizacao = {}
+    alteradas = 0
+    for correcao_id, dados in correcoes.items():
+        if not isinstance(dados, dict) or dados.get("normalizacao_versao") == VERSAO:
+            continue
+        alteradas += 1
+        campos = campos_normalizados(dados.get("pergunta", ""))
+        for caminho in caminhos_correcao(correcao_id, dados.get("categoria")):
+            for campo, valor in campos.items():
+                atualizacao[f"{caminho}/{campo}"] = valor
+    print(f"{alteradas} correções {'renormalizadas' if aplicar else 'a renormalizar'}")
+    if aplicar:
+        itens = list(atualizacao.items())
+        for inicio in range(0, len(itens), 500):
+            banco.reference(RAIZ).update(dict(itens[inicio:inicio + 500]))
+    return alteradas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--armazenamento", choices=TIPOS, default="firebase")
+    parser.add_argument("--credenciais", default="firebase_key.json", help="JSON da conta de serviço")
+    parser.add_argument("--url", help="URL do Realtime Database")
+    parser.add_argument("--caminho", default="dados/santchat.sqlite3", help="arquivo do armazenamento sqlite")
+    subparsers = parser.add_subparsers(dest="migracao", required=True)
+
+    mensagens = subparsers.add_parser("mensagens", help="mensagens dos chats para o formato append-only")
+    mensagens.add_argument("--aplicar", action="store_true", help="grava as alterações")
+
+    indice = subparsers.add_parser("indice-chats", help="índice de chats da barra lateral")
+    indice.add_argument("--aplicar", action="store_true", help="grava as alterações")
+
+    emails = subparsers.add_parser("emails", help="índice e-mail -> usuário do login")
+    emails.add_argument("--aplicar", action="store_true", help="grava as alterações")
+
+    interacoes = subparsers.add_parser("interacoes", help="feed de interações do Treinar IA")
+    interacoes.add_argument("--aplicar", action="store_true", help="grava as alterações")
+
+    feedbacks = subparsers.add_parser("feedbacks", help="feedbacks para o formato paginado, com contadores")
+    feedbacks.add_argument("--aplicar", action="store_true", help="grava as alterações")
+
+    normalizacao = subparsers.add_parser("normalizacao", help="campos normalizados das correções")
+    normalizacao.add_argument("--aplicar", action="store_true", help="grava as alterações")
+
+    args = parser.parse_args()
+    if args.armazenamento == "firebase" and not args.url:
+        parser.error("--url é obrigatório com o armazenamento firebase")
+    iniciar_armazenamento(args.armazenamento, args.credenciais, args.url, args.caminho)
+    if args.migracao == "mensagens":
+        migrar_mensagens(args.aplicar)
+    elif args.migracao == "indice-chats":
+        indexar_chats(args.aplicar)
+    elif args.migracao == "emails":
+        indexar_emails(args.aplicar)
+    elif args.migracao == "interacoes":
+        preencher_interacoes(args.aplicar)
+    elif args.migracao == "feedbacks":
+        migrar_feedbacks(args.aplicar)
+    elif args.migracao == "normalizacao":
+        renormalizar_correcoes(args.aplicar)
+
+
+if __name__ == "__main__":
+    main()
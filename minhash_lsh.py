@@ -0,0 +1,133 @@
+"""Assinaturas MinHash e índice LSH por bandas para achar perguntas parecidas.
+
+A assinatura é calculada sobre os trigramas de caracteres da pergunta (o mesmo
+texto que o SequenceMatcher compara) e é determinística entre processos, por
+isso pode ser gravada junto com a correção e reaproveitada na carga do índice.
+"""
+import base64
+import zlib
+from array import array
+
+import numpy as np
+
+NUM_PERMUTACOES = 128
+# 32 bandas de 4 linhas: a curva S sobe em Jaccard de trigramas ~0.42
+# ((1/32) ** (1/4)), faixa das perguntas com ratio() pouco acima de 0.7.
+# Com 64x2 quase metade do corpus virava candidata já em Jaccard 0.1;
+# com 16x8 (subida em ~0.7) perguntas com ratio() > 0.7 ficavam de fora
+BANDAS = 32
+_PRIMO = (1 << 31) - 1
+_PREFIXO = "mh1:"
+
+_gerador = np.random.default_rng(20240611)
+_A = _gerador.integers(1, _PRIMO, NUM_PERMUTACOES, dtype=np.uint64)
+_B = _gerador.integers(0, _PRIMO, NUM_PERMUTACOES, dtype=np.uint64)
+
+
+def _shingles(texto):
+    texto = texto.lower().strip()
+    if len(texto) < 3:
+        return {texto}
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def assinatura_minhash(texto):
+    """Vetor uint32 com NUM_PERMUTACOES mínimos de hash dos trigramas"""
+    hashes = np.array([zlib.crc32(s.encode("utf-8")) for s in _shingles(texto)], dtype=np.uint64)
+    valores = (np.outer(hashes, _A) + _B) % _PRIMO
+    return valores.min(axis=0).astype(np.uint32)
+
+
+def codificar_assinatura(assinatura):
+    """Texto compacto para gravar no Firebase"""
+    return _PREFIXO + base64.b64encode(assinatura.astype("<u4").tobytes()).decode("ascii")
+
+
+def decodificar_assinatura(texto):
+    """Assinatura gravada -> vetor, ou None se não existir ou for de outra versão"""
+    if not isinstance(texto, str) or not texto.startswith(_PREFIXO):
+        return None
+    try:
+        bruto = base64.b64decode(texto[len(_PREFIXO):])
+    except ValueError:
+        return None
+    if len(bruto) != NUM_PERMUTACOES * 4:
+        return None
+    return np.frombuffer(bruto, dtype="<u4").astype(np.uint32)
+
+
+class IndiceLSH:
+    """Assinaturas numa matriz NumPy e baldes por banda em array('i') de linhas.
+
+    Remoções só marcam a linha como morta; quando as mortas passam da metade
+    a matriz é compactada.
+    """
+
+    def __init__(self, bandas=BANDAS):
+        if NUM_PERMUTACOES % bandas:
+            raise ValueError("NUM_PERMUTACOES precisa ser múltiplo de bandas")
+        self._bandas = bandas
+        self._linhas_por_banda = NUM_PERMUTACOES // bandas
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._assinaturas = np.empty((64, NUM_PERMUTACOES), dtype=np.uint32)
+        self._vivas = np.zeros(64, dtype=bool)
+        self._total = 0
+        self._ids = []
+        self._linha_por_id = {}
+        self._baldes = {}
+
+    def __len__(self):
+        return len(self._linha_por_id)
+
+    def _chaves(self, assinatura):
+        largura = self._linhas_por_banda
+        bruto = assinatura.astype("<u4").tobytes()
+        passo = largura * 4
+        return [
+            (banda << 64) | int.from_bytes(bruto[banda * passo:(banda + 1) * passo], "little")
+            for banda in range(self._bandas)
+        ]
+
+    def inserir(self, item_id, assinatura):
+        self.remover(item_id)
+        if self._total == len(self._assinaturas):
+            capacidade = 2 * len(self._assinaturas)
+            self._assinaturas = np.resize(self._assinaturas, (capacidade, NUM_PERMUTACOES))
+            self._vivas = np.concatenate([self._vivas, np.zeros(capacidade - len(self._vivas), dtype=bool)])
+
+        linha = self._total
+        self._total += 1
+        self._assinaturas[linha] = assinatura
+        self._vivas[linha] = True
+        self._ids.append(item_id)
+        self._linha_por_id[item_id] = linha
+        for chave in self._chaves(assinatura):
+            balde = self._baldes.get(chave)
+            if balde is None:
+                balde = self._baldes[chave] = array("i")
+            balde.append(linha)
+
+    def remover(self, item_id):
+        linha = self._linha_por_id.pop(item_id, None)
+        if linha is None:
+            return
+        self._vivas[linha] = False
+        if self._total - len(self._linha_por_id) > max(64, self._total // 2):
+            self._compactar()
+
+    def _compactar(self):
+        vivas = [(item_id, self._assinaturas[linha].copy()) for item_id, linha in self._linha_por_id.items()]
+        self._reiniciar()
+        for item_id, assinatura in vivas:
+            self.inserir(item_id, assinatura)
+
+    def candidatos(self, assinatura):
+        """IDs que caem em pelo menos um balde em comum com a assinatura"""
+        baldes = [self._baldes[c] for c in self._chaves(assinatura) if c in self._baldes]
+        if not baldes:
+            return set()
+        linhas = np.unique(np.concatenate([np.frombuffer(b, dtype=np.intc) for b in baldes]))
+        linhas = linhas[self._vivas[linhas]]
+        return {self._ids[linha] for linha in linhas}
@@ -0,0 +1,123 @@
+"""Pontuação vetorizada (NumPy) das perguntas revisadas.
+
+As perguntas ficam numa matriz termo x pergunta esparsa, guardada por termo
+(indptr + linhas, como um CSC sem o scipy). Contar as palavras em comum entre
+um prompt e todas as perguntas vira um único np.bincount sobre as linhas dos
+termos do prompt.
+
+Modos:
+- "compat": reproduz exatamente calcular_similaridade (1.0 se iguais, 0.9 se
+  uma contém a outra, senão palavras em comum / maior número de palavras);
+- "cosseno": cosseno entre os conjuntos de palavras, sem comparar strings.
+"""
+import numpy as np
+
+MODOS = ("compat", "cosseno")
+
+
+def _preparar(pergunta):
+    # Uma ConsultaNormalizada já traz o texto e as palavras prontos
+    if hasattr(pergunta, "palavras"):
+        return pergunta.texto, pergunta.palavras
+    texto = pergunta.lower().strip()
+    return texto, set(texto.split())
+
+
+class MotorSimilaridade:
+    def __init__(self, perguntas):
+        """perguntas: dict {id: texto da pergunta}"""
+        self.ids = sorted(perguntas)
+        self.linha_por_id = {correcao_id: i for i, correcao_id in enumerate(self.ids)}
+        preparadas = [_preparar(perguntas[i]) for i in self.ids]
+        self._textos = np.array([texto for texto, _ in preparadas], dtype=str)
+        self._tamanhos = np.array([len(tokens) for _, tokens in preparadas], dtype=np.int32)
+
+        self._vocabulario = {}
+        colunas, linhas = [], []
+        for linha, (_, tokens) in enumerate(preparadas):
+            for token in tokens:
+                colunas.append(self._vocabulario.setdefault(token, len(self._vocabulario)))
+                linhas.append(linha)
+        colunas = np.array(colunas, dtype=np.int64)
+        ordem = np.argsort(colunas, kind="stable")
+        self._linhas = np.array(linhas, dtype=np.int32)[ordem]
+        self._indptr = np.zeros(len(self._vocabulario) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(colunas, minlength=len(self._vocabulario)), out=self._indptr[1:])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _linhas_dos_tokens(self, tokens):
+        partes = [
+            self._linhas[self._indptr[c]:self._indptr[c + 1]]
+            for c in (self._vocabulario.get(t) for t in tokens) if c is not None
+        ]
+        return np.concatenate(partes) if partes else np.empty(0, dtype=np.int32)
+
+    def _combinar(self, comuns, n_tokens, texto, modo, linhas=None):
+        tamanhos = self._tamanhos if linhas is None else self._tamanhos[linhas]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if modo == "cosseno":
+                pontuacao = comuns / np.sqrt(tamanhos * float(n_tokens))
+            else:
+                pontuacao = comuns / np.maximum(tamanhos, n_tokens)
+        pontuacao = np.nan_to_num(pontuacao, nan=0.0, posinf=0.0)
+
+        if modo == "compat":
+            textos = self._textos if linhas is None else self._textos[linhas]
+            contem = (np.char.find(textos, texto) >= 0) | (np.char.find(texto, textos) >= 0)
+            pontuacao = np.where(contem, 0.9, pontuacao)
+            pontuacao = np.where(textos == texto, 1.0, pontuacao)
+        return pontuacao
+
+    def pontuar(self, pergunta, modo="compat", linhas=None):
+        """Pontua o prompt contra todas as perguntas (ou só as linhas dadas)"""
+        if modo not in MODOS:
+            raise ValueError(f"Modo desconhecido: {modo}")
+        if not len(self):
+            return np.zeros(0)
+        texto, tokens = _preparar(pergunta)
+        comuns = np.bincount(self._linhas_dos_tokens(tokens), minlength=len(self))
+        if linhas is not None:
+            linhas = np.asarray(linhas, dtype=np.int64)
+            comuns = comuns[linhas]
+        return self._combinar(comuns, len(tokens), texto, modo, linhas)
+
+    def pontuar_lote(self, perguntas, modo="compat"):
+        """Matriz (len(perguntas), len(self)) com as pontuações de cada prompt.
+
+        As palavras em comum de todos os prompts saem de um único bincount;
+        útil para repontuar o histórico offline.
+        """
+        if modo not in MODOS:
+            raise ValueError(f"Modo desconhecido: {modo}")
+        n = len(self)
+        preparadas = [_preparar(p) for p in perguntas]
+        if not n or not preparadas:
+            return np.zeros((len(preparadas), n))
+
+        partes = []
+        for i, (_, tokens) in enumerate(preparadas):
+            linhas = self._linhas_dos_tokens(tokens)
+            partes.append(linhas.astype(np.int64) + i * n)
+        comuns = np.bincount(np.concatenate(partes), minlength=len(preparadas) * n)
+        comuns = comuns.reshape(len(preparadas), n)
+
+        return np.vstack([
+            self._combinar(comuns[i], len(tokens), texto, modo)
+            for i, (texto, tokens) in enumerate(preparadas)
+        ])
+
+    def melhor(self, pergunta, limiar=0.7, modo="compat", linhas=None):
+        """(id, pontuacao) da melhor pergunta acima do limiar, ou None.
+
+        Em empate fica o menor ID, como na varredura antiga do Firebase.
+        """
+        pontuacao = self.pontuar(pergunta, modo, linhas)
+        if not pontuacao.size:
+            return None
+        posicao = int(np.argmax(pontuacao))
+        if pontuacao[posicao] <= limiar:
+            return None
+        linha = posicao if linhas is None else int(np.asarray(linhas)[posicao])
+        return self.ids[linha], float(pontuacao[posicao])
@@ -0,0 +1,116 @@
+"""Normalização de perguntas em português para o atalho por impressão digital.
+
+"Qual é o limite do cartão?" e "qual o limite  do cartao" viram os mesmos
+tokens (sem acento, sem stopwords, com um radical leve) e portanto a mesma
+impressão digital. A forma normalizada é gravada com a correção, então na
+consulta basta um lookup no dicionário de impressões.
+"""
+import hashlib
+import re
+import unicodedata
+
+from minhash_lsh import assinatura_minhash
+
+# Sem acento, porque a comparação é feita depois de remover os acentos.
+# Só palavras funcionais (artigos, preposições, conjunções, pronomes
+# oblíquos) e cumprimentos. Interrogativos, "nao", pronomes pessoais e
+# possessivos ("meu" x "seu"), verbos e intensificadores ("mais",
+# "muito", "ja", "tem") ficam de fora: mudam o sentido da pergunta.
+STOPWORDS = frozenset("""
+a o as os um uma uns umas ao aos de do da dos das dum duma em no na nos nas num numa
+por pelo pela pelos pelas para pra pro com e eh ou que se me te lhe lhes
+favor ola oi
+""".split())
+
+# Sobe quando STOPWORDS ou o radical mudam: campos gravados com outra versão
+# são recalculados na carga do índice
+VERSAO = 2
+
+_NAO_ALFANUMERICO = re.compile(r"[^0-9a-z]+")
+
+# Regras de plural/sufixo na ordem em que são testadas (estilo RSLP, bem leve)
+_SUFIXOS = (
+    ("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"), ("ois", "ol"),
+    ("ns", "m"), ("res", "r"), ("zes", "z"), ("mente", ""),
+)
+
+
+def remover_acentos(texto):
+    decomposto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def radical(palavra):
+    """Radical leve: tira plural e o sufixo -mente, sem mexer em palavras curtas"""
+    if len(palavra) <= 3:
+        return palavra
+    for sufixo, troca in _SUFIXOS:
+        if palavra.endswith(sufixo) and len(palavra) - len(sufixo) >= 3:
+            return palavra[:-len(sufixo)] + troca
+    if palavra.endswith("s") and not palavra.endswith(("ss", "us", "is")):
+        return palavra[:-1]
+    return palavra
+
+
+def tokens_normalizados(texto):
+    """Tokens sem acento, sem pontuação, sem stopwords e reduzidos ao radical"""
+    texto = _NAO_ALFANUMERICO.sub(" ", remover_acentos(texto.lower()))
+    return [radical(t) for t in texto.split() if t not in STOPWORDS]
+
+
+def impressao_digital(tokens):
+    """Hash do conjunto de tokens (ordem e repetição não importam)"""
+    if not tokens:
+        return None
+    return hashlib.sha1(" ".join(sorted(set(tokens))).encode("utf-8")).hexdigest()
+
+
+def campos_normalizados(pergunta):
+    """Campos gravados junto com a correção em salvar_resposta_revisada"""
+    tokens = tokens_normalizados(pergunta)
+    return {
+        "pergunta_normalizada": " ".join(tokens),
+        "impressao_digital": impressao_digital(tokens),
+        "normalizacao_versao": VERSAO,
+    }
+
+
+def campos_gravados(dados):
+    """(tokens, impressão) de uma correção: os gravados, se são da versão
+    atual da normalização, senão recalculados a partir da pergunta"""
+    if dados.get("normalizacao_versao") == VERSAO and "pergunta_normalizada" in dados:
+        tokens = dados["pergunta_normalizada"].split()
+        return tokens, dados.get("impressao_digital") or impressao_digital(tokens)
+    tokens = tokens_normalizados(dados.get("pergunta", ""))
+    return tokens, impressao_digital(tokens)
+
+
+class ConsultaNormalizada:
+    """Prompt preparado uma única vez e reaproveitado por todas as buscas.
+
+    O atalho por impressão digital e a comparação de quase duplicatas usam
+    os tokens normalizados; a busca fuzzy (compatível com
+    calcular_similaridade) e o LSH usam o texto em minúsculas, o conjunto de
+    palavras e a assinatura MinHash, todos calculados aqui uma vez só.
+    """
+
+    def __init__(self, pergunta):
+        self.pergunta = pergunta
+        self.texto = pergunta.lower().strip()
+        self.palavras = set(self.texto.split())
+        self.tokens = tokens_normalizados(pergunta)
+        self.texto_normalizado = " ".join(self.tokens)
+        self.impressao = impressao_digital(self.tokens)
+        self._assinatura = None
+
+    @property
+    def assinatura(self):
+        if self._assinatura is None:
+            self._assinatura = assinatura_minhash(self.texto)
+        return self._assinatura
+
+
+def normalizar_consulta(pergunta):
+    if isinstance(pergunta, ConsultaNormalizada):
+        return pergunta
+    return ConsultaNormalizada(pergunta)
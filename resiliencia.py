@@ -0,0 +1,138 @@
+"""Retentativas e disjuntores (circuit breakers) para as chamadas aos modelos.
+
+- Erros transitórios (429, 5xx, queda de conexão) antes do primeiro token
+  são repetidos com backoff exponencial com jitter total, respeitando o
+  Retry-After quando o servidor manda.
+- Cada modelo tem um disjuntor. Depois de `limite_falhas` falhas
+  transitórias seguidas ele abre e o modelo é pulado (falha rápida, sem
+  chamada) por `tempo_aberto` segundos, que dobra a cada reabertura. Passado
+  esse tempo ele fica meio-aberto: deixa passar `sondas` chamadas de teste;
+  se uma dá certo fecha, se falha abre de novo.
+"""
+import random
+import threading
+import time
+
+import requests
+
+from cliente_llm import ErroOpenRouter, StreamInterrompido
+
+FECHADO = "fechado"
+ABERTO = "aberto"
+MEIO_ABERTO = "meio_aberto"
+
+
+class CircuitoAberto(Exception):
+    """Nenhum modelo da cadeia está aceitando chamadas no momento"""
+
+
+def erro_transitorio(erro):
+    """Vale tentar de novo (ou contar contra o disjuntor)?"""
+    if isinstance(erro, ErroOpenRouter):
+        try:
+            status = int(erro.status)
+        except (TypeError, ValueError):
+            return False
+        return status == 429 or 500 <= status < 600
+    return isinstance(erro, (requests.ConnectionError, requests.Timeout, StreamInterrompido))
+
+
+def espera_retentativa(tentativa, retry_after=None, base=0.5, teto=8.0):
+    """Segundos até a próxima tentativa: jitter total sobre base * 2^tentativa"""
+    espera = random.uniform(0, min(teto, base * 2 ** tentativa))
+    if retry_after is not None:
+        espera = max(espera, retry_after)
+    return espera
+
+
+class Disjuntores:
+    def __init__(self, limite_falhas=5, tempo_aberto=30.0, tempo_aberto_maximo=300.0, sondas=1,
+                 prazo_sonda=60.0):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self.tempo_aberto_maximo = tempo_aberto_maximo
+        self.sondas = sondas
+        self.prazo_sonda = prazo_sonda
+        self._lock = threading.Lock()
+        self._modelos = {}
+
+    def _modelo(self, modelo):
+        dados = self._modelos.get(modelo)
+        if dados is None:
+            dados = self._modelos[modelo] = {
+                "estado": FECHADO,
+                "falhas": 0,
+                "aberto_ate": 0.0,
+                "proxima_abertura": self.tempo_aberto,
+                "sondas_em_andamento": [],
+                "aberturas": 0,
+                "rejeitadas": 0,
+            }
+        return dados
+
+    def permitir(self, modelo):
+        """Reserva a chamada; False se o disjuntor do modelo está aberto.
+
+        Toda chamada permitida termina com registrar_sucesso,
+        registrar_falha ou liberar (cancelada sem resultado).
+        """
+        agora = time.monotonic()
+        with self._lock:
+            dados = self._modelo(modelo)
+            if dados["estado"] == ABERTO:
+                if agora < dados["aberto_ate"]:
+                    dados["rejeitadas"] += 1
+                    return False
+                dados["estado"] = MEIO_ABERTO
+                dados["sondas_em_andamento"] = []
+            if dados["estado"] == MEIO_ABERTO:
+                # Sonda que sumiu sem resultado não segura o disjuntor para sempre
+                sondas = [inicio for inicio in dados["sondas_em_andamento"] if agora - inicio < self.prazo_sonda]
+                if len(sondas) >= self.sondas:
+                    dados["sondas_em_andamento"] = sondas
+                    dados["rejeitadas"] += 1
+                    return False
+                sondas.append(agora)
+                dados["sondas_em_andamento"] = sondas
+            return True
+
+    def registrar_sucesso(self, modelo):
+        with self._lock:
+            dados = self._modelo(modelo)
+            dados["estado"] = FECHADO
+            dados["falhas"] = 0
+            dados["proxima_abertura"] = self.tempo_aberto
+            dados["sondas_em_andamento"] = []
+
+    def registrar_falha(self, modelo, retry_after=None):
+        with self._lock:
+            dados = self._modelo(modelo)
+            dados["falhas"] += 1
+            if dados["estado"] == MEIO_ABERTO or dados["falhas"] >= self.limite_falhas:
+                tempo = max(dados["proxima_abertura"], retry_after or 0)
+                dados["estado"] = ABERTO
+                dados["aberto_ate"] = time.monotonic() + tempo
+                dados["proxima_abertura"] = min(dados["proxima_abertura"] * 2, self.tempo_aberto_maximo)
+                dados["sondas_em_andamento"] = []
+                dados["aberturas"] += 1
+
+    def liberar(self, modelo):
+        """Chamada cancelada antes de ter resultado: devolve a vaga de sonda"""
+        with self._lock:
+            dados = self._modelo(modelo)
+            if dados["sondas_em_andamento"]:
+                dados["sondas_em_andamento"].pop(0)
+
+    def estado(self):
+        agora = time.monotonic()
+        with self._lock:
+            return {
+                modelo: {
+                    "estado": dados["estado"],
+                    "falhas_seguidas": dados["falhas"],
+                    "reabre_em_s": round(max(dados["aberto_ate"] - agora, 0), 1) if dados["estado"] == ABERTO else 0,
+                    "aberturas": dados["aberturas"],
+                    "rejeitadas": dados["rejeitadas"],
+                }
+                for modelo, dados in self._modelos.items()
+            }
@@ -0,0 +1,55 @@
+"""Resumo incremental das conversas longas.
+
+As últimas TURNOS_RECENTES mensagens vão sempre cruas para o prompt. As
+anteriores são condensadas num resumo guardado junto com o chat
+(logs/usuarios/{user}/chats/{chat}/resumo = {texto, ate_indice}), onde
+ate_indice é até que mensagem o resumo cobre. A cada atualização só entram
+as mensagens novas desde ate_indice, junto com o resumo anterior; nada é
+resumido de novo do zero.
+"""
+from datetime import datetime
+
+TURNOS_RECENTES = 8
+# Só vale uma chamada à IA quando há pelo menos esse tanto de mensagens novas para resumir
+LOTE_MINIMO = 6
+PALAVRAS_RESUMO = 200
+
+INSTRUCAO_RESUMO = (
+    "Você mantém o resumo de uma conversa entre um usuário e o SantChat, assistente do Santander. "
+    "Atualize o resumo anterior com as novas mensagens, em português, em no máximo "
+    f"{PALAVRAS_RESUMO} palavras. Guarde fatos, pedidos e decisões que o usuário possa retomar "
+    "(produtos, valores, datas, nomes); descarte saudações e repetições. Responda só com o resumo."
+)
+
+
+def trecho_para_resumir(historico, resumo=None):
+    """(inicio, fim) das mensagens que ainda faltam no resumo, ou None se ainda não vale resumir"""
+    inicio = (resumo or {}).get("ate_indice", 0)
+    fim = len(historico) - TURNOS_RECENTES
+    if fim - inicio < LOTE_MINIMO:
+        return None
+    return inicio, fim
+
+
+def mensagens_resumo(resumo_anterior, mensagens):
+    """Mensagens para a IA atualizar o resumo com as mensagens novas"""
+    linhas = []
+    for msg in mensagens:
+        autor = "Usuário" if msg.get("sender") == "user" else "SantChat"
+        linhas.append(f"{autor}: {msg.get('text', '')}")
+    conteudo = (
+        f"Resumo anterior:\n{resumo_anterior or '(vazio)'}\n\n"
+        "Novas mensagens:\n" + "\n".join(linhas)
+    )
+    return [
+        {"role": "system", "content": INSTRUCAO_RESUMO},
+        {"role": "user", "content": conteudo},
+    ]
+
+
+def novo_resumo(texto, ate_indice):
+    return {
+        "texto": texto.strip(),
+        "ate_indice": ate_indice,
+        "atualizado_em": datetime.now().isoformat(),
+    }
@@ -0,0 +1,135 @@
+"""Escolha do modelo por pedido, de acordo com a complexidade e a latência.
+
+Cada modelo do catálogo tem um nível de qualidade (1 = rápido/básico,
+2 = intermediário, 3 = raciocínio). O pedido é classificado por uma
+heurística barata em "simples", "padrao" ou "complexo", que exige
+qualidade mínima 1, 2 ou 3. Entre os modelos que atendem, a cadeia sai
+ordenada pelo custo esperado, calculado com as médias móveis de
+metricas_modelos:
+
+    (TTFT + caracteres esperados / vazão) / (1 - taxa de erro)
+
+A cadeia resultante vai para o hedge (geracao_hedge): o primeiro é o
+mais rápido, o segundo entra se ele demorar ou falhar.
+"""
+import random
+
+from normalizacao import tokens_normalizados
+
+CATALOGO_PADRAO = {
+    "deepseek/deepseek-r1-0528:free": 3,
+    "deepseek/deepseek-chat-v3-0324:free": 2,
+    "meta-llama/llama-3.3-70b-instruct:free": 2,
+    "mistralai/mistral-small-3.2-24b-instruct:free": 1,
+}
+
+NIVEIS = {"simples": 1, "padrao": 2, "complexo": 3}
+
+# Tamanho típico da resposta em cada nível, para estimar o tempo de geração
+CARACTERES_ESPERADOS = {"simples": 200, "padrao": 800, "complexo": 2000}
+
+# Enquanto não há amostras de um modelo: modelos de raciocínio demoram mais
+# para o primeiro token
+LATENCIA_INICIAL_MS = {1: 1500, 2: 3000, 3: 10000}
+
+SAUDACOES = frozenset(tokens_normalizados(
+    "oi ola bom boa dia tarde noite obrigado obrigada valeu tchau ok blz beleza tudo bem "
+    "td certo entendi show legal"
+))
+
+TERMOS_COMPLEXOS = frozenset(tokens_normalizados(
+    "compare comparar comparação diferença diferenças calcule calcular cálculo simule simular "
+    "simulação explique explicar analise analisar análise vantagens desvantagens planejar "
+    "planejamento estratégia estratégias porquê motivo detalhadamente passo"
+))
+
+
+def classificar(consulta, historico=None):
+    """Nível do pedido: "simples", "padrao" ou "complexo"
+
+    `consulta` é uma ConsultaNormalizada; `historico` são as mensagens da
+    conversa antes da pergunta.
+    """
+    tokens = set(consulta.tokens)
+    palavras = len(consulta.texto.split())
+    if not tokens or tokens <= SAUDACOES:
+        return "simples"
+
+    pontos = 0
+    if palavras > 40:
+        pontos += 2
+    elif palavras > 15:
+        pontos += 1
+    if tokens & TERMOS_COMPLEXOS:
+        pontos += 2
+    if sum(1 for t in consulta.tokens if t.isdigit()) >= 2:
+        pontos += 1
+    if consulta.texto.count("?") > 1:
+        pontos += 1
+    if sum(1 for msg in historico or [] if msg.get("sender") == "user") >= 3:
+        pontos += 1
+
+    if pontos >= 3:
+        return "complexo"
+    if pontos == 0 and palavras <= 8:
+        return "simples"
+    return "padrao"
+
+
+class RoteadorModelos:
+    def __init__(self, metricas, catalogo=None, tamanho_cadeia=2, vazao_inicial=60.0, exploracao=0.05):
+        self.metricas = metricas
+        self.catalogo = dict(catalogo or CATALOGO_PADRAO)
+        self.tamanho_cadeia = tamanho_cadeia
+        self.vazao_inicial = vazao_inicial
+        self.exploracao = exploracao
+
+    def custo(self, modelo, nivel):
+        """Tempo esperado (ms) até a resposta completa, já contando as falhas"""
+        ttft, _, erro, vazao = self.metricas.ewma(modelo)
+        if ttft is None:
+            ttft = LATENCIA_INICIAL_MS.get(self.catalogo.get(modelo), LATENCIA_INICIAL_MS[2])
+        vazao = vazao or self.vazao_inicial
+        esperado = ttft + CARACTERES_ESPERADOS[nivel] * 1000 / vazao
+        return esperado / max(1 - erro, 0.05)
+
+    def candidatos(self, nivel):
+        """Modelos com qualidade suficiente, do mais barato ao mais caro"""
+        minimo = NIVEIS[nivel]
+        elegiveis = [m for m, qualidade in self.catalogo.items() if qualidade >= minimo]
+        if not elegiveis:
+            # Nenhum modelo no nível pedido: usa os melhores que houver
+            melhor = max(self.catalogo.values())
+            elegiveis = [m for m, qualidade in self.catalogo.items() if qualidade == melhor]
+        return sorted(elegiveis, key=lambda m: (self.custo(m, nivel), self.catalogo[m], m))
+
+    def cadeia(self, nivel):
+        cadeia = self.candidatos(nivel)[:self.tamanho_cadeia]
+        elegiveis = len(cadeia)
+        # Poucos modelos no nível: o reserva é o melhor dos que sobraram,
+        # melhor uma resposta mais simples do que um erro
+        restantes = sorted(
+            (m for m in self.catalogo if m not in cadeia),
+            key=lambda m: (-self.catalogo[m], self.custo(m, nivel), m)
+        )
+        cadeia += restantes[:self.tamanho_cadeia - len(cadeia)]
+        # De vez em quando inverte os dois primeiros, para as médias do
+        # segundo colocado não ficarem congeladas
+        if elegiveis > 1 and random.random() < self.exploracao:
+            cadeia[0], cadeia[1] = cadeia[1], cadeia[0]
+        return cadeia
+
+    def rotear(self, consulta, historico=None):
+        """(nível, cadeia de modelos) para o pedido"""
+        nivel = classificar(consulta, historico)
+        return nivel, self.cadeia(nivel)
+
+    def tabela(self):
+        """Para cada nível, os modelos elegíveis com qualidade e custo esperado"""
+        return {
+            nivel: [
+                {"modelo": modelo, "qualidade": self.catalogo[modelo], "custo_ms": round(self.custo(modelo, nivel))}
+                for modelo in self.candidatos(nivel)
+            ]
+            for nivel in NIVEIS
+        }
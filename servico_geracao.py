@@ -0,0 +1,223 @@
+"""Serviço de geração compartilhado por todas as sessões do Streamlit.
+
+Roda um event loop asyncio numa thread própria. Cada pedido de geração vira
+uma tarefa nesse loop, que:
+
+- limita quantas chamadas à OpenRouter ficam abertas ao mesmo tempo
+  (asyncio.Semaphore; o resto espera na fila);
+- junta pedidos idênticos em andamento (mesma pergunta, mesma versão da
+  memória, mesmo modelo e mesmo prompt montado) numa única chamada, cujos
+  pedaços são repassados para todas as sessões que pediram.
+
+A chamada em si é a de geracao_hedge (cliente_llm com o pool compartilhado
+e hedge entre os modelos da cadeia). O loop a coordena num ThreadPoolExecutor
+(um pedido por vez por vaga do semáforo) e as chamadas HTTP de cada modelo,
+hedges incluídos, rodam num segundo executor com o limite de chamadas
+abertas. São dois porque um coordenador fica esperando as chamadas dele:
+no mesmo executor, os coordenadores poderiam ocupar todas as threads. As
+sessões não fazem mais a chamada HTTP na thread do script: recebem um
+Future (completar) ou um gerador que lê o fluxo compartilhado (transmitir).
+"""
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import cliente_llm
+from geracao_hedge import transmitir_com_hedge
+from metricas_modelos import MetricasModelos
+from resiliencia import Disjuntores
+from normalizacao import normalizar_consulta
+
+
+def versao_memoria(memoria):
+    """Hash curto do conteúdo da memória global: muda sempre que ela muda"""
+    conteudo = json.dumps(memoria or [], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(conteudo.encode("utf-8")).hexdigest()[:12]
+
+
+def _cadeia(modelos):
+    return (modelos,) if isinstance(modelos, str) else tuple(modelos)
+
+
+def chave_requisicao(pergunta, memoria, modelos=cliente_llm.MODELO_PADRAO, contexto=None):
+    """Chave de coalescência: pedidos com a mesma chave dividem a chamada.
+
+    A pergunta entra como foi digitada (só em minúsculas e sem espaços nas
+    pontas): "meu saldo" e "seu saldo" são pedidos diferentes. `contexto` é
+    qualquer coisa serializável em JSON que também muda a resposta; para
+    juntar chamadas, passe as mensagens exatas enviadas à API.
+    """
+    consulta = normalizar_consulta(pergunta)
+    extra = ""
+    if contexto:
+        extra = hashlib.sha1(json.dumps(contexto, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    return (consulta.texto, versao_memoria(memoria), "|".join(_cadeia(modelos)), extra)
+
+
+class FluxoCompartilhado:
+    """Pedaços de uma geração, lidos por uma ou mais sessões.
+
+    Quem entra depois recebe tudo desde o primeiro pedaço. A geração é
+    cancelada quando a última sessão que estava lendo desiste.
+    """
+
+    def __init__(self):
+        self._condicao = threading.Condition()
+        self._assinantes = 0
+        self.partes = []
+        self.terminado = False
+        self.erro = None
+        self.cancelar = threading.Event()
+        self.resultado = Future()
+
+    def assinar(self):
+        """Registra mais um leitor; False se a geração já foi cancelada"""
+        with self._condicao:
+            if self.cancelar.is_set():
+                return False
+            self._assinantes += 1
+            return True
+
+    def desassinar(self):
+        with self._condicao:
+            self._assinantes -= 1
+            if self._assinantes <= 0 and not self.terminado:
+                self.cancelar.set()
+
+    def publicar(self, pedaco):
+        with self._condicao:
+            self.partes.append(pedaco)
+            self._condicao.notify_all()
+
+    def encerrar(self, erro=None):
+        with self._condicao:
+            self.terminado = True
+            self.erro = erro
+            self._condicao.notify_all()
+        if erro is not None:
+            self.resultado.set_exception(erro)
+        else:
+            self.resultado.set_result("".join(self.partes))
+
+    def ler(self, cancelar=None, espera=None):
+        """Gerador com os pedaços; repassa o erro da geração, se houver.
+
+        `cancelar` (threading.Event) é o do leitor: acionado, só ele para de
+        ler. Com `espera`, passar esse tempo sem pedaço novo devolve um
+        pedaço vazio, para quem lê poder reagir (ex.: ao botão "Parar").
+        """
+        lidos = 0
+        try:
+            while True:
+                with self._condicao:
+                    while lidos >= len(self.partes) and not self.terminado:
+                        if cancelar is not None and cancelar.is_set():
+                            return
+                        if not self._condicao.wait(espera) and espera is not None:
+                            break
+                    novos = self.partes[lidos:]
+                    lidos += len(novos)
+                    terminado, erro = self.terminado, self.erro
+                if not novos and not terminado:
+                    yield ""
+                    continue
+                yield from novos
+                if terminado:
+                    if erro is not None:
+                        raise erro
+                    return
+        finally:
+            self.desassinar()
+
+
+class ServicoGeracao:
+    def __init__(self, max_concorrentes=4, metricas=None, disjuntores=None, max_chamadas=None):
+        self._max_concorrentes = max_concorrentes
+        self.metricas_modelos = metricas or MetricasModelos()
+        self.disjuntores = disjuntores or Disjuntores()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="servico-geracao", daemon=True)
+        self._thread.start()
+        self._executor = ThreadPoolExecutor(max_concorrentes, thread_name_prefix="openrouter")
+        # Por padrão, cada pedido em andamento pode ter um hedge aberto além da chamada principal
+        self._executor_chamadas = ThreadPoolExecutor(max_chamadas or 2 * max_concorrentes,
+                                                     thread_name_prefix="openrouter-chamada")
+        self._semaforo = self._no_loop(self._criar_semaforo())
+        # Só é acessado de dentro do loop, então não precisa de lock
+        self._em_voo = {}
+        self.estatisticas = {"pedidos": 0, "coalescidos": 0, "chamadas": 0, "em_andamento": 0, "na_fila": 0}
+
+    def _no_loop(self, corrotina, timeout=5):
+        return asyncio.run_coroutine_threadsafe(corrotina, self._loop).result(timeout)
+
+    async def _criar_semaforo(self):
+        return asyncio.Semaphore(self._max_concorrentes)
+
+    async def _abrir(self, chave, chave_api, mensagens, modelos):
+        self.estatisticas["pedidos"] += 1
+        fluxo = self._em_voo.get(chave)
+        if fluxo is not None and fluxo.assinar():
+            self.estatisticas["coalescidos"] += 1
+            return fluxo
+
+        fluxo = FluxoCompartilhado()
+        fluxo.assinar()
+        self._em_voo[chave] = fluxo
+        self._loop.create_task(self._executar(chave, fluxo, chave_api, mensagens, modelos))
+        return fluxo
+
+    async def _executar(self, chave, fluxo, chave_api, mensagens, modelos):
+        self.estatisticas["na_fila"] += 1
+        try:
+            async with self._semaforo:
+                self.estatisticas["na_fila"] -= 1
+                self.estatisticas["em_andamento"] += 1
+                if not fluxo.cancelar.is_set():
+                    self.estatisticas["chamadas"] += 1
+                try:
+                    await self._loop.run_in_executor(
+                        self._executor, self._produzir, fluxo, chave_api, mensagens, modelos)
+                finally:
+                    self.estatisticas["em_andamento"] -= 1
+        finally:
+            if self._em_voo.get(chave) is fluxo:
+                del self._em_voo[chave]
+
+    def _produzir(self, fluxo, chave_api, mensagens, modelos):
+        # Todos desistiram enquanto o pedido esperava na fila
+        if fluxo.cancelar.is_set():
+            fluxo.encerrar()
+            return
+        try:
+            for pedaco in transmitir_com_hedge(chave_api, mensagens, _cadeia(modelos), self.metricas_modelos,
+                                               self.disjuntores, self._executor_chamadas,
+                                               cancelar=fluxo.cancelar):
+                fluxo.publicar(pedaco)
+        except Exception as e:
+            fluxo.encerrar(e)
+        else:
+            fluxo.encerrar()
+
+    def completar(self, chave, chave_api, mensagens, modelos=cliente_llm.MODELO_PADRAO):
+        """Future com o texto inteiro da resposta (ou a exceção da chamada)"""
+        fluxo = self._no_loop(self._abrir(chave, chave_api, mensagens, modelos))
+        fluxo.resultado.add_done_callback(lambda _: fluxo.desassinar())
+        return fluxo.resultado
+
+    def transmitir(self, chave, chave_api, mensagens, modelos=cliente_llm.MODELO_PADRAO, cancelar=None, espera=None):
+        """Gerador com os pedaços da resposta, como cliente_llm.transmitir.
+
+        `modelos` é um modelo ou uma cadeia deles (ver geracao_hedge).
+        Fechar o gerador ou acionar `cancelar` deixa de ler; a chamada só é
+        cancelada quando nenhuma outra sessão está lendo o mesmo fluxo. Com
+        `espera`, pedaços vazios marcam o tempo sem novidade (ver ler()).
+        """
+        fluxo = self._no_loop(self._abrir(chave, chave_api, mensagens, modelos))
+        yield from fluxo.ler(cancelar, espera)
+
+    def encerrar(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor_chamadas.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,36 @@
+from difflib import SequenceMatcher
+
+
+def similaridade_pergunta(pergunta1, pergunta2):
+    """Calcula similaridade entre perguntas usando SequenceMatcher"""
+    # Normaliza as perguntas
+    p1 = pergunta1.lower().strip()
+    p2 = pergunta2.lower().strip()
+    
+    # Usa SequenceMatcher para uma comparação mais inteligente
+    return SequenceMatcher(None, p1, p2).ratio()
+
+
+def calcular_similaridade(pergunta1, pergunta2):
+    """Calcula similaridade entre perguntas com lógica mais sofisticada"""
+    # Normaliza as perguntas
+    p1 = pergunta1.lower().strip()
+    p2 = pergunta2.lower().strip()
+    
+    # Caso sejam idênticas
+    if p1 == p2:
+        return 1.0
+    
+    # Verifica se uma contém a outra
+    if p1 in p2 or p2 in p1:
+        return 0.9
+    
+    # Lógica por palavras-chave
+    palavras_p1 = set(p1.split())
+    palavras_p2 = set(p2.split())
+    
+    # Calcula interseção
+    palavras_comuns = palavras_p1.intersection(palavras_p2)
+    total_palavras = max(len(palavras_p1), len(palavras_p2))
+    
+    return len(palavras_comuns) / total_palavras
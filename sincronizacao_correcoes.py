@@ -0,0 +1,100 @@
+import copy
+import threading
+
+
+def _segmentos(caminho):
+    return [s for s in caminho.split("/") if s]
+
+
+def _definir(dados, segmentos, valor):
+    """Devolve uma cópia de dados com valor gravado em segmentos (None apaga)"""
+    dados = dict(dados) if isinstance(dados, dict) else {}
+    chave = segmentos[0]
+    if len(segmentos) == 1:
+        if valor is None:
+            dados.pop(chave, None)
+        else:
+            dados[chave] = copy.deepcopy(valor)
+    else:
+        filho = _definir(dados.get(chave), segmentos[1:], valor)
+        if filho:
+            dados[chave] = filho
+        else:
+            dados.pop(chave, None)
+    return dados
+
+
+class SincronizadorCorrecoes:
+    """Mantém um IndiceCorrecoes em dia ouvindo respostas_revisadas/todas_correcoes.
+
+    Usa o listen() do Realtime Database: o primeiro evento traz o nó inteiro
+    e os seguintes (put/patch) são aplicados um a um no índice, sem recarregar
+    nada. Funciona com qualquer referência que tenha listen(), inclusive a do
+    firebase_fake.
+    """
+
+    def __init__(self, referencia, indice):
+        self._referencia = referencia
+        self._indice = indice
+        self._registro = None
+        self._carregado = threading.Event()
+        self.eventos_aplicados = 0
+
+    def iniciar(self, timeout=None):
+        """Começa a ouvir; com timeout, espera a carga inicial. Retorna se carregou"""
+        if self._registro is None:
+            self._registro = self._referencia.listen(self._ao_evento)
+        if timeout is not None:
+            return self._carregado.wait(timeout)
+        return self._carregado.is_set()
+
+    def parar(self):
+        if self._registro is not None:
+            self._registro.close()
+            self._registro = None
+
+    @property
+    def carregado(self):
+        return self._carregado.is_set()
+
+    def _ao_evento(self, evento):
+        segmentos = _segmentos(evento.path)
+        if evento.event_type == "put":
+            self._aplicar(segmentos, evento.data)
+        elif evento.event_type == "patch":
+            for chave, valor in (evento.data or {}).items():
+                self._aplicar(segmentos + _segmentos(chave), valor)
+        else:
+            return
+        self.eventos_aplicados += 1
+
+    def _aplicar(self, segmentos, valor):
+        if not segmentos:
+            # Nó inteiro (carga inicial ou reconexão)
+            self._indice.carregar(valor if isinstance(valor, dict) else {})
+            self._carregado.set()
+            return
+
+        correcao_id = segmentos[0]
+        if len(segmentos) == 1:
+            if valor is None:
+                self._indice.remover(correcao_id)
+            else:
+                self._indice.inserir(correcao_id, valor)
+            return
+
+        # Campo de uma correção (ex.: status, uso_count)
+        atual = self._indice.obter(correcao_id)
+        if atual is None:
+            # Correção que o índice não conhece: só o campo viraria uma
+            # correção incompleta, então lê o nó inteiro (e ignora restos,
+            # como um contador gravado numa correção já excluída)
+            dados = self._referencia.child(correcao_id).get()
+            if isinstance(dados, dict) and "pergunta" in dados:
+                self._indice.inserir(correcao_id, dados)
+            return
+        dados = _definir(atual, segmentos[1:], valor)
+        if dados:
+            self._indice.inserir(correcao_id, dados)
+        else:
+            self._indice.remover(correcao_id)
@@ -0,0 +1,69 @@
+import random
+from difflib import SequenceMatcher
+
+from indice_correcoes import IndiceCorrecoes
+from minhash_lsh import IndiceLSH, assinatura_minhash
+
+TEMAS = ["limite do cartão de crédito", "saldo da conta corrente", "taxa do pix", "fatura do cartão",
+         "empréstimo consignado", "senha do aplicativo", "investimento em CDB", "tarifa da conta",
+         "boleto vencido", "transferência TED", "seguro de vida", "conta poupança", "cheque especial"]
+ABERTURAS = ["como faço para", "qual é o", "quero saber sobre o", "preciso de ajuda com o", "onde vejo o",
+             "posso alterar o", "por que mudou o", "quanto custa o"]
+FINAIS = ["hoje", "agora", "pelo app", "no internet banking", "urgente", "por favor", "", ""]
+
+
+def _pergunta(gerador):
+    return f"{gerador.choice(ABERTURAS)} {gerador.choice(TEMAS)} {gerador.choice(FINAIS)}".strip()
+
+
+def _com_erros(gerador, texto):
+    letras = list(texto)
+    for _ in range(gerador.randint(0, 4)):
+        posicao = gerador.randrange(len(letras))
+        sorteio = gerador.random()
+        if sorteio < 0.4:
+            del letras[posicao]
+        elif sorteio < 0.7:
+            letras.insert(posicao, gerador.choice("aeiouxs "))
+        else:
+            letras[posicao] = gerador.choice("abcdefghijklmnopqrstuvwxyz")
+    return "".join(letras)
+
+
+def _corpus(gerador, tamanho):
+    return {f"c{i}": f"{_pergunta(gerador)} {i % 37}" for i in range(tamanho)}
+
+
+def test_recall_igual_ao_sequence_matcher():
+    gerador = random.Random(7)
+    corpus = _corpus(gerador, 400)
+    indice = IndiceCorrecoes()
+    indice.carregar({correcao_id: {"pergunta": pergunta, "status": "ativo"} for correcao_id, pergunta in corpus.items()})
+    consultas = [_com_erros(gerador, gerador.choice(list(corpus.values()))) for _ in range(60)]
+    consultas += [_pergunta(gerador) for _ in range(20)]
+
+    esperadas = encontradas = 0
+    for consulta in consultas:
+        texto = consulta.lower().strip()
+        exata = max(SequenceMatcher(None, texto, pergunta.lower()).ratio() for pergunta in corpus.values())
+        if exata <= 0.7:
+            continue
+        esperadas += 1
+        resultado = indice.buscar_quase_duplicata(consulta, limiar=0.7)
+        if resultado is not None and resultado[2] >= exata - 1e-9:
+            encontradas += 1
+
+    assert esperadas >= 40
+    assert encontradas / esperadas >= 0.97
+
+
+def test_poucas_candidatas():
+    gerador = random.Random(11)
+    corpus = _corpus(gerador, 400)
+    lsh = IndiceLSH()
+    for correcao_id, pergunta in corpus.items():
+        lsh.inserir(correcao_id, assinatura_minhash(pergunta))
+    consultas = [_pergunta(gerador) for _ in range(40)]
+    media = sum(len(lsh.candidatos(assinatura_minhash(c))) for c in consultas) / len(consultas)
+    # Bem longe de uma varredura completa
+    assert media / len(corpus) < 0.15
@@ -0,0 +1,99 @@
+import pytest
+
+from firebase_fake import BancoFake
+from indice_correcoes import IndiceCorrecoes
+from sincronizacao_correcoes import SincronizadorCorrecoes
+
+TODAS = "respostas_revisadas/todas_correcoes"
+
+
+def correcao(pergunta, status="ativo", **campos):
+    return {"pergunta": pergunta, "resposta_revisada": f"Resposta: {pergunta}", "categoria": "Geral",
+            "status": status, "uso_count": 0, **campos}
+
+
+@pytest.fixture
+def banco():
+    return BancoFake({"respostas_revisadas": {"todas_correcoes": {
+        "c1": correcao("qual o limite do cartão"),
+        "c2": correcao("como abrir uma conta", status="inativo"),
+    }}})
+
+
+@pytest.fixture
+def indice(banco):
+    indice = IndiceCorrecoes()
+    sincronizador = SincronizadorCorrecoes(banco.reference(TODAS), indice)
+    assert sincronizador.iniciar(timeout=1)
+    yield indice
+    sincronizador.parar()
+
+
+def test_carga_inicial(indice):
+    assert len(indice) == 2
+    assert indice.obter("c2")["status"] == "inativo"
+    assert indice.buscar("qual o limite do cartão")
+
+
+def test_put_insere_e_apaga(banco, indice):
+    banco.reference(f"{TODAS}/c3").set(correcao("como fazer um pix"))
+    assert indice.obter("c3")["pergunta"] == "como fazer um pix"
+    assert indice.buscar("como fazer um pix")
+
+    banco.reference(f"{TODAS}/c3").delete()
+    assert indice.obter("c3") is None
+    assert not indice.buscar("como fazer um pix")
+
+
+def test_put_de_campo(banco, indice):
+    banco.reference(f"{TODAS}/c1/status").set("inativo")
+    assert indice.obter("c1")["status"] == "inativo"
+    assert not indice.buscar("qual o limite do cartão")
+
+
+def test_patch_de_varios_campos(banco, indice):
+    banco.reference(TODAS).update({"c1/uso_count": {".sv": {"increment": 2}}, "c2/status": "ativo"})
+    assert indice.obter("c1")["uso_count"] == 2
+    assert indice.obter("c2")["status"] == "ativo"
+    assert indice.buscar("como abrir uma conta")
+
+
+def test_patch_apaga_campo_e_correcao(banco, indice):
+    banco.reference(TODAS).update({"c1/uso_count": None, "c2": None})
+    assert "uso_count" not in indice.obter("c1")
+    assert indice.obter("c2") is None
+
+
+def test_update_acima_do_no_recarrega(banco, indice):
+    # update() em respostas_revisadas chega ao ouvinte como put do nó inteiro
+    banco.reference("respostas_revisadas").update({
+        "todas_correcoes/c1/status": "inativo",
+        "por_categoria/Geral/c1/status": "inativo",
+    })
+    assert indice.obter("c1")["status"] == "inativo"
+    assert indice.obter("c2") is not None
+
+
+def test_campo_de_correcao_desconhecida_le_o_no(banco, indice):
+    # O índice perdeu a correção: o patch de um campo não pode virar uma
+    # correção só com aquele campo
+    indice.remover("c1")
+    banco.reference(TODAS).update({"c1/uso_count": 1})
+    dados = indice.obter("c1")
+    assert dados["pergunta"] == "qual o limite do cartão"
+    assert dados["uso_count"] == 1
+    resultados, total, _ = indice.pesquisar("limite")
+    assert total == 1 and resultados[0][0] == "c1"
+
+
+def test_campo_de_correcao_excluida_e_ignorado(banco, indice):
+    banco.reference(TODAS).update({"c9/uso_count": {".sv": {"increment": 1}}})
+    assert indice.obter("c9") is None
+    assert indice.pesquisar("")[1] == 2
+
+
+def test_pesquisa_por_trecho(indice):
+    # Meio de palavra e busca só com palavras funcionais caem na busca por trecho
+    assert [r[0] for r in indice.pesquisar("artão")[0]] == ["c1"]
+    assert indice.pesquisar("uma")[1] == 1
+    assert indice.pesquisar("xyz")[:2] == ([], 0)